@@ -104,8 +104,11 @@ Libertine(int& argc, char** argv)
 
   config_.reset(new LibertineConfig());
 
+  // Writers replace the file, so its directory is watched for the new one
+  watcher_.addPath(QFileInfo(config_.data()->containers_config_file_name()).absolutePath());
   watcher_.addPath(config_.data()->containers_config_file_name());
   connect(&watcher_, SIGNAL(fileChanged(QString)), SLOT(reload_config(QString)));
+  connect(&watcher_, SIGNAL(directoryChanged(QString)), SLOT(reload_config(QString)));
 
   if (main_qml_source_file_.isEmpty())
   {
@@ -154,7 +157,17 @@ initialize_view()
 void Libertine::
 reload_config(const QString& path)
 {
-  Q_UNUSED(path)
+  auto config_file = config_.data()->containers_config_file_name();
 
-  containers_->reloadConfigs();
+  // A replaced file is no longer watched
+  bool replaced = !watcher_.files().contains(config_file) && QFileInfo::exists(config_file);
+  if (replaced)
+  {
+    watcher_.addPath(config_file);
+  }
+
+  if (replaced || path == config_file)
+  {
+    containers_->reloadConfigs();
+  }
 }
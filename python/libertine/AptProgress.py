@@ -0,0 +1,138 @@
+# Copyright 2017 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import contextlib
+import fcntl
+import os
+import threading
+import time
+
+from . import utils
+
+
+# Seconds between two progress reports of the same stage
+_REPORT_INTERVAL = 0.5
+
+# Status lines apt writes to APT::Status-Fd which are reported, with the
+# share of the overall progress their stage covers
+_STAGES = {'dlstatus': (0, 50), 'pmstatus': (50, 100), 'pmerror': (50, 100)}
+
+
+def parse_status_line(line):
+    """
+    Parses a line apt wrote to its status file descriptor, e.g.
+    'pmstatus:vim:42.8571:Unpacking vim (amd64)'.  Returns a tuple of the
+    status, the percentage and the message, or None for anything else.
+    """
+    fields = line.rstrip('\n').split(':', 3)
+    if len(fields) != 4 or fields[0] not in _STAGES:
+        return None
+
+    try:
+        percent = float(fields[2])
+    except ValueError:
+        if fields[0] != 'pmerror':
+            return None
+        percent = 0.0
+
+    return fields[0], percent, fields[3]
+
+
+def overall_percent(status, percent):
+    """
+    Maps the percentage of a stage onto the whole apt run, in which
+    downloading takes the first and installing the second half, so that
+    progress does not start over between the stages.
+    """
+    start, end = _STAGES[status]
+    return start + (end - start) * min(max(percent, 0.0), 100.0) / 100
+
+
+class AptStatusPipe(object):
+    """
+    A named pipe which apt in the container writes its status lines to,
+    read on the host for the duration of the context.  The handler gets
+    called with each status, percentage and message, though a stage only
+    reports once per interval.  Stage changes, errors and the final status
+    of each stage are always reported.
+
+    :param host_path: Where to create the pipe on the host, which should be
+                      a directory only the host user can enter.
+    :param container_path: The same pipe as seen from within the container.
+    :param handler: Called from a thread of its own.
+    """
+    def __init__(self, host_path, container_path, handler, interval=_REPORT_INTERVAL):
+        self.host_path = host_path
+        self.container_path = container_path
+        self._handler = handler
+        self._interval = interval
+        self._thread = None
+        self._writer = None
+        self._last = None
+        self._last_time = 0
+        self._pending = None
+
+    def __enter__(self):
+        os.mkfifo(self.host_path, 0o600)
+
+        # Holding a write end ourselves means the reader neither blocks until
+        # apt opens the pipe nor stops when apt closes it, but only once the
+        # context is left.
+        reader = os.open(self.host_path, os.O_RDONLY | os.O_NONBLOCK)
+        self._writer = os.open(self.host_path, os.O_WRONLY)
+        fcntl.fcntl(reader, fcntl.F_SETFL, fcntl.fcntl(reader, fcntl.F_GETFL) & ~os.O_NONBLOCK)
+
+        self._thread = threading.Thread(target=self._read, args=(reader,))
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        os.close(self._writer)
+        self._thread.join()
+
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.host_path)
+
+    def _read(self, fd):
+        with open(fd, 'r', errors='replace') as pipe:
+            for line in pipe:
+                status = parse_status_line(line)
+                if status is not None:
+                    self._status(*status)
+
+        if self._pending is not None:
+            self._report(*self._pending)
+
+    def _status(self, status, percent, message):
+        now = time.monotonic()
+        stage_changed = self._last is None or self._last[0] != status
+
+        if stage_changed and self._pending is not None:
+            self._report(*self._pending)
+
+        if stage_changed or status == 'pmerror' or percent >= 100 or now - self._last_time >= self._interval:
+            self._report(status, percent, message)
+            self._last_time = now
+        else:
+            self._pending = (status, percent, message)
+
+        self._last = (status, percent, message)
+
+    def _report(self, status, percent, message):
+        self._pending = None
+
+        try:
+            self._handler(status, percent, message)
+        except Exception as e:
+            utils.get_logger().warning(utils._("Reporting apt progress failed: {error}").format(error=e))
@@ -42,6 +42,29 @@ def chown_recursive_dirs(path):
         os.chown(path, uid, gid)
 
 
+def _copy_rootfs(source, dest):
+    """
+    Copies a fakechroot root file system.  fakechroot stores absolute symlinks
+    with the host path of the root file system prepended, so those get moved
+    along to the copy.
+    """
+    if subprocess.call(['cp', '-a', '--reflink=auto', source, dest]) != 0:
+        return False
+
+    for root, dirs, files in os.walk(dest):
+        for name in dirs + files:
+            path = os.path.join(root, name)
+            if not os.path.islink(path):
+                continue
+
+            target = os.readlink(path)
+            if target == source or target.startswith(source + '/'):
+                os.remove(path)
+                os.symlink(dest + target[len(source):], path)
+
+    return True
+
+
 class LibertineChroot(BaseContainer):
     """
     A concrete container type implemented using a plain old chroot.
@@ -55,7 +78,7 @@ class LibertineChroot(BaseContainer):
         os.environ['FAKECHROOT_CMD_SUBST'] = '$FAKECHROOT_CMD_SUBST:/usr/bin/chfn=/bin/true'
         os.environ['DEBIAN_FRONTEND'] = 'noninteractive'
 
-    def run_in_container(self, command_string):
+    def _run_in_container(self, command_string):
         cmd_args = shlex.split(command_string)
         command_prefix = "{} fakeroot chroot {}".format(
                     self._build_fakechroot_command(), self.root_path)
@@ -63,6 +86,11 @@ class LibertineChroot(BaseContainer):
         cmd = subprocess.Popen(args)
         return cmd.wait()
 
+    def _start_agent_process(self, command_string):
+        command_prefix = "{} fakeroot chroot {}".format(
+                    self._build_fakechroot_command(), self.root_path)
+        return subprocess.Popen(shlex.split(command_prefix + ' ' + command_string), stdin=subprocess.PIPE)
+
     def destroy_libertine_container(self, force):
         return self._delete_rootfs()
 
@@ -121,9 +149,10 @@ class LibertineChroot(BaseContainer):
         utils.get_logger().info(utils._("Updating the contents of the container after creation..."))
         self.update_packages()
 
+        results = self.install_packages(self.default_packages, update_cache=False)
         for package in self.default_packages:
-            if not self.install_package(package, update_cache=False):
-                utils.get_logger().error(utils._("Failure installing '{package_name}' during container creation".format(package_name=package))
+            if not results[package]:
+                utils.get_logger().error(utils._("Failure installing '{package_name}' during container creation").format(package_name=package))
                 self.destroy_libertine_container()
                 return False
 
@@ -144,18 +173,86 @@ class LibertineChroot(BaseContainer):
 
         return True
 
+    def clone_libertine_container(self, source_id):
+        utils.get_logger().info(utils._("Copying container '{source_id}'...").format(source_id=source_id))
+        os.makedirs(os.path.dirname(self.root_path), exist_ok=True)
+
+        # cp shares the data with the source where the file system supports reflinks
+        if not _copy_rootfs(utils.get_libertine_container_rootfs_path(source_id), self.root_path):
+            utils.get_logger().error(utils._("Failed to copy container '{source_id}'").format(source_id=source_id))
+            self.destroy_libertine_container(force=True)
+            return False
+
+        self._create_libertine_user_data_dir()
+        chown_recursive_dirs(utils.get_libertine_container_home_dir(self.container_id))
+
+        return True
+
+    def capture_image(self, image):
+        image.forget()
+        os.makedirs(image.path)
+
+        if not _copy_rootfs(self.root_path, image.rootfs_path):
+            utils.get_logger().error(utils._("Failed to store container as image '{image}'").format(image=image.name))
+            image.forget()
+            return False
+
+        image.save()
+        return True
+
+    def create_from_image(self, image, password=None, multiarch=False):
+        utils.get_logger().info(utils._("Copying container from image '{image}'...").format(image=image.name))
+        os.makedirs(os.path.dirname(self.root_path), exist_ok=True)
+
+        if not _copy_rootfs(image.rootfs_path, self.root_path):
+            utils.get_logger().error(utils._("Failed to create container from image '{image}'").format(image=image.name))
+            self.destroy_libertine_container(force=True)
+            return False
+
+        self._create_libertine_user_data_dir()
+
+        if multiarch and self.architecture == 'amd64':
+            utils.get_logger().info(utils._("Adding i386 multiarch support..."))
+            self.run_in_container("dpkg --add-architecture i386")
+            self.update_packages()
+
+        chown_recursive_dirs(utils.get_libertine_container_home_dir(self.container_id))
+
+        return True
+
     def update_packages(self, new_locale=None):
         retcode = super().update_packages(new_locale)
         self._run_ldconfig()
         return retcode == 0
 
-    def install_package(self, package_name, no_dialog=False, update_cache=True):
-        returncode = super().install_package(package_name, no_dialog, update_cache)
+    def install_packages(self, package_names, no_dialog=False, update_cache=True):
+        results = super().install_packages(package_names, no_dialog, update_cache)
 
-        if returncode:
+        if any(results.values()):
             self._run_ldconfig()
 
-        return returncode
+        return results
+
+    def _use_package_cache(self, cache):
+        # fakechroot cannot bind-mount, but the kernel resolves a symlink to
+        # the host path without it being rewritten into the chroot
+        archives = os.path.join(self.root_path, 'var', 'cache', 'apt', 'archives')
+
+        if cache is None:
+            if os.path.islink(archives):
+                os.remove(archives)
+                os.makedirs(os.path.join(archives, 'partial'))
+            return
+
+        if os.path.islink(archives) and os.readlink(archives) == cache.path:
+            return
+
+        if os.path.islink(archives):
+            os.remove(archives)
+        elif os.path.isdir(archives):
+            shutil.rmtree(archives)
+
+        os.symlink(cache.path, archives)
 
     def _build_fakechroot_command(self):
         cmd = 'fakechroot'
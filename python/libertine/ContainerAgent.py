@@ -0,0 +1,244 @@
+# Copyright 2017 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+A long-lived process inside a container which runs commands on behalf of the
+host, so that running a command does not cost a new 'lxc exec', attach or
+fakechroot.
+
+This file is copied into the container and run there with python3, so it
+only depends on the standard library.  The host talks to it over a Unix
+socket with frames made of a one byte kind, a four byte big-endian length
+and the payload:
+
+    'c'  host to agent: JSON object with the 'command' line and 'environ'
+    's'  agent to host: the command was received and is about to start
+    'o'  agent to host: data the command wrote to stdout
+    'e'  agent to host: data the command wrote to stderr
+    'x'  agent to host: the command's exit code as a signed four byte int
+
+The socket and the agent itself live in a directory only the host user can
+enter.  The agent exits when its stdin is closed, which happens at the latest
+when the host process which started it exits, and removes that directory.
+"""
+
+import json
+import os
+import selectors
+import shlex
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+
+_HEADER = struct.Struct('!cI')
+_EXIT_CODE = struct.Struct('!i')
+
+# Variables an agent started through fakechroot must keep for its commands
+# to stay in the chroot
+_AGENT_ENVIRON_PREFIXES = ('LD_', 'FAKECHROOT', 'FAKEROOT', 'FAKED')
+
+
+class AgentUnavailable(Exception):
+    """
+    The agent could not be reached.  The command was not run.
+    """
+    pass
+
+
+def _recv_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError("Connection closed")
+        data += chunk
+
+    return data
+
+
+def _write_all(fd, data):
+    data = memoryview(data)
+    while data:
+        data = data[os.write(fd, data):]
+
+
+def send_frame(sock, kind, payload):
+    sock.sendall(_HEADER.pack(kind, len(payload)) + payload)
+
+
+def recv_frame(sock):
+    kind, size = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    return kind, _recv_exactly(sock, size)
+
+
+class ContainerAgent(object):
+    """
+    The host side of an agent.
+
+    :param socket_path: The host path of the socket the agent listens on.
+    :param process: The process running the agent.  It needs the stdin,
+                    poll() and wait() of subprocess.Popen.
+    """
+    def __init__(self, socket_path, process):
+        self._socket_path = socket_path
+        self._process = process
+        self._socket = None
+
+    def connect(self, timeout=10):
+        """
+        Waits for the agent to listen and connects to it.  Raises
+        AgentUnavailable if it does not within timeout seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self._socket.connect(self._socket_path)
+                return self
+            except OSError as e:
+                self._socket.close()
+                self._socket = None
+
+                if self._process.poll() is not None or time.monotonic() > deadline:
+                    self.close()
+                    raise AgentUnavailable(str(e))
+
+                time.sleep(0.05)
+
+    def run(self, command_string, environ):
+        """
+        Runs a command line in the container, passing its output on to this
+        process' stdout and stderr, and returns its exit code.
+        """
+        # Until the agent acknowledges the command it is safe to run it elsewhere
+        try:
+            send_frame(self._socket, b'c', json.dumps({'command': command_string, 'environ': environ}).encode('utf-8'))
+            kind, payload = recv_frame(self._socket)
+        except (OSError, EOFError) as e:
+            raise AgentUnavailable(str(e))
+
+        if kind != b's':
+            raise AgentUnavailable("Unexpected frame {!r} instead of the acknowledgement".format(kind))
+
+        while True:
+            kind, payload = recv_frame(self._socket)
+            if kind == b'o':
+                _write_all(sys.stdout.fileno(), payload)
+            elif kind == b'e':
+                _write_all(sys.stderr.fileno(), payload)
+            elif kind == b'x':
+                return _EXIT_CODE.unpack(payload)[0]
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+        if self._process.stdin:
+            self._process.stdin.close()
+        self._process.wait()
+
+
+def _run_command(connection, request):
+    environ = dict(request['environ'])
+    environ.update({key: value for key, value in os.environ.items() if key.startswith(_AGENT_ENVIRON_PREFIXES)})
+
+    send_frame(connection, b's', b'')
+
+    try:
+        process = subprocess.Popen(shlex.split(request['command']), stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=environ)
+    except OSError as e:
+        send_frame(connection, b'e', "{}\n".format(e).encode('utf-8'))
+        send_frame(connection, b'x', _EXIT_CODE.pack(127))
+        return
+
+    with selectors.DefaultSelector() as selector:
+        selector.register(process.stdout, selectors.EVENT_READ, b'o')
+        selector.register(process.stderr, selectors.EVENT_READ, b'e')
+
+        while selector.get_map():
+            for key, events in selector.select():
+                data = os.read(key.fileobj.fileno(), 65536)
+                if data:
+                    send_frame(connection, key.data, data)
+                else:
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+
+    send_frame(connection, b'x', _EXIT_CODE.pack(process.wait()))
+
+
+def _serve_connection(connection):
+    with connection:
+        while True:
+            try:
+                kind, payload = recv_frame(connection)
+            except EOFError:
+                return
+
+            if kind == b'c':
+                _run_command(connection, json.loads(payload.decode('utf-8')))
+
+
+def _exit_on_eof(paths):
+    sys.stdin.buffer.read()
+
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    try:
+        os.rmdir(os.path.dirname(paths[0]))
+    except OSError:
+        pass
+
+    os._exit(0)
+
+
+def serve(socket_path, owner=None):
+    """
+    Runs the agent, listening on socket_path.  The socket is only accessible
+    to its owner, which is set to the uid owner if the agent runs as another
+    user, such as root in a container.
+    """
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o177)
+    try:
+        server.bind(socket_path)
+    finally:
+        os.umask(umask)
+
+    if owner is not None and os.getuid() != owner:
+        os.chown(socket_path, owner, -1)
+    server.listen(1)
+
+    threading.Thread(target=_exit_on_eof, args=([socket_path, os.path.abspath(__file__)],), daemon=True).start()
+
+    while True:
+        connection, address = server.accept()
+        _serve_connection(connection)
+
+
+if __name__ == '__main__':
+    serve(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else None)
@@ -12,84 +12,398 @@
 # You should have received a copy of the GNU General Public License along
 # with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import contextlib
+import copy
 import fcntl
+import functools
 import json
 import os
+import re
 import sys
 import errno
+import tempfile
+import threading
 import time
 
 from hashlib import md5
 from . import utils, HostInfo
+from .ContainersDatabase import ContainersDatabase, ContainersDatabaseConflict
+from .RunningAppsRegistry import RunningAppsRegistry
 
-class _ContainersConfigFile(object):
-    def __init__(self, readonly=True):
-        self._readonly = readonly
 
-        if readonly:
-            self._flags = 'r'
-        else:
-            self._flags = 'w'
+# Arrays of objects in a container entry which are looked up by the given
+# member(s) and are therefore kept in a keyed index.
+_INDEXED_ARRAYS = {
+    'installedApps': ('packageName',),
+    'extraArchives': ('archiveName',),
+    'runningApps':   ('appExecName', 'pid'),
+}
+
+
+def _array_item_key(array_key, item):
+    return tuple(item.get(k) for k in _INDEXED_ARRAYS[array_key])
+
+
+# Seconds to wait for the lock guarding ContainersConfig.json
+_LOCK_TIMEOUT = 30
+
+# The generation counter sorts ahead of every other key in the JSON output,
+# so it can be read without parsing the whole file.
+_GENERATION_REGEX = re.compile(r'^\{\s*"_generation":\s*(\d+)')
+
+
+def _build_array_index(container, array_key):
+    index = {}
+    for item in container.get(array_key) or []:
+        index.setdefault(_array_item_key(array_key, item), item)
+
+    return index
+
+
+class ContainersConfigConflict(RuntimeError):
+    """
+    Raised when the database was changed by someone else since the revision
+    a write was based on.
+    """
+    pass
+
+
+# Characters read at a time when streaming a merge source
+_MERGE_CHUNK_SIZE = 64 * 1024
+
+# Ways of resolving a container present in both the database and a merge
+# source: take the source entry, keep the local entry, or update the local
+# entry with the source's fields and combine their packages, archives and
+# bind mounts.
+MERGE_POLICIES = ('source', 'local', 'merge')
+
+
+class _JSONStreamReader(object):
+    """
+    Reads a ContainersConfig.json document incrementally, so that the
+    containers in a large file can be visited one at a time without holding
+    the entire document in memory.
+    """
+    def __init__(self, fd):
+        self._fd = fd
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        chunk = self._fd.read(max(_MERGE_CHUNK_SIZE, len(self._buffer) - self._pos))
+        if not chunk:
+            self._eof = True
+            return False
+
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos].isspace():
+                self._pos += 1
+
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+
+            if not self._fill():
+                raise ValueError(utils._("Unexpected end of JSON input"))
+
+    def _expect(self, *tokens):
+        token = self._peek()
+        if token not in tokens:
+            raise ValueError(utils._("Expected one of '{expected}' but found '{token}'").format(expected="', '".join(tokens), token=token))
+
+        self._pos += 1
+        return token
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+                # A number cut off by the end of the buffer still parses
+                if end < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+
+            self._fill()
+
+    def items(self):
+        """
+        Yields (key, value) for each member of the top level object.  The
+        containerList member is yielded with a generator of its entries,
+        which must be consumed before advancing to the next member.
+        """
+        self._expect('{')
+        if self._peek() == '}':
+            return
+
+        while True:
+            key = self._value()
+            self._expect(':')
+            if key == 'containerList' and self._peek() == '[':
+                yield key, self._array()
+            else:
+                yield key, self._value()
+
+            if self._expect(',', '}') == '}':
+                return
+
+    def _array(self):
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+
+        while True:
+            yield self._value()
+            if self._expect(',', ']') == ']':
+                return
+
+
+def _merge_keyed_arrays(local, source, key):
+    merged = {item.get(key): item for item in local}
+    merged.update((item.get(key), item) for item in source)
+    return list(merged.values())
+
+
+def _merge_container_entries(local, source):
+    merged = dict(local)
+    merged.update(source)
+
+    for array_key in ('installedApps', 'extraArchives'):
+        if array_key in local and array_key in source:
+            merged[array_key] = _merge_keyed_arrays(local[array_key] or [], source[array_key] or [],
+                                                    _INDEXED_ARRAYS[array_key][0])
+
+    if 'bindMounts' in local and 'bindMounts' in source:
+        merged['bindMounts'] = list(dict.fromkeys((local['bindMounts'] or []) + (source['bindMounts'] or [])))
 
+    return merged
+
+
+def _get_lock_file_path():
+    return utils.get_libertine_database_file_path() + '.lock'
+
+
+class _ContainersConfigLock(object):
+    """
+    Holds a lock on the file guarding ContainersConfig.json; shared for readers
+    and exclusive for writers.  The database itself is only ever replaced by
+    renaming a complete file over it, so readers never see a partial write.
+    """
+    _held = threading.local()
+
+    def __init__(self, exclusive=False, timeout=_LOCK_TIMEOUT):
+        self._operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        self._timeout = timeout
         self._fd = None
 
     def __enter__(self):
-        container_config_file = utils.get_libertine_database_file_path()
-        if self._readonly and (not os.path.exists(container_config_file) or
-                               os.path.getsize(container_config_file) == 0):
-            return None
+        # A thread holding the exclusive lock may read and write the database
+        if getattr(self._held, 'exclusive', False):
+            return self
 
-        retries = 0
-        while retries < 100:
-            try:
-                fd = open(container_config_file, self._flags)
-                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._fd = open(_get_lock_file_path(), 'a')
 
-                self._fd = fd
-                return self._fd
-            except IOError as e:
-                if e.errno != errno.EAGAIN:
+        deadline = time.monotonic() + self._timeout
+        delay = 0.001
+        while True:
+            try:
+                fcntl.flock(self._fd, self._operation | fcntl.LOCK_NB)
+                self._held.exclusive = self._operation == fcntl.LOCK_EX
+                return self
+            except OSError as e:
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    self._fd.close()
                     raise
-                else:
-                    fd.close()
-                    retries += 1
-                    time.sleep(0.05)
+
+            if time.monotonic() >= deadline:
+                self._fd.close()
+                raise RuntimeError(utils._("Timed out waiting for lock on '{lock_file}'").format(lock_file=_get_lock_file_path()))
+
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
 
     def __exit__(self, *args):
-        if self._fd:
+        if self._fd is not None:
+            self._held.exclusive = False
             self._fd.close()
+            self._fd = None
 
 
-def read_container_config_file():
+def _file_stamp(stat):
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def container_config_stamp():
+    """
+    Returns a cheap fingerprint of ContainersConfig.json from its inode, size
+    and modification time, or None if there is no database.  Since the file is
+    always replaced by a rename, any write changes the fingerprint.
+    """
+    try:
+        return _file_stamp(os.stat(utils.get_libertine_database_file_path()))
+    except FileNotFoundError:
+        return None
+
+
+def container_config_generation():
+    """
+    Returns the generation counter stored at the head of ContainersConfig.json
+    by write_container_config_file(), or None if it is not present.
+    """
+    try:
+        with open(utils.get_libertine_database_file_path(), 'r') as fd:
+            head = fd.read(64)
+    except FileNotFoundError:
+        return None
+
+    match = _GENERATION_REGEX.match(head)
+    if match:
+        return int(match.group(1))
+
+    return None
+
+
+def _read_database():
+    """
+    Reads ContainersConfig.json in one pass, returning the parsed database
+    along with the checksum and stamp of the contents that were read.
+    """
     container_list = {}
-    with _ContainersConfigFile() as fd:
-        if fd is not None:
-            container_list = json.load(fd)
+    with _ContainersConfigLock():
+        try:
+            with open(utils.get_libertine_database_file_path(), 'rb') as fd:
+                content = fd.read()
+                stamp = _file_stamp(os.fstat(fd.fileno()))
+        except FileNotFoundError:
+            content = b''
+            stamp = None
 
-    return container_list
+    if content.strip():
+        container_list = json.loads(content.decode('utf-8'))
 
+    return container_list, md5(content).hexdigest(), stamp
 
-def write_container_config_file(container_list):
+
+def read_container_config_file():
+    return _read_database()[0]
+
+
+def write_container_config_file(container_list, expected_generation=None):
+    """
+    Replaces ContainersConfig.json with the given database, bumping its
+    generation counter.  Returns the checksum and stamp of the written file.
+    If expected_generation is given, ContainersConfigConflict is raised and
+    nothing is written unless the file is still at that generation.
+    """
     container_config_file = utils.get_libertine_database_file_path()
+    config_dir = os.path.dirname(container_config_file)
 
     # Add a warning to adventurous users advising against mucking with this file
     if container_list is not None:
         container_list["_warning"] = "This file is automatically generated by Libertine and should not be manually edited."
+        container_list["_generation"] = container_list.get("_generation", 0) + 1
+
+    content = (json.dumps(container_list, sort_keys=True, indent=4) + '\n').encode('utf-8')
+
+    with _ContainersConfigLock(exclusive=True):
+        if expected_generation is not None and (container_config_generation() or 0) != expected_generation:
+            raise ContainersConfigConflict(utils._("'{config_file}' was changed by another process").format(config_file=container_config_file))
+
+        try:
+            mode = os.stat(container_config_file).st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o644
+
+        fd, temp_file = tempfile.mkstemp(prefix='.ContainersConfig.', suffix='.json', dir=config_dir)
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                temp.write(content)
+                temp.flush()
+                os.fchmod(temp.fileno(), mode)
+                os.fsync(temp.fileno())
+                stamp = _file_stamp(os.fstat(temp.fileno()))
+
+            os.rename(temp_file, container_config_file)
+        except:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temp_file)
+            raise
+
+        dir_fd = os.open(config_dir, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    return md5(content).hexdigest(), stamp
+
+
+def _open_database():
+    """
+    Returns the SQLite containers database if it is in use, importing the
+    current ContainersConfig.json the first time it is opened.  SQLite is used
+    once ContainersConfig.db exists or when LIBERTINE_DATABASE=sqlite is set,
+    so that all readers and writers agree on the backend.
+    """
+    database_file = utils.get_libertine_sqlite_database_file_path()
+    if os.environ.get('LIBERTINE_DATABASE') != 'sqlite' and not os.path.exists(database_file):
+        return None
+
+    database = ContainersDatabase(database_file)
+    if database.import_json(read_container_config_file(), write_container_config_file):
+        utils.get_logger().info(utils._("Imported ContainersConfig.json into {database}").format(database=database_file))
+
+    return database
+
+
+def _mutator(method):
+    """
+    Decorates a ContainersConfig method which modifies the in-memory database
+    and returns True if it should be written out.  Changes are written out
+    straight away, or once the enclosing transaction completes.  Every call is
+    recorded, written or not, so that it can be applied again if another
+    writer got there first; mutators must therefore be safe to apply twice.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            # Mutators called by other mutators are recorded by the outer call
+            if self._mutation_depth:
+                return method(self, *args, **kwargs)
+
+            self._mutation_depth += 1
+            try:
+                changed = method(self, *args, **kwargs)
+            finally:
+                self._mutation_depth -= 1
+
+            self._pending.append(functools.partial(method, self, *args, **kwargs))
+            if changed:
+                self._changed()
 
-    with _ContainersConfigFile(False) as fd:
-        if fd:
-            json.dump(container_list, fd, sort_keys=True, indent=4)
-            fd.write('\n')
+    return wrapper
 
 
 def container_config_hash():
     checksum = md5()
     container_config_file = utils.get_libertine_database_file_path()
-    if (os.path.exists(container_config_file) and os.path.getsize(container_config_file) != 0):
-        with open(container_config_file, "rb") as fd:
-            fcntl.flock(fd, fcntl.LOCK_EX)
-            for chunk in iter(lambda: fd.read(128 * checksum.block_size), b""):
-                checksum.update(chunk)
+    with _ContainersConfigLock():
+        try:
+            with open(container_config_file, "rb") as fd:
+                for chunk in iter(lambda: fd.read(128 * checksum.block_size), b""):
+                    checksum.update(chunk)
+        except FileNotFoundError:
+            pass
     return checksum.hexdigest()
 
 
@@ -97,26 +411,62 @@ class ContainersConfig(object):
 
     def __init__(self):
         self.checksum = None
+        self.generation = None
+        self.skipped_reloads = 0
+        self.write_conflicts = 0
+        self._stamp = None
+        self._lock = threading.RLock()
+        self._transaction_depth = 0
+        self._transaction_dirty = False
+        self._transaction_snapshot = None
+        self._mutation_depth = 0
+        self._pending = []
+        self._watched = False
+        self._stale = False
+        self._database = _open_database()
+        self._running_apps = RunningAppsRegistry()
         self.refresh_database()
 
-        if "defaultContainer" in self.container_list:
-            self.default_container_id = self.container_list['defaultContainer']
-        else:
-            self.default_container_id = None
-
     """
     Private helper methods
     """
-    def _get_container_entry(self, container_id):
-        if not self.container_list:
-            return None
+    def _rebuild_index(self):
+        container_index = {}
+        array_index = {}
+
+        for container in self.container_list.get('containerList', []):
+            # The first entry wins when ids are duplicated, matching a linear scan
+            if container['id'] not in container_index:
+                container_index[container['id']] = container
+                for array_key in _INDEXED_ARRAYS:
+                    array_index[(container['id'], array_key)] = _build_array_index(container, array_key)
+
+        # Swap the new index in at once so that a background reload never
+        # exposes a half built index to readers on other threads.
+        self._container_index, self._array_index = container_index, array_index
+
+    def _index_container(self, container):
+        self._container_index[container['id']] = container
+
+        for array_key in _INDEXED_ARRAYS:
+            self._index_array(container, array_key)
 
-        for container in self.container_list['containerList']:
-            if container['id'] == container_id:
-                return container
+    def _index_array(self, container, array_key):
+        self._array_index[(container['id'], array_key)] = _build_array_index(container, array_key)
+
+    def _find_array_object(self, container_id, array_key, object_key, matcher):
+        if _INDEXED_ARRAYS.get(array_key) == (object_key,):
+            return self._array_index.get((container_id, array_key), {}).get((matcher,))
+
+        for item in self._get_value_by_key(container_id, array_key) or []:
+            if item[object_key] == matcher:
+                return item
 
         return None
 
+    def _get_container_entry(self, container_id):
+        return self._container_index.get(container_id)
+
     def _get_value_by_key(self, container_id, key):
         container = self._get_container_entry(container_id)
 
@@ -126,11 +476,71 @@ class ContainersConfig(object):
             return container[key]
 
     def _get_array_object_value_by_key(self, container_id, array_key, object_key, matcher, key):
-        items = self._get_value_by_key(container_id, array_key) or []
-        for item in items:
-            if item[object_key] == matcher:
-                return item[key]
+        item = self._find_array_object(container_id, array_key, object_key, matcher)
+        if item is not None:
+            return item[key]
 
+    def _changed(self):
+        if self._transaction_depth:
+            self._transaction_dirty = True
+        else:
+            self._commit()
+
+    def _exclusive(self):
+        if self._database is not None:
+            return self._database.exclusive()
+
+        return _ContainersConfigLock(exclusive=True)
+
+    def _commit(self):
+        """
+        Writes the database based on the revision that was last read.  If
+        another writer changed it in the meantime, the database is reloaded
+        and the pending changes are applied again on top of it.  Other
+        writers are held off during the retry, so that a busy database
+        cannot starve this writer.
+        """
+        try:
+            self._write()
+        except (ContainersConfigConflict, ContainersDatabaseConflict):
+            self.write_conflicts += 1
+            pending = self._pending
+
+            with self._exclusive():
+                self._load()
+
+                self._mutation_depth += 1
+                try:
+                    changed = [mutation() for mutation in pending]
+                finally:
+                    self._mutation_depth -= 1
+
+                if any(changed):
+                    self._write()
+
+        self._pending = []
+
+    def _write(self):
+        # The database detects conflicts per container and mirrors whatever
+        # it stores, so only writes of the JSON file check its generation
+        if self._database is not None:
+            self.checksum, self._stamp = self._database.write(self.container_list, write_container_config_file)
+        else:
+            self.checksum, self._stamp = write_container_config_file(self.container_list,
+                                                                     expected_generation=self.generation or 0)
+        self.generation = self.container_list.get('_generation')
+
+    def _load(self):
+        if self._database is not None:
+            self.container_list = self._database.read()
+        else:
+            self.container_list, self.checksum, self._stamp = _read_database()
+        self.generation = self.container_list.get('_generation')
+        self.default_container_id = self.container_list.get('defaultContainer')
+        self._pending = []
+        self._rebuild_index()
+
+    @_mutator
     def _set_value_by_key(self, container_id, key, value):
         container = self._get_container_entry(container_id)
 
@@ -138,50 +548,67 @@ class ContainersConfig(object):
             return
 
         if type(value) is dict:
+            if key in _INDEXED_ARRAYS and _array_item_key(key, value) in self._array_index[(container_id, key)]:
+                return
+
             if key not in container:
                 newvalue = [value]
             else:
                 newvalue = container[key].copy()
                 newvalue.append(value)
         elif type(value) is list and key in container:
-            newvalue = container[key] + value
+            newvalue = container[key] + [item for item in value if item not in container[key]]
         else:
             newvalue = value
 
         if container.get(key, None) != newvalue:
             container[key] = newvalue
-            write_container_config_file(self.container_list)
 
+            if key in _INDEXED_ARRAYS:
+                if type(value) is dict:
+                    self._array_index[(container_id, key)].setdefault(_array_item_key(key, value), value)
+                else:
+                    self._index_array(container, key)
+
+            return True
+
+    @_mutator
     def _set_array_object_value_by_key(self, container_id, array_key, object_key, matcher, key, value):
-        container = self._get_container_entry(container_id)
+        item = self._find_array_object(container_id, array_key, object_key, matcher)
 
-        if not container:
+        if item is None:
             return
 
-        for item in container[array_key]:
-            if item[object_key] == matcher:
-                item[key] = value
-                write_container_config_file(self.container_list)
-                return
+        item[key] = value
+        if key in _INDEXED_ARRAYS.get(array_key, ()):
+            self._index_array(self._get_container_entry(container_id), array_key)
 
+        return True
+
+    @_mutator
     def _delete_array_object_by_key_value(self, container_id, array_key, object_key, value):
-        container = self._get_container_entry(container_id)
+        item = self._find_array_object(container_id, array_key, object_key, value)
 
-        if not container:
+        if item is None:
             return
 
-        for item in container[array_key]:
-            if item[object_key] == value:
-                container[array_key].remove(item)
-                write_container_config_file(self.container_list)
-                return
+        container = self._get_container_entry(container_id)
+        container[array_key].remove(item)
+        if array_key in _INDEXED_ARRAYS:
+            self._index_array(container, array_key)
+
+        return True
 
+    @_mutator
     def _delete_array_object_by_value(self, container_id, array_key, value):
         container = self._get_container_entry(container_id)
 
         if container and array_key in container and value in container[array_key]:
             container[array_key].remove(value)
-            write_container_config_file(self.container_list)
+            if array_key in _INDEXED_ARRAYS:
+                self._index_array(container, array_key)
+
+            return True
 
     def _test_key_value_exists(self, container_id, key, value=None):
         key_value = self._get_value_by_key(container_id, key)
@@ -196,56 +623,150 @@ class ContainersConfig(object):
             return False
 
     def _test_array_object_key_value_exists(self, container_id, array_key, object_key, value):
-        array = self._get_value_by_key(container_id, array_key)
-
-        if not array:
-            return False
-
-        for item in array:
-            if item[object_key] == value:
-                return True
-
-        return False
+        return self._find_array_object(container_id, array_key, object_key, value) is not None
 
     """
     Miscellaneous ContainersConfig.json operations
     """
     def refresh_database(self):
-        checksum = container_config_hash()
-        if checksum != self.checksum:
-            self.container_list = read_container_config_file()
-            self.checksum = checksum
-
-    def _find_duplicate_container_entry(self, container_list, container_id):
-        for container in container_list['containerList']:
-            if container['id'] == container_id:
-                return container
-
-        return None
-
-    def merge_container_config_files(self, filepath):
-        merged_json = []
+        """
+        Reloads ContainersConfig.json if another process changed it and
+        returns True when the in-memory database was replaced.  While the
+        object is watched, the file is only looked at after invalidate().
+        """
+        with self._lock:
+            # Reloading mid-transaction would discard the pending changes
+            if self._transaction_depth:
+                return False
+
+            if self._watched and not self._stale:
+                self.skipped_reloads += 1
+                return False
+
+            self._stale = False
+            try:
+                if self._database is not None:
+                    if not self._database.changed():
+                        self.skipped_reloads += 1
+                        return False
+
+                    self._load()
+                    return True
+
+                stamp = container_config_stamp()
+                if stamp is not None and stamp == self._stamp:
+                    self.skipped_reloads += 1
+                    return False
+
+                # A new generation means the contents surely changed; otherwise
+                # the file may have been rewritten with the same contents.
+                generation = container_config_generation()
+                if (generation is None or generation == self.generation) and \
+                   container_config_hash() == self.checksum:
+                    self._stamp = stamp
+                    self.skipped_reloads += 1
+                    return False
+
+                self._load()
+                return True
+            except BaseException:
+                self._stale = True
+                raise
+
+    def watch(self, enabled=True):
+        """
+        Puts the object in watched mode, in which refresh_database() trusts
+        the in-memory database until invalidate() is called.  Only enable
+        this when something, such as libertine.service.config_watcher,
+        reliably calls invalidate() on every change to the database file.
+        """
+        with self._lock:
+            self._watched = enabled
+            self._stale = True
+
+    def invalidate(self):
+        """
+        Marks the in-memory database as possibly out of date, so that the
+        next refresh_database() checks the file again.
+        """
+        self._stale = True
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Collects all changes made within the context and writes them to
+        ContainersConfig.json at once when the outermost transaction exits.
+        If an exception escapes the context, the in-memory database is rolled
+        back and nothing is written.  Other threads using this object wait
+        until the transaction completes.
+        """
+        with self._lock:
+            if self._transaction_depth == 0:
+                self._transaction_snapshot = (copy.deepcopy(self.container_list), self.default_container_id,
+                                              len(self._pending))
+                self._transaction_dirty = False
+
+            self._transaction_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._transaction_depth -= 1
+                if self._transaction_depth == 0:
+                    self.container_list, self.default_container_id, pending = self._transaction_snapshot
+                    del self._pending[pending:]
+                    self._rebuild_index()
+                raise
+            else:
+                self._transaction_depth -= 1
+                if self._transaction_depth == 0 and self._transaction_dirty:
+                    self._commit()
+            finally:
+                if self._transaction_depth == 0:
+                    self._transaction_snapshot = None
+
+    @_mutator
+    def merge_container_config_files(self, filepath, policy='source'):
+        """
+        Merges the containers from another ContainersConfig.json into the
+        database.  Containers found in both are resolved according to policy,
+        one of MERGE_POLICIES.  The file is read one container at a time.
+        """
+        if policy not in MERGE_POLICIES:
+            raise ValueError(utils._("Unknown merge policy '{policy}'").format(policy=policy))
+
+        adopt_settings = 'containerList' not in self.container_list
+        container_list = self.container_list.get('containerList', [])
+        positions = {}
+        for i, container in enumerate(container_list):
+            positions.setdefault(container['id'], i)
 
         with open(filepath, 'r') as fd:
-            merge_source = json.load(fd)
-
-        if "containerList" in self.container_list:
-            # Finds any duplicate entries and assumes we want to update the main config
-            # with entries from the merge source.
-            for i, container in enumerate(self.container_list['containerList']):
-                merge_container = self._find_duplicate_container_entry(merge_source, container['id'])
-                if merge_container:
-                    self.container_list['containerList'][i] = merge_container
-                    merge_source['containerList'].remove(merge_container)
-
-            # Merges in any remaining non-duplicate entries.
-            for container in merge_source['containerList']:
-                self.container_list['containerList'].append(container)
-
-        else:
-            self.container_list = merge_source
-
-        write_container_config_file(self.container_list)
+            for key, value in _JSONStreamReader(fd).items():
+                if key != 'containerList':
+                    # Settings such as the default container are only taken
+                    # from the source when the database has no containers.
+                    if adopt_settings and not key.startswith('_'):
+                        self.container_list[key] = value
+                    continue
+
+                for container in value:
+                    i = positions.get(container['id'])
+                    if i is None:
+                        positions[container['id']] = len(container_list)
+                        container_list.append(container)
+                    elif policy == 'source':
+                        container_list[i] = container
+                    elif policy == 'merge':
+                        container_list[i] = _merge_container_entries(container_list[i], container)
+
+        if container_list or not adopt_settings:
+            self.container_list['containerList'] = container_list
+
+        if adopt_settings:
+            self.default_container_id = self.container_list.get('defaultContainer')
+
+        self._rebuild_index()
+        return True
 
     def check_container_id(self, container_id):
         if container_id and not self.container_exists(container_id):
@@ -262,19 +783,19 @@ class ContainersConfig(object):
     def get_default_container_id(self):
         return self.default_container_id
 
+    @_mutator
     def set_default_container_id(self, container_id, write_json=False):
         self.default_container_id = container_id
         self.container_list['defaultContainer'] = container_id
 
-        if write_json:
-            write_container_config_file(self.container_list)
+        return write_json
 
+    @_mutator
     def clear_default_container_id(self, write_json=False):
         self.default_container_id = None
         self.container_list.pop('defaultContainer', None)
 
-        if write_json:
-            write_container_config_file(self.container_list)
+        return write_json
 
     def get_containers(self):
         return [c["id"] for c in self.container_list.get('containerList', [])]
@@ -282,7 +803,11 @@ class ContainersConfig(object):
     """
     Operations for the container itself.
     """
+    @_mutator
     def add_new_container(self, container_id, container_name, container_type, container_distro):
+        if container_id in self._container_index:
+            return False
+
         container_obj = {'id': container_id, 'installStatus': 'new', 'type': container_type,
                          'distro': container_distro, 'name': container_name, 'installedApps': []}
 
@@ -294,16 +819,41 @@ class ContainersConfig(object):
         else:
             self.container_list['containerList'].append(container_obj)
 
-        write_container_config_file(self.container_list)
+        self._index_container(container_obj)
+
+        return True
+
+    @_mutator
+    def clone_container(self, source_id, container_id, container_name):
+        """
+        Adds a container with the configuration of the given source container,
+        including its packages, archives and bind mounts.
+        """
+        source = self._get_container_entry(source_id)
+        if source is None or container_id in self._container_index:
+            return False
+
+        container_obj = copy.deepcopy(source)
+        container_obj.pop('runningApps', None)
+        container_obj.update({'id': container_id, 'name': container_name, 'installStatus': 'new'})
 
+        self.container_list['containerList'].append(container_obj)
+        self._index_container(container_obj)
+
+        return True
+
+    @_mutator
     def delete_container(self, container_id):
         if not self.container_list:
             utils.get_logger().error(utils._("Unable to delete container. No containers defined."))
             sys.exit(1)
 
         container = self._get_container_entry(container_id)
+        if container is None:
+            return False
 
         self.container_list['containerList'].remove(container)
+        self._rebuild_index()
 
         # Set a new defaultContainer if the current default is being deleted.
         if self.container_list['defaultContainer'] == container_id and self.container_list['containerList']:
@@ -312,7 +862,7 @@ class ContainersConfig(object):
         elif not self.container_list['containerList']:
             self.clear_default_container_id()
 
-        write_container_config_file(self.container_list)
+        return True
 
     def update_container_install_status(self, container_id, new_status):
         self._set_value_by_key(container_id, 'installStatus', new_status)
@@ -340,6 +890,24 @@ class ContainersConfig(object):
     def get_container_locale(self, container_id):
         return self._get_value_by_key(container_id, 'locale')
 
+    def update_container_language_support(self, container_id, state):
+        self._set_value_by_key(container_id, 'languageSupport', state)
+
+    def get_container_language_support(self, container_id):
+        return self._get_value_by_key(container_id, 'languageSupport')
+
+    def update_container_apt_cache_updated(self, container_id, timestamp):
+        self._set_value_by_key(container_id, 'aptCacheUpdated', timestamp)
+
+    def get_container_apt_cache_updated(self, container_id):
+        return self._get_value_by_key(container_id, 'aptCacheUpdated')
+
+    def update_container_apt_sources(self, container_id, state):
+        self._set_value_by_key(container_id, 'aptSources', state)
+
+    def get_container_apt_sources(self, container_id):
+        return self._get_value_by_key(container_id, 'aptSources')
+
     def get_container_name(self, container_id):
         return self._get_value_by_key(container_id, 'name')
 
@@ -393,24 +961,23 @@ class ContainersConfig(object):
                                                         package_name)
 
     """
-    Operations for running apps in a Libertine container.
+    Operations for running apps in a Libertine container.  These are kept in
+    the RunningAppsRegistry rather than in ContainersConfig.json; entries
+    written to the database by older versions are still reported and removed.
     """
     def add_running_app(self, container_id, app_exec_name, pid=0):
-        app_obj = {'appExecName': app_exec_name, 'pid': pid}
-        self._set_value_by_key(container_id, 'runningApps', app_obj)
+        self._running_apps.add(container_id, app_exec_name, pid)
 
     def delete_running_app(self, container_id, app_obj):
-        self._delete_array_object_by_value(container_id, 'runningApps', app_obj)
+        if not self._running_apps.remove(container_id, app_obj['appExecName'], app_obj['pid']):
+            self._delete_array_object_by_value(container_id, 'runningApps', app_obj)
 
     def find_running_app_by_name_and_pid(self, container_id, app_exec_name, pid):
-        for app in self.get_running_apps(container_id):
-            if app['appExecName'] == app_exec_name and app['pid'] == pid:
-                return app
-
-        return None
+        return self._running_apps.find(container_id, app_exec_name, pid) or \
+               self._array_index.get((container_id, 'runningApps'), {}).get((app_exec_name, pid))
 
     def get_running_apps(self, container_id):
-        return self._get_value_by_key(container_id, 'runningApps') or []
+        return self._running_apps.get(container_id) + (self._get_value_by_key(container_id, 'runningApps') or [])
 
     """
     Operations for bind-mount maintenance in a Libertine container.
@@ -436,6 +1003,35 @@ class ContainersConfig(object):
     def get_freeze_on_stop(self, container_id):
         return self._get_value_by_key(container_id, 'freezeOnStop') or False
 
+    """
+    Operations for setting how long a container is kept running after its
+    last user finished.
+    """
+    def update_idle_timeout(self, container_id, idle_timeout):
+        self._set_value_by_key(container_id, 'idleTimeout', idle_timeout)
+
+    def get_idle_timeout(self, container_id):
+        return self._get_value_by_key(container_id, 'idleTimeout') or 0
+
+    """
+    Operations for sharing downloaded packages with other containers.
+    """
+    def update_shared_package_cache(self, container_id, shared_package_cache=True):
+        self._set_value_by_key(container_id, 'sharedPackageCache', shared_package_cache)
+
+    def get_shared_package_cache(self, container_id):
+        return self._get_value_by_key(container_id, 'sharedPackageCache') or False
+
+    """
+    Operations for setting whether launching an application waits for the
+    container's network.
+    """
+    def update_wait_for_network(self, container_id, wait_for_network=True):
+        self._set_value_by_key(container_id, 'waitForNetwork', wait_for_network)
+
+    def get_wait_for_network(self, container_id):
+        return self._get_value_by_key(container_id, 'waitForNetwork') is not False
+
     """
     Fetcher functions for various configuration information.
     """
@@ -0,0 +1,311 @@
+# Copyright 2017 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import contextlib
+import json
+import sqlite3
+
+from . import utils
+
+
+_BUSY_TIMEOUT = 30
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS containers (
+    id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    name TEXT,
+    type TEXT,
+    distro TEXT,
+    installStatus TEXT,
+    multiarch TEXT,
+    locale TEXT,
+    freezeOnStop INTEGER,
+    arrays TEXT NOT NULL,
+    extra TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS packages (
+    container_id TEXT NOT NULL REFERENCES containers(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    packageName TEXT,
+    appStatus TEXT
+);
+CREATE TABLE IF NOT EXISTS archives (
+    container_id TEXT NOT NULL REFERENCES containers(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    archiveName TEXT,
+    archiveStatus TEXT
+);
+CREATE TABLE IF NOT EXISTS bind_mounts (
+    container_id TEXT NOT NULL REFERENCES containers(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    path TEXT
+);
+CREATE TABLE IF NOT EXISTS running_apps (
+    container_id TEXT NOT NULL REFERENCES containers(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    appExecName TEXT,
+    pid INTEGER
+);
+CREATE INDEX IF NOT EXISTS packages_container ON packages (container_id, position);
+CREATE INDEX IF NOT EXISTS archives_container ON archives (container_id, position);
+CREATE INDEX IF NOT EXISTS bind_mounts_container ON bind_mounts (container_id, position);
+CREATE INDEX IF NOT EXISTS running_apps_container ON running_apps (container_id, position);
+"""
+
+_CONTAINER_COLUMNS = ('name', 'type', 'distro', 'installStatus', 'multiarch', 'locale', 'freezeOnStop')
+
+# Maps each per-container array to its table and the columns holding the keys
+# of its objects.  Bind mounts are plain strings rather than objects.
+_ARRAY_TABLES = {
+    'installedApps': ('packages', ('packageName', 'appStatus')),
+    'extraArchives': ('archives', ('archiveName', 'archiveStatus')),
+    'bindMounts': ('bind_mounts', None),
+    'runningApps': ('running_apps', ('appExecName', 'pid')),
+}
+
+# Keys of the meta table which are not settings such as the default container
+_META_KEYS = ('_arrays', '_generation', '_warning')
+
+
+class ContainersDatabaseConflict(RuntimeError):
+    """
+    Raised when a container a write would replace was changed by someone
+    else since it was last read or written.
+    """
+    pass
+
+
+class ContainersDatabase(object):
+    """
+    SQLite storage for the containers database, used in place of
+    ContainersConfig.json when enabled.  Writes only touch the rows of
+    containers which changed since they were last read or written by this
+    object, and only conflict with other writers which changed the same
+    containers in the meantime, so concurrent writers changing different
+    containers neither undo nor hold up each other's changes.
+    """
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path, timeout=_BUSY_TIMEOUT, isolation_level=None,
+                                           check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute('PRAGMA foreign_keys=ON')
+        self._connection.executescript(_SCHEMA)
+
+        self._rows = {}
+        self._settings = {}
+        self._data_version = None
+        self._transaction_depth = 0
+
+    @contextlib.contextmanager
+    def _transaction(self, immediate=True):
+        # Nested transactions become part of the one opened by exclusive()
+        if self._transaction_depth:
+            self._transaction_depth += 1
+            try:
+                yield
+            finally:
+                self._transaction_depth -= 1
+            return
+
+        self._connection.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+        self._transaction_depth += 1
+        try:
+            yield
+        except BaseException:
+            self._connection.execute('ROLLBACK')
+            raise
+        else:
+            self._connection.execute('COMMIT')
+        finally:
+            self._transaction_depth -= 1
+
+    def _get_data_version(self):
+        return self._connection.execute('PRAGMA data_version').fetchone()[0]
+
+    def _read_document(self):
+        document = {key: json.loads(value) for key, value in self._connection.execute('SELECT key, value FROM meta')}
+
+        arrays = {}
+        for array_key, (table, columns) in _ARRAY_TABLES.items():
+            select = 'SELECT container_id, {} FROM {} ORDER BY container_id, position'.format(
+                         ', '.join(columns or ('path',)), table)
+            for row in self._connection.execute(select):
+                item = row[1] if columns is None else dict(zip(columns, row[1:]))
+                arrays.setdefault((row[0], array_key), []).append(item)
+
+        containers = []
+        select = 'SELECT id, arrays, extra, {} FROM containers ORDER BY position'.format(', '.join(_CONTAINER_COLUMNS))
+        for row in self._connection.execute(select):
+            container = json.loads(row[2])
+            container['id'] = row[0]
+            for column, value in zip(_CONTAINER_COLUMNS, row[3:]):
+                if value is not None:
+                    container[column] = bool(value) if column == 'freezeOnStop' else value
+            for array_key in json.loads(row[1]):
+                container[array_key] = arrays.get((row[0], array_key), [])
+            containers.append(container)
+
+        if containers or 'containerList' in document.get('_arrays', []):
+            document['containerList'] = containers
+        document.pop('_arrays', None)
+
+        return document
+
+    def _insert_container(self, position, container):
+        arrays = [key for key in _ARRAY_TABLES if key in container]
+        extra = {key: value for key, value in container.items()
+                 if key != 'id' and key not in _CONTAINER_COLUMNS and key not in _ARRAY_TABLES}
+
+        self._connection.execute('INSERT INTO containers (id, position, arrays, extra, {}) VALUES (?, ?, ?, ?{})'.format(
+                                     ', '.join(_CONTAINER_COLUMNS), ', ?' * len(_CONTAINER_COLUMNS)),
+                                 [container['id'], position, json.dumps(arrays), json.dumps(extra, sort_keys=True)] +
+                                 [container.get(column) for column in _CONTAINER_COLUMNS])
+
+        for array_key in arrays:
+            table, columns = _ARRAY_TABLES[array_key]
+            insert = 'INSERT INTO {} (container_id, position, {}) VALUES (?, ?{})'.format(
+                         table, ', '.join(columns or ('path',)), ', ?' * len(columns or ('path',)))
+            self._connection.executemany(insert,
+                                         [[container['id'], i] + ([item] if columns is None else [item.get(c) for c in columns])
+                                          for i, item in enumerate(container[array_key] or [])])
+
+    def _get_settings(self, document):
+        return {key: value for key, value in document.items() if key != 'containerList' and key not in _META_KEYS}
+
+    def _get_rows(self, document):
+        return {container['id']: (position, json.dumps(container, sort_keys=True), container)
+                for position, container in enumerate(document.get('containerList', []))}
+
+    def _store(self, container_list, mirror):
+        rows = {}
+        for position, container in enumerate(container_list.get('containerList', [])):
+            if container['id'] in rows:
+                utils.get_logger().warning(utils._("Ignoring duplicate entry for container '{container_id}'")
+                                           .format(container_id=container['id']))
+                continue
+            rows[container['id']] = (position, json.dumps(container, sort_keys=True), container)
+
+        deleted = self._rows.keys() - rows.keys()
+        changed = [container_id for container_id, row in rows.items()
+                   if container_id not in self._rows or self._rows[container_id][1] != row[1]]
+
+        # Settings such as the default container are checked like a row
+        current = self._read_document()
+        settings = self._get_settings(container_list)
+        stored_settings = self._get_settings(current)
+        if settings != self._settings and stored_settings != self._settings:
+            raise ContainersDatabaseConflict(utils._("The settings were changed by another process"))
+
+        current = self._get_rows(current)
+        for container_id in deleted.union(changed):
+            expected = self._rows[container_id][1] if container_id in self._rows else None
+            stored = current[container_id][1] if container_id in current else None
+            if stored != expected and not (container_id in deleted and stored is None):
+                raise ContainersDatabaseConflict(utils._("Container '{container_id}' was changed by another process")
+                                                 .format(container_id=container_id))
+
+        for container_id in deleted:
+            self._connection.execute('DELETE FROM containers WHERE id = ?', (container_id,))
+
+        for container_id, (position, serialized, container) in rows.items():
+            if container_id in changed:
+                self._connection.execute('DELETE FROM containers WHERE id = ?', (container_id,))
+                self._insert_container(position, container)
+            elif self._rows[container_id][0] != position:
+                self._connection.execute('UPDATE containers SET position = ? WHERE id = ?', (position, container_id))
+
+        # Changes to other containers are picked up on the next read, so only
+        # the rows written here are known to be current
+        written = self._get_rows(self._read_document())
+        self._rows = {container_id: written[container_id] if container_id in changed else self._rows[container_id]
+                      for container_id in rows}
+
+        # Rows and settings written by other processes are kept, so mirror
+        # what is really stored.
+        if settings != self._settings:
+            self._settings = settings
+        else:
+            settings = stored_settings
+
+        document = dict(settings, _warning=container_list.get('_warning'), _generation=container_list.get('_generation', 0))
+        stored = self._connection.execute("SELECT value FROM meta WHERE key = '_generation'").fetchone()
+        document['_generation'] = max(json.loads(stored[0]) if stored else 0, document.get('_generation', 0))
+        document['containerList'] = [row[2] for row in sorted(written.values(), key=lambda row: row[0])]
+
+        result = mirror(document)
+
+        meta = {key: value for key, value in document.items() if key != 'containerList'}
+        meta['_arrays'] = ['containerList'] if 'containerList' in container_list else []
+        self._connection.execute('DELETE FROM meta')
+        self._connection.executemany('INSERT INTO meta (key, value) VALUES (?, ?)',
+                                     [(key, json.dumps(value)) for key, value in meta.items()])
+
+        container_list['_generation'] = document['_generation']
+        container_list['_warning'] = document.get('_warning')
+
+        return result
+
+    def exclusive(self):
+        """
+        Returns a context which keeps other writers out of the database, so
+        that the reads and writes made within it form a single transaction.
+        """
+        return self._transaction()
+
+    def changed(self):
+        """
+        Returns True if another connection committed a change since the
+        database was last read.
+        """
+        return self._get_data_version() != self._data_version
+
+    def read(self):
+        with self._transaction(immediate=False):
+            document = self._read_document()
+            self._data_version = self._get_data_version()
+
+        self._rows = self._get_rows(document)
+        self._settings = self._get_settings(document)
+
+        return document
+
+    def write(self, container_list, mirror):
+        """
+        Stores the containers which changed in container_list and calls
+        mirror() with the resulting database before committing.  Returns
+        whatever mirror() returns.
+        """
+        with self._transaction():
+            return self._store(container_list, mirror)
+
+    def import_json(self, container_list, mirror):
+        """
+        Stores container_list if the database has never been written, which
+        is how an existing ContainersConfig.json gets imported.  Returns
+        False if the database already had contents.
+        """
+        with self._transaction():
+            if self._connection.execute('SELECT 1 FROM meta LIMIT 1').fetchone():
+                return False
+
+            self._rows = {}
+            self._settings = {}
+            self._store(container_list, mirror)
+            return True
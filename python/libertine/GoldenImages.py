@@ -0,0 +1,141 @@
+# Copyright 2017 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import contextlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from . import utils
+
+
+def get_images_dir_path():
+    # The leading dot keeps the directory from clashing with a container id
+    return os.path.join(utils.get_libertine_containers_dir_path(), '.images')
+
+
+class GoldenImage(object):
+    """
+    A fully provisioned container of a given type, distro, architecture and
+    locale kept aside to create further containers from.  What the image is
+    made of depends on the container type; this only keeps track of it in
+    a directory per image holding image.json.
+
+    :param username: The container user baked into the image, if any.
+    :param uid: The uid of that user.
+    """
+    def __init__(self, container_type, distro, architecture, locale, created=None, username=None, uid=None):
+        self.container_type = container_type
+        self.distro = distro
+        self.architecture = architecture
+        self.locale = locale or 'C'
+        self.created = created
+        self.username = username
+        self.uid = uid
+
+    @property
+    def name(self):
+        return '{}-{}-{}-{}'.format(self.container_type, self.distro, self.architecture, self.locale)
+
+    @property
+    def path(self):
+        return os.path.join(get_images_dir_path(), self.name)
+
+    @property
+    def rootfs_path(self):
+        return os.path.join(self.path, 'rootfs')
+
+    @property
+    def _metadata_path(self):
+        return os.path.join(self.path, 'image.json')
+
+    def exists(self):
+        return os.path.exists(self._metadata_path)
+
+    def save(self):
+        """
+        Records the image as complete.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        self.created = time.time()
+
+        fd, temp_file = tempfile.mkstemp(prefix='.', dir=self.path)
+        try:
+            with os.fdopen(fd, 'w') as temp:
+                json.dump({'type': self.container_type, 'distro': self.distro, 'architecture': self.architecture,
+                           'locale': self.locale, 'created': self.created, 'username': self.username,
+                           'uid': self.uid}, temp, sort_keys=True, indent=4)
+
+            os.rename(temp_file, self._metadata_path)
+        except:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temp_file)
+            raise
+
+    def forget(self):
+        """
+        Removes what is left of the image in the images directory once its
+        container type disposed of its contents.
+        """
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def _load_image(path):
+    try:
+        with open(os.path.join(path, 'image.json'), 'r') as fd:
+            metadata = json.load(fd)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        utils.get_logger().warning(utils._("Ignoring invalid image '{path}'").format(path=path))
+        return None
+
+    return GoldenImage(metadata['type'], metadata['distro'], metadata['architecture'], metadata['locale'],
+                       metadata.get('created'), metadata.get('username'), metadata.get('uid'))
+
+
+def get_images(container_type=None, distro=None):
+    """
+    Returns the images in the store, optionally only those of the given
+    container type and/or distro.
+    """
+    root = get_images_dir_path()
+
+    images = []
+    for name in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+        image = _load_image(os.path.join(root, name))
+        if image is None:
+            continue
+
+        if (container_type is None or image.container_type == container_type) and \
+           (distro is None or image.distro == distro):
+            images.append(image)
+
+    return images
+
+
+def delete_image(image):
+    """
+    Deletes the image along with whatever its container type keeps of it.
+    """
+    if image.container_type == 'lxc':
+        from libertine.LxcContainer import delete_lxc_image
+        delete_lxc_image(image)
+    elif image.container_type == 'lxd':
+        from libertine.LxdContainer import delete_lxd_image
+        delete_lxd_image(image)
+
+    image.forget()
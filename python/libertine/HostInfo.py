@@ -13,12 +13,10 @@
 # with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import locale
-import lsb_release
 import os
 import platform
 import subprocess
 
-from distro_info import UbuntuDistroInfo
 from libertine import utils
 
 
@@ -41,11 +39,15 @@ class HostInfo(object):
         return int(kernel_release[0]) >= 4 or (int(kernel_release[0]) == 4)
 
     def get_host_distro_release(self):
+        import lsb_release
+
         distinfo = lsb_release.get_distro_information()
 
         return distinfo.get('CODENAME', 'n/a')
 
     def is_distro_valid(self, distro, force=False):
+        from distro_info import UbuntuDistroInfo
+
         if force:
             return UbuntuDistroInfo().valid(distro)
 
@@ -62,6 +64,8 @@ class HostInfo(object):
         return True
 
     def get_distro_codename(self, distro):
+        from distro_info import UbuntuDistroInfo
+
         ubuntu_distro_info = UbuntuDistroInfo()
 
         for row in ubuntu_distro_info._rows:
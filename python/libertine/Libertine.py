@@ -15,11 +15,35 @@
 import abc
 import contextlib
 import os
+import shlex
 import shutil
+import sys
+import tempfile
+import time
 
-from . import utils, ContainerControlClient
-from libertine.ContainersConfig import ContainersConfig
+from hashlib import md5
+
+from . import utils, ContainerAgent
+from libertine.AptProgress import AptStatusPipe
+from libertine.GoldenImages import GoldenImage
 from libertine.HostInfo import HostInfo
+from libertine.PackageCache import PackageCache
+
+
+# Seconds after an 'apt-get update' during which further updates are skipped
+# unless the APT sources changed; LIBERTINE_APT_CACHE_TTL overrides it.
+_APT_CACHE_TTL = 3600
+
+# Files in a container which decide what 'apt-get update' fetches
+_APT_SOURCES_PATHS = ['etc/apt/sources.list', 'etc/apt/sources.list.d', 'etc/apt/trusted.gpg',
+                      'etc/apt/trusted.gpg.d', 'var/lib/dpkg/arch']
+
+
+def _apt_cache_ttl():
+    try:
+        return int(os.environ.get('LIBERTINE_APT_CACHE_TTL', _APT_CACHE_TTL))
+    except ValueError:
+        return _APT_CACHE_TTL
 
 
 def _apt_args_for_verbosity_level():
@@ -86,6 +110,9 @@ class BaseContainer(metaclass=abc.ABCMeta):
         self._service = service
         self._app_name = ''
         self._pid = 0
+        self._agent = None
+        self._agent_failed = False
+        self.apt_progress = None
         self.root_path = utils.get_libertine_container_rootfs_path(self.container_id)
         self.locale = self._config.get_container_locale(container_id)
         self.language = self._get_language_from_locale()
@@ -130,11 +157,53 @@ class BaseContainer(metaclass=abc.ABCMeta):
         else:
             return 'stopping'
 
+    def _get_language_support_state(self):
+        """
+        Returns a fingerprint of what check-language-support bases its answer
+        on: the language and the installed packages which have language
+        specific companion packages.  Returns None if this cannot be worked out
+        from the container's file system.
+        """
+        pkg_depends = os.path.join(self.root_path, 'usr', 'share', 'language-selector', 'data', 'pkg_depends')
+        dpkg_status = os.path.join(self.root_path, 'var', 'lib', 'dpkg', 'status')
+
+        try:
+            with open(pkg_depends, 'r') as fd:
+                triggers = {fields[2] for fields in (line.split(':') for line in fd if not line.startswith('#'))
+                            if len(fields) > 3 and fields[2]}
+
+            installed = set()
+            with open(dpkg_status, 'r') as fd:
+                package = None
+                for line in fd:
+                    if line.startswith('Package:'):
+                        package = line.split(':', 1)[1].strip()
+                    elif line.startswith('Status:') and line.split()[-1] == 'installed':
+                        installed.add(package)
+        except (OSError, UnicodeDecodeError):
+            return None
+
+        return md5('\n'.join([str(self.language)] + sorted(triggers & installed)).encode('utf-8')).hexdigest()
+
     def check_language_support(self):
-        if not self._binary_exists('check-language-support'):
-            self.install_package('language-selector-common', update_cache=False)
+        """
+        Installs the language packages for the installed applications, unless
+        nothing that affects them changed since the last check.
+        """
+        state = self._get_language_support_state()
+        if state is not None and state == self._config.get_container_language_support(self.container_id):
+            utils.get_logger().debug(utils._("Language support is up to date"))
+            return
+
+        if state is None and not self._binary_exists('check-language-support'):
+            self._install_archive_packages(['language-selector-common'])
+            state = self._get_language_support_state()
 
-        self.run_in_container("bash -c \"{} install $(check-language-support -l {})\"".format(_apt_command_prefix(), self.language))
+        with self._package_cache_lock():
+            ret = self.run_in_container("bash -c \"{} install $(check-language-support -l {})\"".format(_apt_command_prefix(), self.language))
+
+        if ret == 0 and state is not None:
+            self._config.update_container_language_support(self.container_id, state)
 
     def update_locale(self):
         self.run_in_container("locale-gen {}".format(self.locale))
@@ -151,6 +220,48 @@ class BaseContainer(metaclass=abc.ABCMeta):
     def destroy_libertine_container(self, force):
         pass
 
+    def clone_libertine_container(self, source_id):
+        """
+        Creates the container as a copy of another container of the same type,
+        sharing unchanged data with it where the storage allows.  Returns
+        False for container types which cannot be cloned.
+
+        :param source_id: The id of the container to copy.
+        """
+        return False
+
+    def capture_image(self, image):
+        """
+        Keeps a copy of the freshly created, stopped container as the given
+        golden image.  Returns False for container types without images.
+
+        :param image: The GoldenImage to store the container as.
+        """
+        return False
+
+    def create_from_image(self, image, password=None, multiarch=False):
+        """
+        Creates the container as a copy of the given golden image instead of
+        provisioning it from scratch.  Returns False for container types
+        without images.
+
+        :param image: The GoldenImage to create the container from.
+        """
+        return False
+
+    def _rewrite_image_user(self, image, password):
+        """
+        Turns the user baked into an image into the user of this container.
+        """
+        username = os.environ['USER']
+        if image.username != username or image.uid != os.getuid():
+            self.run_in_container("usermod -l {} -u {} {}".format(username, os.getuid(), image.username))
+            self.run_in_container("groupmod -n {} -g {} {}".format(username, os.getgid(), image.username))
+
+        import crypt
+
+        return self.run_in_container("usermod -p {} {}".format(crypt.crypt(password or ''), username)) == 0
+
     def copy_file_to_container(self, source, dest):
         """
         Copies a file from the host to the given path in the container.
@@ -189,26 +300,214 @@ class BaseContainer(metaclass=abc.ABCMeta):
         self._config.update_container_install_status(self.container_id, "ready")
         return True
 
+    def shutdown_container(self):
+        """
+        Stops the container even if libertined counts users of it.  Used by
+        libertined once a container was idle for its idle timeout.
+        """
+        return self.stop_container()
+
     def restart_container(self):
         """
         Restarts the container.
         """
         pass
 
-    @abc.abstractmethod
     def run_in_container(self, command_string):
         """
-        Runs a command inside the container context.
+        Runs a command inside the container context, through the container's
+        agent if it has one.
+
+        :param command_string: The command line to execute in the container context.
+        """
+        # Interactive commands need the terminal, which the agent cannot pass on
+        agent = None if sys.stdin is not None and sys.stdin.isatty() else self._get_agent()
+        if agent is not None:
+            try:
+                return agent.run(command_string, dict(os.environ))
+            except ContainerAgent.AgentUnavailable as e:
+                utils.get_logger().debug("Agent of container {} unavailable: {}".format(self.container_id, e))
+            except (OSError, EOFError) as e:
+                utils.get_logger().error(utils._("Lost the agent of container '{container_id}' while running '{command}': {error}")
+                                         .format(container_id=self.container_id, command=command_string, error=e))
+                self.stop_agent()
+                return 1
+
+            self.stop_agent()
+
+        return self._run_in_container(command_string)
+
+    @abc.abstractmethod
+    def _run_in_container(self, command_string):
+        """
+        Runs a command inside the container context in a process of its own.
 
         :param command_string: The command line to execute in the container context.
         """
         pass
 
-    def update_apt_cache(self):
+    def _start_agent_process(self, command_string):
         """
-        Updates the apt cache in the container.
+        Starts a command inside the container context without waiting for it,
+        with a pipe as its stdin.  Returns an object with the stdin, poll() and
+        wait() of subprocess.Popen, or None if the container type has no agent.
         """
-        return self.run_in_container(_apt_command_prefix() + 'update')
+        return None
+
+    def _get_shared_dir(self):
+        """
+        Returns the host and the container path of a directory both the host
+        and the container can reach.
+        """
+        return os.path.join(self.root_path, 'tmp'), '/tmp'
+
+    def _get_agent(self):
+        if self._agent is None and not self._agent_failed and os.environ.get('LIBERTINE_CONTAINER_AGENT', '0') != '0':
+            self._agent = self._start_agent()
+            self._agent_failed = self._agent is None
+
+        return self._agent
+
+    def _start_agent(self):
+        host_dir = None
+        try:
+            # The shared directory may be writable by anyone, so the agent's
+            # files go into a private directory with an unpredictable name
+            host_parent, container_parent = self._get_shared_dir()
+            host_dir = tempfile.mkdtemp(prefix='libertine-agent-{}-'.format(self.container_id), dir=host_parent)
+            container_dir = os.path.join(container_parent, os.path.basename(host_dir))
+
+            shutil.copy(ContainerAgent.__file__, os.path.join(host_dir, 'agent.py'))
+            process = self._start_agent_process("python3 {} {} {}".format(os.path.join(container_dir, 'agent.py'),
+                                                os.path.join(container_dir, 'agent.sock'), os.getuid()))
+            if process is None:
+                shutil.rmtree(host_dir, ignore_errors=True)
+                return None
+
+            return ContainerAgent.ContainerAgent(os.path.join(host_dir, 'agent.sock'), process).connect()
+        except Exception as e:
+            utils.get_logger().debug("Not using an agent for container {}: {}".format(self.container_id, e))
+            if host_dir is not None:
+                shutil.rmtree(host_dir, ignore_errors=True)
+            return None
+
+    def stop_agent(self):
+        """
+        Stops the container's agent, if it has one running.
+        """
+        if self._agent is not None:
+            self._agent.close()
+            self._agent = None
+
+    def _get_package_cache(self):
+        """
+        Returns the shared package cache of the container's distro and
+        architecture, or None if the container keeps its own.
+        """
+        if not self._config.get_shared_package_cache(self.container_id):
+            return None
+
+        return PackageCache(self.installed_release, self.architecture)
+
+    def _use_package_cache(self, cache):
+        """
+        Makes the container's APT archives the given shared package cache, or
+        its own if cache is None.  Container types which mount the cache when
+        they start have nothing to do here.
+        """
+        pass
+
+    @contextlib.contextmanager
+    def _package_cache_lock(self):
+        cache = self._get_package_cache()
+        if cache is None:
+            self._use_package_cache(None)
+            yield
+            return
+
+        with cache.lock():
+            self._use_package_cache(cache)
+            yield
+
+    def _run_apt(self, arguments):
+        """
+        Runs apt-get with the given arguments, reporting its progress to
+        apt_progress if set.
+        """
+        if self.apt_progress is None:
+            return self.run_in_container(_apt_command_prefix() + arguments)
+
+        # The shared directory may be writable by anyone, so the pipe goes
+        # into a private directory with an unpredictable name
+        host_parent, container_parent = self._get_shared_dir()
+        host_dir = tempfile.mkdtemp(prefix='libertine-apt-{}-'.format(self.container_id), dir=host_parent)
+        container_path = os.path.join(container_parent, os.path.basename(host_dir), 'status')
+        try:
+            with AptStatusPipe(os.path.join(host_dir, 'status'), container_path, self.apt_progress):
+                # Progress is not worth failing apt over if the pipe cannot be opened
+                command = "{{ exec 3>{}; }} 2>/dev/null || exec 3>/dev/null; {}--option APT::Status-Fd=3 {}".format(
+                          container_path, _apt_command_prefix(), arguments)
+                return self.run_in_container("bash -c {}".format(shlex.quote(command)))
+        finally:
+            shutil.rmtree(host_dir, ignore_errors=True)
+
+    def _run_apt_get(self, arguments):
+        with self._package_cache_lock():
+            return self._run_apt(arguments)
+
+    def _get_apt_sources_state(self):
+        """
+        Returns a fingerprint of the APT sources, keys and architectures of
+        the container, or None if its file system cannot be read.
+        """
+        if not os.path.isdir(self.root_path):
+            return None
+
+        stamps = []
+        for path in _APT_SOURCES_PATHS:
+            full_path = os.path.join(self.root_path, path)
+            paths = [full_path]
+            if os.path.isdir(full_path):
+                paths += [os.path.join(full_path, name) for name in sorted(os.listdir(full_path))]
+
+            for path in paths:
+                try:
+                    stat = os.stat(path)
+                    stamps.append('{} {} {}'.format(path, stat.st_size, stat.st_mtime_ns))
+                except FileNotFoundError:
+                    stamps.append('{} -'.format(path))
+
+        return md5('\n'.join(stamps).encode('utf-8')).hexdigest()
+
+    def _apt_cache_is_fresh(self):
+        state = self._get_apt_sources_state()
+        if state is None or state != self._config.get_container_apt_sources(self.container_id):
+            return False
+
+        updated = self._config.get_container_apt_cache_updated(self.container_id)
+        return updated is not None and 0 <= time.time() - updated < _apt_cache_ttl()
+
+    def update_apt_cache(self, force=False):
+        """
+        Updates the apt cache in the container, unless it was updated recently
+        and the APT sources have not changed since.
+
+        :param force: Update the cache regardless.
+        """
+        if not force and self._apt_cache_is_fresh():
+            utils.get_logger().info(utils._("Package lists of container '{container_id}' are up to date")
+                                      .format(container_id=self.container_id))
+            return 0
+
+        ret = self._run_apt('update')
+
+        state = self._get_apt_sources_state()
+        if ret == 0 and state is not None:
+            with self._config.transaction():
+                self._config.update_container_apt_cache_updated(self.container_id, time.time())
+                self._config.update_container_apt_sources(self.container_id, state)
+
+        return ret
 
     def update_packages(self, new_locale=None):
         """
@@ -222,41 +521,99 @@ class BaseContainer(metaclass=abc.ABCMeta):
             self.update_locale()
             self.install_base_language_packs()
 
-        return self.run_in_container(_apt_command_prefix() + '--force-yes dist-upgrade') == 0
+        return self._run_apt_get('--force-yes dist-upgrade') == 0
 
-    def install_package(self, package_name, no_dialog=False, update_cache=True):
+    def update_mounts(self, dry_run=False):
         """
-        Installs a named package in the container.
+        Brings the bind mounts of the container up to date.  Returns the names
+        of the added, removed and changed mounts, or None for container types
+        which set their mounts up anew each time they start.
 
-        :param package_name: The name of the package as APT understands it or
-                             a full path to a Debian package on the host.
+        :param dry_run: Only find out what would change.
+        """
+        return None
+
+    def sync_local_files(self):
         """
+        Brings whatever the host keeps of the container's files up to date
+        with the whole container rather than only with what the last package
+        transaction changed.
+        """
+        pass
+
+    def _install_debs(self, debs):
+        dests = []
+        created = []
+        for deb in debs:
+            dest = os.path.join('/', 'tmp', deb.split('/')[-1])
+            if self.copy_file_to_container(deb, dest):
+                created.append(dest)
+            dests.append(dest)
+
+        self.run_in_container('dpkg -i ' + ' '.join("'{}'".format(dest) for dest in dests))
+        ret = self._run_apt_get(" install -f") == 0
+
+        for dest in created:
+            self.delete_file_in_container(dest)
+
+        return ret
+
+    def _install_archive_packages(self, package_names):
+        return self._run_apt_get(" install " + ' '.join("'{}'".format(name) for name in package_names)) == 0
+
+    def _install_batch(self, packages, install):
+        if install(packages):
+            return dict.fromkeys(packages, True)
+
+        if len(packages) == 1:
+            return {packages[0]: False}
+
+        # A single bad package fails the whole transaction, so find out which
+        return {package: install([package]) for package in packages}
+
+    def install_packages(self, package_names, no_dialog=False, update_cache=True):
+        """
+        Installs several packages in the container in a single APT
+        transaction.
+
+        :param package_names: A list of package names as APT understands them
+                              and/or full paths to Debian packages on the host.
+        :rtype: A dict mapping each of package_names to whether it installed.
+        """
+        results = {}
+
         if update_cache:
             self.update_apt_cache()
 
-        if package_name.endswith('.deb'):
-            if not os.path.exists(package_name):
-                utils.get_logger().error(utils._("File '{package_name}' does not exist.").format(package_name=package_name))
-                return False
-
-            dest = os.path.join('/', 'tmp', package_name.split('/')[-1])
-            file_created = self.copy_file_to_container(package_name, dest)
+        debs = []
+        for deb in [p for p in package_names if p.endswith('.deb')]:
+            if os.path.exists(deb):
+                debs.append(deb)
+            else:
+                utils.get_logger().error(utils._("File '{package_name}' does not exist.").format(package_name=deb))
+                results[deb] = False
 
-            self.run_in_container('dpkg -i {}'.format(dest))
-            ret = self.run_in_container(_apt_command_prefix() + " install -f") == 0
+        if debs:
+            results.update(self._install_batch(debs, self._install_debs))
 
-            if file_created:
-                self.delete_file_in_container(dest)
+        archive_packages = [p for p in package_names if not p.endswith('.deb')]
+        if archive_packages:
+            if no_dialog:
+                os.environ['DEBIAN_FRONTEND'] = 'teletype'
+            results.update(self._install_batch(archive_packages, self._install_archive_packages))
 
-            return ret
+            self.check_language_support()
 
-        if no_dialog:
-            os.environ['DEBIAN_FRONTEND'] = 'teletype'
-        ret = self.run_in_container(_apt_command_prefix() + " install '" + package_name + "'") == 0
+        return results
 
-        self.check_language_support()
+    def install_package(self, package_name, no_dialog=False, update_cache=True):
+        """
+        Installs a named package in the container.
 
-        return ret
+        :param package_name: The name of the package as APT understands it or
+                             a full path to a Debian package on the host.
+        """
+        return self.install_packages([package_name], no_dialog, update_cache)[package_name]
 
     def remove_package(self, package_name):
         """
@@ -264,9 +621,9 @@ class BaseContainer(metaclass=abc.ABCMeta):
 
         :param package_name: The name of the package to be removed.
         """
-        if self.run_in_container(_apt_command_prefix() + " purge '" + package_name + "'") != 0:
+        if self._run_apt_get(" purge '" + package_name + "'") != 0:
             return False
-        return self.run_in_container(_apt_command_prefix() + "autoremove --purge") == 0
+        return self._run_apt_get("autoremove --purge") == 0
 
     def configure_multiarch(self, should_enable):
         """
@@ -277,10 +634,10 @@ class BaseContainer(metaclass=abc.ABCMeta):
         if should_enable:
             ret = self.run_in_container("dpkg --add-architecture i386")
             if ret or ret == 0:
-                self.update_apt_cache()
+                self.update_apt_cache(force=True)
             return ret
         else:
-            self.run_in_container(_apt_command_prefix() + "purge \".*:i386\"")
+            self._run_apt_get("purge \".*:i386\"")
             return self.run_in_container("dpkg --remove-architecture i386")
 
     def configure_add_archive(self, archive, public_key_file):
@@ -339,19 +696,25 @@ class LibertineMock(BaseContainer):
     def create_libertine_container(self, password=None, multiarch=False):
         return True
 
+    def clone_libertine_container(self, source_id):
+        return True
+
     def destroy_libertine_container(self, force):
         return True
 
     def update_packages(self, new_locale=None):
         return True
 
+    def install_packages(self, package_names, no_dialog=False, update_cache=True):
+        return dict.fromkeys(package_names, True)
+
     def install_package(self, package_name, no_dialog=False, update_cache=True):
         return True
 
     def remove_package(self, package_name, no_dialog=False):
         return True
 
-    def run_in_container(self, command_string):
+    def _run_in_container(self, command_string):
         return True
 
     def start_application(self, app_exec_line, environ):
@@ -380,6 +743,7 @@ class ContainerRunning(contextlib.ExitStack):
             raise RuntimeError(utils._("Container failed to start."))
 
         self.callback(lambda: container.stop_container())
+        self.callback(container.stop_agent)
 
 
 class LibertineContainer(object):
@@ -387,16 +751,24 @@ class LibertineContainer(object):
     A sandbox for DEB-packaged X11-based applications.
     """
 
-    def __init__(self, container_id, containers_config=None, service=None):
+    def __init__(self, container_id, containers_config=None, service=None, apt_progress=None):
         """
         Initializes the container object.
 
         :param container_id: The machine-readable container name.
+        :param apt_progress: Called with the status, percentage and message
+                             of apt operations as they progress.
         """
         super().__init__()
 
-        self.containers_config = containers_config or ContainersConfig()
-        service = service or ContainerControlClient.ContainerControlClient()
+        if containers_config is None:
+            from libertine.ContainersConfig import ContainersConfig
+            containers_config = ContainersConfig()
+        if service is None:
+            from libertine.ContainerControlClient import ContainerControlClient
+            service = ContainerControlClient()
+
+        self.containers_config = containers_config
 
         container_type = self.containers_config.get_container_type(container_id)
 
@@ -414,6 +786,8 @@ class LibertineContainer(object):
         else:
             raise RuntimeError(utils._("Unsupported container type '{container_type}'").format(container_type))
 
+        self.container.apt_progress = apt_progress
+
     @property
     def container_id(self):
         return self.container.container_id
@@ -436,43 +810,141 @@ class LibertineContainer(object):
         """
         return self.container.destroy_libertine_container(force)
 
-    def create_libertine_container(self, password=None, multiarch=False):
+    def create_libertine_container(self, password=None, multiarch=False, use_image=True):
         """
         Creates the container.
+
+        :param use_image: Create the container from the golden image for its
+                          type, distro, architecture and locale if there is
+                          one, and keep a new image if there is none.
         """
         self.container.architecture = HostInfo().get_host_architecture()
         self.container.installed_release = self.containers_config.get_container_distro(self.container_id)
+        image = self._get_image()
+
+        try:
+            if use_image and image.exists():
+                if self.container.create_from_image(image, password, multiarch):
+                    return True
+
+                utils.get_logger().warning(utils._("Could not use image '{image}', creating container from scratch")
+                                           .format(image=image.name))
+                self.container.destroy_libertine_container(force=True)
 
-        return self.container.create_libertine_container(password, multiarch)
+            if not self.container.create_libertine_container(password, multiarch):
+                return False
+
+            # Images are kept without multiarch, which is cheap to add later
+            if use_image and not multiarch and not image.exists():
+                utils.get_logger().info(utils._("Keeping container as image '{image}'").format(image=image.name))
+                if not self.container.capture_image(image):
+                    utils.get_logger().warning(utils._("Failed to keep container as image '{image}'").format(image=image.name))
 
-    def update_libertine_container(self, new_locale=None):
+            return True
+        finally:
+            self.container.stop_agent()
+
+    def clone_libertine_container(self, source_id):
+        """
+        Creates the container as a copy of the given container.
+        """
+        try:
+            return self.container.clone_libertine_container(source_id)
+        finally:
+            self.container.stop_agent()
+
+    def capture_image(self):
+        """
+        Replaces the golden image for the container's type, distro,
+        architecture and locale with the container.
+        """
+        self.container.architecture = HostInfo().get_host_architecture()
+        self.container.installed_release = self.containers_config.get_container_distro(self.container_id)
+
+        return self.container.capture_image(self._get_image())
+
+    def _get_image(self):
+        return GoldenImage(self.container_type, self.container.installed_release,
+                           self.container.architecture, self.container.locale)
+
+    def update_libertine_container(self, new_locale=None, refresh=False):
         """
         Updates the contents of the container.
+
+        :param refresh: Update the package lists even if they are recent.
         """
         try:
             with ContainerRunning(self.container):
                 self.containers_config.update_container_install_status(self.container_id, "updating")
+                if refresh:
+                    self.container.update_apt_cache(force=True)
+
                 return self.container.update_packages(new_locale)
         except RuntimeError as e:
             return handle_runtime_error(e)
 
-    def install_package(self, package_name, no_dialog=False, update_cache=True):
+    def install_package(self, package_name, no_dialog=False, update_cache=True, refresh=False):
         """
         Installs a package in the container.
+
+        :param refresh: Update the package lists even if they are recent.
+        """
+        return self.install_packages([package_name], no_dialog, update_cache, refresh)[package_name]
+
+    def _get_tracked_packages(self, package_names):
+        """
+        Returns the names the packages are known by in ContainersConfig, for
+        those of package_names which have an entry there.
+        """
+        tracked = {}
+        for package_name in package_names:
+            name = utils.get_deb_package_name(package_name) if package_name.endswith('.deb') else package_name
+            if self.containers_config.package_exists(self.container_id, name):
+                tracked[package_name] = name
+
+        return tracked
+
+    def install_packages(self, package_names, no_dialog=False, update_cache=True, refresh=False):
+        """
+        Installs several packages in the container at once.  The packages
+        which have an entry in ContainersConfig end up installed or removed
+        from it along with the container status in a single write.
+
+        :param refresh: Update the package lists even if they are recent.
+        :rtype: A dict mapping each of package_names to whether it installed.
         """
         try:
             with ContainerRunning(self.container):
-                self.containers_config.update_container_install_status(self.container_id, "installing packages")
-                retval = self.container.install_package(package_name, no_dialog, update_cache)
+                tracked = self._get_tracked_packages(package_names)
 
-                self.containers_config.update_container_install_status(self.container_id, "running")
-                return retval
+                with self.containers_config.transaction():
+                    for name in tracked.values():
+                        self.containers_config.update_package_install_status(self.container_id, name, "installing")
+                    self.containers_config.update_container_install_status(self.container_id, "installing packages")
+
+                if refresh:
+                    self.container.update_apt_cache(force=True)
+
+                results = self.container.install_packages(package_names, no_dialog, update_cache)
+
+                with self.containers_config.transaction():
+                    for package_name, name in tracked.items():
+                        if results[package_name]:
+                            self.containers_config.update_package_install_status(self.container_id, name, "installed")
+                        else:
+                            self.containers_config.delete_package(self.container_id, name)
+                    self.containers_config.update_container_install_status(self.container_id, "running")
+
+                return results
         except RuntimeError as e:
-            return handle_runtime_error(e)
+            handle_runtime_error(e)
+            return dict.fromkeys(package_names, False)
 
     def remove_package(self, package_name, no_dialog=False):
         """
-        Removes a package from the container.
+        Removes a package from the container.  If the package has an entry
+        in ContainersConfig, it is dropped along with the container status in
+        a single write, or marked installed again if the removal failed.
 
         :param package_name: The name of the package to be removed.
         """
@@ -481,10 +953,22 @@ class LibertineContainer(object):
                 if no_dialog:
                     os.environ['DEBIAN_FRONTEND'] = 'teletype'
 
-                self.containers_config.update_container_install_status(self.container_id, "removing packages")
+                fallback_status = self.containers_config.get_package_install_status(self.container_id, package_name)
+                with self.containers_config.transaction():
+                    if fallback_status is not None:
+                        self.containers_config.update_package_install_status(self.container_id, package_name, "removing")
+                    self.containers_config.update_container_install_status(self.container_id, "removing packages")
+
                 retval = self.container.remove_package(package_name)
 
-                self.containers_config.update_container_install_status(self.container_id, "running")
+                with self.containers_config.transaction():
+                    if fallback_status is not None:
+                        if retval or fallback_status not in ['installed', 'removing']:
+                            self.containers_config.delete_package(self.container_id, package_name)
+                        else:
+                            self.containers_config.update_package_install_status(self.container_id, package_name, "installed")
+                    self.containers_config.update_container_install_status(self.container_id, "running")
+
                 return retval
         except RuntimeError as e:
             return handle_runtime_error(e)
@@ -570,6 +1054,27 @@ class LibertineContainer(object):
         except RuntimeError as e:
             return handle_runtime_error(e)
 
+    def update_mounts(self, dry_run=False):
+        """
+        Brings the bind mounts of the container up to date.
+
+        :param dry_run: Only find out what would change.
+        :rtype: The names of the added, removed and changed mounts, or None if
+            the container type sets its mounts up each time it starts.
+        """
+        return self.container.update_mounts(dry_run)
+
+    def sync_local_files(self):
+        """
+        Re-syncs the host side copies of files in the container in full.
+        """
+        try:
+            with ContainerRunning(self.container):
+                self.container.sync_local_files()
+                return True
+        except RuntimeError as e:
+            return handle_runtime_error(e)
+
     def configure_multiarch(self, should_enable):
         try:
             with ContainerRunning(self.container):
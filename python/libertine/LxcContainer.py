@@ -23,7 +23,7 @@ import sys
 import tempfile
 
 from .Libertine import BaseContainer
-from . import utils, HostInfo
+from . import utils, GoldenImages, HostInfo
 
 
 home_path = os.environ['HOME']
@@ -62,6 +62,16 @@ def lxc_container(container_id):
     return container
 
 
+def _lxc_image_container(image):
+    return lxc.Container(image.name, GoldenImages.get_images_dir_path())
+
+
+def delete_lxc_image(image):
+    container = _lxc_image_container(image)
+    if container.defined:
+        container.destroy()
+
+
 def _dump_lxc_log(logfile):
     if os.path.exists(logfile):
         try:
@@ -152,6 +162,44 @@ class EnvLxcSettings(contextlib.ExitStack):
             del os.environ['https_proxy']
 
 
+def _exit_code(status):
+    """
+    Turns a status of os.waitpid into an exit code the way subprocess does,
+    with a process killed by a signal getting the negative signal number.
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+
+    return os.WEXITSTATUS(status)
+
+
+class _AttachedProcess(object):
+    """
+    A process started in a container with attach(), with as much of the
+    subprocess.Popen interface as the container agent needs.
+    """
+    def __init__(self, container, args):
+        read_fd, write_fd = os.pipe()
+        with os.fdopen(read_fd, 'rb') as stdin:
+            self.pid = container.attach(lxc.attach_run_command, args, stdin=stdin)
+        self.stdin = os.fdopen(write_fd, 'wb')
+        self.returncode = None
+
+    def poll(self):
+        if self.returncode is None:
+            pid, status = os.waitpid(self.pid, os.WNOHANG)
+            if pid:
+                self.returncode = _exit_code(status)
+
+        return self.returncode
+
+    def wait(self):
+        if self.returncode is None:
+            self.returncode = _exit_code(os.waitpid(self.pid, 0)[1])
+
+        return self.returncode
+
+
 class LibertineLXC(BaseContainer):
     """
     A concrete container type implemented using an LXC container.
@@ -203,6 +251,13 @@ class LibertineLXC(BaseContainer):
             )
             self.container.append_config_item("lxc.mount.entry", xdg_user_dir_entry)
 
+        package_cache = self._get_package_cache()
+        if package_cache is not None:
+            package_cache.prepare()
+            utils.get_logger().debug("Mounting package cache {} in container {}".format(package_cache.path, self.container_id))
+            self.container.append_config_item("lxc.mount.entry", "%s var/cache/apt/archives none bind,create=dir,optional"
+                                              % self._sanitize_bind_mounts([package_cache.path])[0])
+
     def _sanitize_bind_mounts(self, mounts):
         return [mount.replace(" ", "\\040") for mount in mounts]
 
@@ -231,16 +286,21 @@ class LibertineLXC(BaseContainer):
         return True
 
     def stop_container(self):
-        stopped = False
         self._config.refresh_database()
 
         if self._service.container_operation_finished(self.container_id, self._app_name, self._pid):
-            self._config.update_container_install_status(self.container_id, self._get_stop_type_string(self._freeze_on_stop))
+            return self.shutdown_container()
+
+        return False
 
-            if lxc_stop(self.container, self._freeze_on_stop):
-                stopped = self._service.container_stopped(self.container_id)
+    def shutdown_container(self):
+        stopped = False
+        self._config.update_container_install_status(self.container_id, self._get_stop_type_string(self._freeze_on_stop))
 
-            self._config.update_container_install_status(self.container_id, self.container.state.lower())
+        if lxc_stop(self.container, self._freeze_on_stop):
+            stopped = self._service.container_stopped(self.container_id)
+
+        self._config.update_container_install_status(self.container_id, self.container.state.lower())
 
         return stopped
 
@@ -254,10 +314,13 @@ class LibertineLXC(BaseContainer):
 
         return lxc_stop(self.container, self._freeze_on_stop)
 
-    def run_in_container(self, command_string):
+    def _run_in_container(self, command_string):
         cmd_args = shlex.split(command_string)
         return self.container.attach_wait(lxc.attach_run_command, cmd_args)
 
+    def _start_agent_process(self, command_string):
+        return _AttachedProcess(self.container, shlex.split(command_string))
+
     def update_packages(self, update_locale=False):
         if self.timezone_needs_update():
             self.run_in_container("bash -c \'echo \"{}\" >/etc/timezone\'".format(
@@ -346,8 +409,9 @@ class LibertineLXC(BaseContainer):
         utils.get_logger().info(utils._("Updating the contents of the container after creation..."))
         self.update_packages()
 
+        results = self.install_packages(self.default_packages, update_cache=False)
         for package in self.default_packages:
-            if not self.install_package(package, update_cache=False):
+            if not results[package]:
                 utils.get_logger().error(utils._("Failure installing '{package_name}' during container creation").format(package_name=package))
                 self.destroy_libertine_container()
                 return False
@@ -359,7 +423,97 @@ class LibertineLXC(BaseContainer):
 
         return True
 
+    def capture_image(self, image):
+        if not lxc_stop(self.container):
+            return False
+
+        os.makedirs(GoldenImages.get_images_dir_path(), exist_ok=True)
+        delete_lxc_image(image)
+
+        if not self.container.clone(image.name, config_path=GoldenImages.get_images_dir_path()):
+            utils.get_logger().error(utils._("Failed to store container as image '{image}'").format(image=image.name))
+            return False
+
+        image.username = os.environ['USER']
+        image.uid = os.getuid()
+        image.save()
+        return True
+
+    def create_from_image(self, image, password=None, multiarch=False):
+        if password is None:
+            return False
+
+        _setup_host_environment(os.environ['USER'])
+
+        image_container = _lxc_image_container(image)
+        if not image_container.defined:
+            return False
+
+        if not image_container.clone(self.container_id, config_path=utils.get_libertine_containers_dir_path()):
+            utils.get_logger().error(utils._("Failed to create container from image '{image}'").format(image=image.name))
+            return False
+
+        self._adopt_clone()
+
+        utils.get_logger().info(utils._("starting container ..."))
+        if not self.start_container():
+            self.destroy_libertine_container(force=True)
+            return False
+
+        if not self._rewrite_image_user(image, password):
+            utils.get_logger().error(utils._("Failed to set up the container user"))
+            self.destroy_libertine_container(force=True)
+            return False
+
+        if multiarch and self.architecture == 'amd64':
+            utils.get_logger().info(utils._("Adding i386 multiarch support..."))
+            self.run_in_container("dpkg --add-architecture i386")
+            self.update_packages()
+
+        utils.get_logger().info(utils._("stopping container ..."))
+        self.stop_container()
+
+        return True
+
+    def clone_libertine_container(self, source_id):
+        source = lxc_container(source_id)
+        if not source.defined:
+            utils.get_logger().error(utils._("No such container '{container_id}'").format(container_id=source_id))
+            return False
+
+        if source.state != 'STOPPED':
+            utils.get_logger().error(utils._("Container '{container_id}' must be stopped to be cloned.").format(container_id=source_id))
+            return False
+
+        # A full copy, as an overlay snapshot would break once the source
+        # container is destroyed
+        utils.get_logger().info(utils._("Cloning container '{source_id}'...").format(source_id=source_id))
+        if not source.clone(self.container_id):
+            utils.get_logger().error(utils._("Failed to clone container '{source_id}'").format(source_id=source_id))
+            return False
+
+        self._adopt_clone()
+
+        return True
+
+    def _adopt_clone(self):
+        # Cloning gives the container its own hostname, but the bind mounts
+        # still point at the user data of the container it was cloned from.
+        self.container = lxc_container(self.container_id)
+        self.container.clear_config_item("lxc.mount.entry")
+        self._append_mount_entries()
+        self.container.save_config()
+
+        self._create_libertine_user_data_dir()
+
     def create_libertine_config(self):
+        self._append_mount_entries()
+        self.container.append_config_item("lxc.include", "/usr/share/libertine/libertine-lxc.conf")
+
+        # Dump it all to disk
+        self.container.save_config()
+
+    def _append_mount_entries(self):
         user_id = os.getuid()
         home_entry = (
             "%s %s none bind,create=dir"
@@ -385,11 +539,6 @@ class LibertineLXC(BaseContainer):
                                           "none run/user tmpfs rw,nodev,noexec,nosuid,size=104857600,mode=0755,create=dir")
         self.container.append_config_item("lxc.mount.entry", run_user_entry)
 
-        self.container.append_config_item("lxc.include", "/usr/share/libertine/libertine-lxc.conf")
-
-        # Dump it all to disk
-        self.container.save_config()
-
     def start_application(self, app_exec_line, environ):
         os.environ.clear()
         os.environ.update(environ)
@@ -14,17 +14,46 @@
 
 import contextlib
 import crypt
+import fcntl
 import os
 import psutil
 import pylxd
+import re
 import shlex
 import shutil
 import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
 import time
 
 from . import Libertine, utils, HostInfo
 
 
+# Names of environment variables a shell can export
+_ENVIRON_KEY = re.compile('^[A-Za-z_][A-Za-z0-9_]*$')
+
+# Seconds a started container gets to bring up its network, and how often
+# it is checked in the meantime
+_NETWORK_TIMEOUT = 10
+_NETWORK_POLL_INTERVAL = 0.1
+
+_lxd_client = None
+
+
+def get_lxd_client():
+    """
+    Returns the LXD client shared by everything in this process, so that
+    only one connection to the LXD socket is ever made.
+    """
+    global _lxd_client
+    if _lxd_client is None:
+        _lxd_client = pylxd.Client()
+
+    return _lxd_client
+
+
 def _get_devices_map():
     devices = {
         '/dev/tty0':   {'path': '/dev/tty0', 'type': 'unix-char'},
@@ -106,7 +135,7 @@ chgrp video /dev/dri/*
 [ -n /dev/video0 ] && chgrp video /dev/video0
 '''[1:-1]
     container.files.put('/usr/bin/libertine-lxd-mount-update', script.format(uid=uid, username=username).encode('utf-8'))
-    subprocess.Popen(shlex.split("lxc exec {} -- chmod 755 /usr/bin/libertine-lxd-mount-update".format(container.name)))
+    _execute(container, "chmod 755 /usr/bin/libertine-lxd-mount-update")
 
 
 def lxd_container(client, container_id):
@@ -116,16 +145,36 @@ def lxd_container(client, container_id):
         return None
 
 
-def _wait_for_network(container):
-    for retries in range(0, 10):
-        ping = subprocess.Popen(shlex.split("lxc exec {} -- ping -c 1 ubuntu.com".format(container.name)),
-                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        out, err = ping.communicate()
-        if out:
+def _get_network_state(container):
+    """
+    Returns whether any network interface of the container other than the
+    loopback is up with a global address, or None if there is none at all.
+    """
+    try:
+        network = container.state().network or {}
+    except pylxd.exceptions.LXDAPIException:
+        return False
+
+    interfaces = [interface for name, interface in network.items() if name != 'lo']
+    if not interfaces:
+        return None
+
+    return any(interface.get('state') == 'up' and
+               any(address.get('scope') == 'global' for address in interface.get('addresses') or [])
+               for interface in interfaces)
+
+
+def _wait_for_network(container, timeout=_NETWORK_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while True:
+        state = _get_network_state(container)
+        if state:
             utils.get_logger().debug("Network connection active")
             return True
-        time.sleep(1)
-    return False
+        elif state is None or time.monotonic() >= deadline:
+            return False
+
+        time.sleep(_NETWORK_POLL_INTERVAL)
 
 
 def lxd_start(container):
@@ -174,60 +223,263 @@ def _lxd_save(entity, error, wait=True):
 
 _CONTAINER_DATA_DIRS = ["/usr/share/applications", "/usr/share/icons", "/usr/local/share/applications", "/usr/share/pixmaps"]
 
+# Where the host's directory of agent sockets is mounted in containers
+_CONTAINER_AGENTS_DIR = '/var/tmp/libertine-agents'
+
+
+def _get_agents_dir():
+    return os.path.join(utils.get_libertine_runtime_dir(), 'agents')
+
+
+def _make_agents_dir():
+    agents_dir = _get_agents_dir()
+    os.makedirs(agents_dir, exist_ok=True)
+    os.chmod(agents_dir, 0o700)
+    return agents_dir
+
+
+def _get_agents_device():
+    return {'type': 'disk', 'source': _get_agents_dir(), 'path': _CONTAINER_AGENTS_DIR}
+
+
+def _share_agents_dir(container):
+    """
+    Attaches the agents directory to a container which does not have it yet,
+    which LXD also does for running and frozen containers.
+    """
+    _make_agents_dir()
+    if 'libertine-agents' not in container.devices:
+        container.devices['libertine-agents'] = _get_agents_device()
+        _lxd_save(container, utils._("Sharing the agents directory with container '{container_id}' raised:").format(container_id=container.name))
+
+
+def _needs_sync(member, host_path):
+    try:
+        stat = os.stat(host_path)
+    except FileNotFoundError:
+        return True
+
+    return stat.st_size != member.size or int(stat.st_mtime) != member.mtime
+
+
+def _extract_application_files(tar, host_root):
+    """
+    Copies the regular files of the application directories in the tar
+    stream which are missing on the host, or differ in size or mtime.
+    Returns how many files were copied.
+    """
+    copied = 0
+    for member in tar:
+        name = os.path.normpath(member.name)
+        if not member.isfile() or not any(name.startswith(d.lstrip('/') + '/') for d in _CONTAINER_DATA_DIRS):
+            continue
+
+        host_path = os.path.join(host_root, name)
+        if not _needs_sync(member, host_path):
+            continue
+
+        utils.get_logger().debug("Syncing file: {}:/{}".format(host_path, name))
+        os.makedirs(os.path.dirname(host_path), exist_ok=True)
+        with open(host_path, 'wb') as f:
+            shutil.copyfileobj(tar.extractfile(member), f)
+        os.utime(host_path, (member.mtime, member.mtime))
+        copied += 1
+
+    return copied
+
 
 def _sync_application_dirs_to_host(container):
     host_root = utils.get_libertine_container_rootfs_path(container.name)
     for container_path in _CONTAINER_DATA_DIRS:
-        utils.get_logger().info(utils._("Syncing applications directory: {sync_path}").format(sync_path=container_path))
         os.makedirs(os.path.join(host_root, container_path.lstrip("/")), exist_ok=True)
 
-        # find a list of files within the container
-        find = subprocess.Popen(shlex.split("lxc exec {} -- find {} -type f".format(container.name, container_path)), stdout=subprocess.PIPE)
-        stdout, stderr = find.communicate()
+    utils.get_logger().info(utils._("Syncing applications directories: {sync_paths}").format(sync_paths=', '.join(_CONTAINER_DATA_DIRS)))
 
-        if find.returncode != 0:
-            return
+    # The container writes a single tar of the directories to a pipe in the
+    # agents directory, which the host reads as it goes.
+    _share_agents_dir(container)
+
+    name = 'libertine-sync-{}-{}.tar'.format(container.name, os.getpid())
+    host_path, container_path = os.path.join(_get_agents_dir(), name), os.path.join(_CONTAINER_AGENTS_DIR, name)
+    os.mkfifo(host_path)
+    os.chmod(host_path, 0o666)
 
-        for filepath in stdout.decode('utf-8').strip().split('\n'):
-            if not filepath:
-                continue
+    # Holding a write end ourselves keeps the reader from blocking forever
+    # should tar never get to open the pipe.
+    reader = os.open(host_path, os.O_RDONLY | os.O_NONBLOCK)
+    writer = os.open(host_path, os.O_WRONLY)
+    fcntl.fcntl(reader, fcntl.F_SETFL, fcntl.fcntl(reader, fcntl.F_GETFL) & ~os.O_NONBLOCK)
 
-            host_path = os.path.join(host_root, filepath.lstrip("/"))
-            if not os.path.exists(host_path):
-                utils.get_logger().info(utils._("Syncing file: {container_path}:{host_path}".format(container_path=filepath, host_path=host_path)))
-                os.makedirs(os.path.dirname(host_path), exist_ok=True)
-                with open(host_path, 'wb') as f:
-                    f.write(container.files.get(filepath))
+    def pack():
+        try:
+            _execute(container, "tar -C / --ignore-failed-read -cf {} {}".format(
+                     container_path, ' '.join(d.lstrip('/') for d in _CONTAINER_DATA_DIRS)))
+        finally:
+            os.close(writer)
+
+    packer = threading.Thread(target=pack)
+    started = time.monotonic()
+    packer.start()
 
+    copied = 0
+    try:
+        with open(reader, 'rb') as pipe, tarfile.open(fileobj=pipe, mode='r|') as tar:
+            copied = _extract_application_files(tar, host_root)
+    except tarfile.TarError as e:
+        utils.get_logger().warning(utils._("Syncing application directories of container '{container_id}' failed: {error}")
+                                   .format(container_id=container.name, error=str(e)))
+    finally:
+        packer.join()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(host_path)
+
+    elapsed = max(time.monotonic() - started, 0.001)
+    utils.get_logger().info(utils._("Synced {count} files in {seconds:.1f}s ({rate:.0f} files/s)")
+                            .format(count=copied, seconds=elapsed, rate=copied / elapsed))
+
+
+def _execute(container, command, environ=None, stream=False):
+    """
+    Runs a command line in the container over the LXD API and returns its
+    exit code, standard output and standard error.  With stream set, the
+    output goes to ours as the command writes it instead.
+    """
+    handlers = {}
+    if stream:
+        handlers = {'stdout_handler': _write_to(sys.stdout), 'stderr_handler': _write_to(sys.stderr)}
 
-def _lxc_args(container_id, command, environ={}):
-    env_as_args = ' '
-    for k, v in environ.items():
-        env_as_args += '--env {}="{}" '.format(k, v)
-    return shlex.split('lxc exec {}{}-- {}'.format(container_id,
-                                                   env_as_args,
-                                                   command))
+    try:
+        return container.execute(shlex.split(command), environment=environ or {}, **handlers)
+    except pylxd.exceptions.LXDAPIException as e:
+        utils.get_logger().error(utils._("Running '{command}' in container '{container_id}' failed: {error}")
+                                 .format(command=command, container_id=container.name, error=str(e)))
+        return -1, '', str(e)
 
 
-def _add_local_files_for_ual(container):
-    root_path = utils.get_libertine_container_rootfs_path(container.name)
+def _write_to(stream):
+    def write(output):
+        stream.write(output)
+        stream.flush()
+
+    return write
+
+
+def _write_environ(environ):
+    """
+    Writes the environment as a shell script to the directory shared with
+    containers, so that it need not go on the lxc command line for all to
+    see.  Returns the host and the container path of the script.
+    """
+    fd, host_path = tempfile.mkstemp(prefix='environ-', dir=_make_agents_dir())
+    with os.fdopen(fd, 'w') as f:
+        for key, value in sorted(environ.items()):
+            if _ENVIRON_KEY.match(key):
+                f.write('export {}={}\n'.format(key, shlex.quote(value)))
+
+    return host_path, os.path.join(_CONTAINER_AGENTS_DIR, os.path.basename(host_path))
+
+
+def _lxc_args(container_id, command, environ_path=None):
+    args = ['lxc', 'exec', container_id, '--']
+    if environ_path is not None:
+        # The script removes itself once the command has its environment
+        args += ['sh', '-c', '. "$0" && rm -f "$0" && exec "$@"', environ_path]
+
+    return args + shlex.split(command)
+
+
+# Where a package transaction keeps hard links to the dpkg file lists it
+# started with, as dpkg deletes those of the packages it removes.
+_DPKG_LISTS_SNAPSHOT_DIR = '/var/lib/libertine-dpkg-lists'
+
+_DPKG_INFO_DIR = '/var/lib/dpkg/info'
+
+
+class _DpkgTransaction(object):
+    """
+    Finds the files of the packages which get installed, upgraded or removed
+    in the container for the duration of the context from their dpkg file
+    lists.  installed_files and removed_files stay None when the lists
+    cannot be read, in which case the whole container has to be looked at.
+    """
+    def __init__(self, container):
+        self._container = container
+        self._before = None
+        self.installed_files = None
+        self.removed_files = None
+
+    def __enter__(self):
+        exit_code, out, err = _execute(self._container, "bash -c {}".format(shlex.quote(
+                                       "rm -rf {0} && mkdir -p {0} && find {1} -name '*.list' -exec ln -t {0} {{}} +".format(
+                                       _DPKG_LISTS_SNAPSHOT_DIR, _DPKG_INFO_DIR))))
+        if exit_code == 0:
+            self._before = self._get_lists()
+
+        return self
+
+    def __exit__(self, *args):
+        after = self._get_lists()
+
+        if self._before is not None and after is not None:
+            installed = [name for name, mtime in after.items() if self._before.get(name) != mtime]
+            removed = [name for name in self._before if name not in after]
+            self.installed_files = self._read_lists(_DPKG_INFO_DIR, installed)
+            self.removed_files = self._read_lists(_DPKG_LISTS_SNAPSHOT_DIR, removed)
+
+        _execute(self._container, "rm -rf {}".format(_DPKG_LISTS_SNAPSHOT_DIR))
+
+    def _get_lists(self):
+        exit_code, out, err = _execute(self._container, "find {} -name '*.list' -printf '%f %T@\\n'".format(_DPKG_INFO_DIR))
+        if exit_code != 0:
+            return None
+
+        return dict(line.rsplit(' ', 1) for line in out.splitlines() if line)
+
+    def _read_lists(self, directory, names):
+        if not names:
+            return []
+
+        exit_code, out, err = _execute(self._container, "bash -c {}".format(shlex.quote(
+                                       "cd {} && cat -- {}".format(directory, ' '.join(shlex.quote(name) for name in sorted(names))))))
+        if exit_code != 0:
+            return None
+
+        return [path for path in out.splitlines() if path and path != '/.']
+
+
+def _find_broken_host_links(root_path):
     find = subprocess.Popen(shlex.split("find %s -type l -! -exec test -e {} \; -print" % os.path.join(root_path, 'usr')),
                             stdout=subprocess.PIPE, stderr = subprocess.PIPE)
     find_stdout, stderr = find.communicate()
     if find.returncode != 0:
         utils.get_logger().warning(stderr.decode('utf-8').strip())
-        return
+        return None
+
+    return [link for link in find_stdout.decode('utf-8').strip().split('\n') if link]
+
+
+def _add_local_files_for_ual(container, paths=None):
+    """
+    Copies what symbolic links in the host side rootfs point to within the
+    container over to the host.  Only the links among the given container
+    paths are looked at, or every link in the rootfs without any.
+    """
+    root_path = utils.get_libertine_container_rootfs_path(container.name)
+    if paths is None:
+        broken_host_links = _find_broken_host_links(root_path)
+        if broken_host_links is None:
+            return
+    else:
+        host_paths = [os.path.join(root_path, path.lstrip('/')) for path in paths if path.startswith('/usr/')]
+        broken_host_links = [path for path in host_paths if os.path.islink(path) and not os.path.exists(path)]
 
-    broken_host_links = [link for link in find_stdout.decode('utf-8').strip().split('\n') if link]
     if len(broken_host_links) == 0:
         return # no broken links means no reason to continue
 
     broken_container_links = [link.replace(root_path, '') for link in broken_host_links]
-    links = subprocess.Popen(_lxc_args(container.name, 'bash -c "echo -n {} | xargs -d , -n 1 -I % bash -c \'readlink -e  % || echo\'"'.format(','.join(broken_container_links))),
-                             stdout=subprocess.PIPE)
-    links_stdout, stderr = links.communicate()
+    exit_code, links_stdout, stderr = _execute(container, 'bash -c "echo -n {} | xargs -d , -n 1 -I % bash -c \'readlink -e  % || echo\'"'.format(','.join(broken_container_links)))
 
-    container_link_endpoints = [link.strip() for link in links_stdout.decode('utf-8').split('\n')[:-1]]
+    container_link_endpoints = [link.strip() for link in links_stdout.split('\n')[:-1]]
 
     if len(broken_host_links) != len(container_link_endpoints):
         utils.get_logger().warning(utils._("Link mismatch while trying to fix symbolic links."))
@@ -249,46 +501,60 @@ def _add_local_files_for_ual(container):
                                                  .format(container_path=container_link_endpoints[i], error=str(e)))
                     continue
 
-        subprocess.Popen(_lxc_args(container.name, "ln -sf --relative {} {}".format(
-                                   container_link_endpoints[i],
-                                   broken_host_links[i].replace(root_path, '')))).wait()
+        _execute(container, "ln -sf --relative {} {}".format(container_link_endpoints[i],
+                                                             broken_host_links[i].replace(root_path, '')))
 
 
-def _remove_local_files_for_ual(container):
+def _remove_local_files_for_ual(container, paths=None):
+    """
+    Removes the files copied over to the host side rootfs which are gone
+    from the container.  Only the given container paths are looked at, or
+    every file in the rootfs without any.
+    """
     root_path = utils.get_libertine_container_rootfs_path(container.name)
-    find = subprocess.Popen(shlex.split("find {} -type f".format(root_path)), stdout=subprocess.PIPE)
-    find_stdout, stderr = find.communicate()
-    if find.returncode != 0:
-        utils.get_logger().warning(utils._("Finding local files to remove failed."))
-        return
+    if paths is None:
+        find = subprocess.Popen(shlex.split("find {} -type f".format(root_path)), stdout=subprocess.PIPE)
+        find_stdout, stderr = find.communicate()
+        if find.returncode != 0:
+            utils.get_logger().warning(utils._("Finding local files to remove failed."))
+            return
+
+        existing_files = [f.replace(root_path, '') for f in find_stdout.decode('UTF-8').strip().split('\n') if f]
+    else:
+        existing_files = [path for path in paths if os.path.isfile(os.path.join(root_path, path.lstrip('/')))
+                          and not os.path.islink(os.path.join(root_path, path.lstrip('/')))]
 
-    existing_files = [f.replace(root_path, '') for f in find_stdout.decode('UTF-8').strip().split('\n') if f]
     for d in  _CONTAINER_DATA_DIRS:
         existing_files = [f for f in existing_files if not f.startswith(d)]
     if len(existing_files) == 0:
         return
 
-    missing_files = subprocess.Popen(_lxc_args(container.name,
-                                               'bash -c "echo -n {} | xargs -d , -I % bash -c \'test -e % || echo %\'"'.format(','.join(existing_files))), stdout=subprocess.PIPE)
-    remove_stdout, stderr = missing_files.communicate()
-    if missing_files.returncode != 0:
+    exit_code, remove_stdout, stderr = _execute(container,
+                                                'bash -c "echo -n {} | xargs -d , -I % bash -c \'test -e % || echo %\'"'.format(','.join(existing_files)))
+    if exit_code != 0:
         utils.get_logger().warning(utils._("Checking for missing files failed."))
         return
 
-    for f in [os.path.join(root_path, f.lstrip('/')) for f in remove_stdout.decode('UTF-8').strip().split('\n') if f]:
+    removed = []
+    for f in [os.path.join(root_path, f.lstrip('/')) for f in remove_stdout.strip().split('\n') if f]:
         try:
             os.remove(f)
+            removed.append(f)
         except PermissionError as e:
             utils.get_logger().warning(utils._("Error while trying to remove local file {filepath}: {error}").format(filepath=f, error=str(e)))
 
     # now remove any dangling directories
-    empty_dirs = subprocess.Popen(shlex.split("find {} -depth -type d -empty".format(root_path)), stdout=subprocess.PIPE)
-    empty_out, stderr = empty_dirs.communicate()
-    if empty_dirs.returncode != 0:
-        utils.get_logger().warning(utils._("Looking for local empty directories failed."))
-        return
+    if paths is None:
+        empty_dirs = subprocess.Popen(shlex.split("find {} -depth -type d -empty".format(root_path)), stdout=subprocess.PIPE)
+        empty_out, stderr = empty_dirs.communicate()
+        if empty_dirs.returncode != 0:
+            utils.get_logger().warning(utils._("Looking for local empty directories failed."))
+            return
+
+        deleteable_dirs = [d for d in empty_out.decode('UTF-8').strip().split('\n') if d]
+    else:
+        deleteable_dirs = sorted(set(os.path.dirname(f) for f in removed), reverse=True)
 
-    deleteable_dirs = [d for d in empty_out.decode('UTF-8').strip().split('\n') if d]
     for d in _CONTAINER_DATA_DIRS:
         deleteable_dirs = [dd for dd in deleteable_dirs if not dd.startswith(os.path.join(root_path, d.lstrip('/')))]
 
@@ -296,34 +562,41 @@ def _remove_local_files_for_ual(container):
         subprocess.Popen(shlex.split("rmdir -p --ignore-fail-on-non-empty {}".format(d))).wait()
 
 
-def update_bind_mounts(container, config, home_path):
+def _get_bind_mount_devices(container, config, home_path, package_cache=None):
+    """
+    Returns the devices the container should have, keeping its root device,
+    and the host directories to create for them.  Nothing is changed on the
+    host.
+    """
     userdata_dir = utils.get_libertine_container_home_dir(container.name)
 
-    old_root = container.devices.get('root')
-    container.devices.clear()
-    if old_root:
-        container.devices['root'] = old_root
+    devices = {}
+    host_dirs = []
+    if container.devices.get('root'):
+        devices['root'] = container.devices['root']
 
-    container.devices['home'] = {'type': 'disk', 'path': home_path, 'source': userdata_dir}
+    devices['home'] = {'type': 'disk', 'path': home_path, 'source': userdata_dir}
 
     # applications and icons directories
     rootfs_path = utils.get_libertine_container_rootfs_path(container.name)
     for data_dir in _CONTAINER_DATA_DIRS:
         host_path = os.path.join(rootfs_path, data_dir.lstrip('/'))
-        os.makedirs(host_path, exist_ok=True)
-        container.devices[data_dir] = {'type': 'disk', 'path': data_dir, 'source': host_path}
+        host_dirs.append(host_path)
+        devices[data_dir] = {'type': 'disk', 'path': data_dir, 'source': host_path}
 
     if os.path.exists(os.path.join(home_path, '.config', 'dconf')):
-        container.devices['dconf'] = {
+        devices['dconf'] = {
             'type': 'disk',
             'source': os.path.join(home_path, '.config', 'dconf'),
             'path': os.path.join(home_path, '.config', 'dconf')
         }
 
+    devices['libertine-agents'] = _get_agents_device()
+
     run_user = '/run/user/{}'.format(os.getuid())
-    container.devices[run_user] = {'source': run_user, 'path': '/var/tmp{}'.format(run_user), 'type': 'disk'}
+    devices[run_user] = {'source': run_user, 'path': '/var/tmp{}'.format(run_user), 'type': 'disk'}
 
-    mounts = config.get_container_bind_mounts(container.name)
+    mounts = list(config.get_container_bind_mounts(container.name))
     if utils.is_snap_environment():
         mounts += [os.path.join(home_path, d) for d in ["Documents", "Downloads", "Music", "Videos", "Pictures"]]
     else:
@@ -338,19 +611,53 @@ def update_bind_mounts(container, config, home_path):
             path = user_dir[1]
         else:
             path = os.path.join(home_path, user_dir[1])
-            hostpath = os.path.join(userdata_dir, user_dir[1])
-            os.makedirs(hostpath, exist_ok=True)
+            host_dirs.append(os.path.join(userdata_dir, user_dir[1]))
 
         utils.get_logger().debug("Mounting {}:{} in container {}".format(user_dir[0], path, container.name))
 
-        container.devices[user_dir[1] or user_dir[0]] = {
+        devices[user_dir[1] or user_dir[0]] = {
                 'source': _readlink(user_dir[0]),
                 'path': path,
                 'optional': 'true',
                 'type': 'disk'
         }
 
-    _lxd_save(container, utils._("Saving bind mounts for container '{container_id}' raised:").format(container_id=container.name))
+    if package_cache is not None:
+        devices['package-cache'] = {'type': 'disk', 'source': package_cache.path, 'path': '/var/cache/apt/archives'}
+
+    return devices, host_dirs
+
+
+def update_bind_mounts(container, config, home_path, package_cache=None, dry_run=False):
+    """
+    Brings the devices of the container in line with its bind mounts,
+    saving the container only when any device actually changed, as that has
+    LXD reconfigure it.  Returns the names of the added, removed and changed
+    devices, which is all that happens with dry_run set.
+    """
+    devices, host_dirs = _get_bind_mount_devices(container, config, home_path, package_cache)
+
+    added = sorted(name for name in devices if name not in container.devices)
+    removed = sorted(name for name in container.devices if name not in devices)
+    changed = sorted(name for name in devices if name in container.devices and devices[name] != container.devices[name])
+
+    if dry_run:
+        return added, removed, changed
+
+    # The sources must exist even when the devices are unchanged, as the
+    # runtime directory is emptied between sessions
+    for host_dir in host_dirs:
+        os.makedirs(host_dir, exist_ok=True)
+    _make_agents_dir()
+    if package_cache is not None:
+        package_cache.prepare()
+
+    if added or removed or changed:
+        container.devices.clear()
+        container.devices.update(devices)
+        _lxd_save(container, utils._("Saving bind mounts for container '{container_id}' raised:").format(container_id=container.name))
+
+    return added, removed, changed
 
 
 def _setup_etc_hosts(container):
@@ -379,6 +686,17 @@ def update_libertine_profile(client):
         client.profiles.create('libertine', config={'raw.idmap': 'both 1000 1000'}, devices=_get_devices_map())
 
 
+def _lxd_image_alias(image):
+    return 'libertine-{}'.format(image.name)
+
+
+def delete_lxd_image(image):
+    try:
+        get_lxd_client().images.get_by_alias(_lxd_image_alias(image)).delete(wait=True)
+    except pylxd.exceptions.LXDAPIException:
+        pass
+
+
 def env_home_path():
     if utils.is_snap_environment():
         return '/home/{}'.format(os.environ['USER'])
@@ -390,12 +708,13 @@ class LibertineLXD(Libertine.BaseContainer):
         super().__init__(name, 'lxd', config, service)
         self._host_info = HostInfo.HostInfo()
         self._container = None
+        self._environ_path = None
         self._freeze_on_stop = config.get_freeze_on_stop(self.container_id)
 
         if not _setup_lxd():
             raise Exception("Failed to setup lxd.")
 
-        self._lxd_client = pylxd.Client()
+        self._lxd_client = get_lxd_client()
 
     def create_libertine_container(self, password=None, multiarch=False):
         if self._try_get_container():
@@ -416,7 +735,7 @@ class LibertineLXD(Libertine.BaseContainer):
 
         self._try_get_container()
         _sync_application_dirs_to_host(self._container)
-        update_bind_mounts(self._container, self._config, env_home_path())
+        update_bind_mounts(self._container, self._config, env_home_path(), self._get_package_cache())
 
         self.update_locale()
 
@@ -439,10 +758,11 @@ class LibertineLXD(Libertine.BaseContainer):
 
         self.update_packages()
 
+        utils.get_logger().info(utils._("Installing packages '{package_names}' in container '{container_id}'")
+                                  .format(package_names="', '".join(self.default_packages), container_id=self.container_id))
+        results = self.install_packages(self.default_packages, no_dialog=True, update_cache=False)
         for package in self.default_packages:
-            utils.get_logger().info(utils._("Installing package '{package_name}' in container '{container_id}'")
-                                      .format(package_name=package, container_id=self.container_id))
-            if not self.install_package(package, no_dialog=True, update_cache=False):
+            if not results[package]:
                 utils.get_logger().error(utils._("Failure installing '{package_name}' during container creation").format(package_name=package))
                 self.destroy_libertine_container()
                 return False
@@ -453,14 +773,101 @@ class LibertineLXD(Libertine.BaseContainer):
 
         return True
 
-    def install_package(self, package_name, no_dialog=False, update_cache=True):
-        ret = super().install_package(package_name, no_dialog, update_cache)
+    def clone_libertine_container(self, source_id):
+        # lxc copy shares the data with the source on copy-on-write storage pools
+        utils.get_logger().info(utils._("Copying container '{source_id}' to '{container_id}'")
+                                  .format(source_id=source_id, container_id=self.container_id))
+        copy = subprocess.Popen(shlex.split('lxc copy {source} {id}'.format(source=source_id, id=self.container_id)))
+        if copy.wait() != 0:
+            utils.get_logger().error(utils._("Copying container '{source_id}' failed with code '{error_code}'")
+                                       .format(source_id=source_id, error_code=copy.returncode))
+            return False
+
+        self._try_get_container()
+
+        # The application data synced from the source is just as valid for the copy
+        source_root = utils.get_libertine_container_rootfs_path(source_id)
+        if os.path.exists(source_root):
+            shutil.copytree(source_root, self.root_path, symlinks=True)
+
+        update_bind_mounts(self._container, self._config, env_home_path(), self._get_package_cache())
+        self._create_libertine_user_data_dir()
+
+        self._container.files.put('/etc/hostname', '{}\n'.format(self.container_id).encode('utf-8'))
+        _setup_etc_hosts(self._container)
+
+        return True
+
+    def capture_image(self, image):
+        if not self._try_get_container() or not lxd_stop(self._container):
+            return False
+
+        delete_lxd_image(image)
+
+        publish = subprocess.Popen(shlex.split('lxc publish {id} --alias {alias}'.format(
+                                               id=self.container_id, alias=_lxd_image_alias(image))))
+        if publish.wait() != 0:
+            utils.get_logger().error(utils._("Failed to store container as image '{image}'").format(image=image.name))
+            return False
+
+        image.username = os.environ['USER']
+        image.uid = os.getuid()
+        image.save()
+        return True
+
+    def create_from_image(self, image, password=None, multiarch=False):
+        utils.get_logger().info(utils._("Creating container '{container_id}' from image '{image}'")
+                                  .format(container_id=self.container_id, image=image.name))
+        create = subprocess.Popen(shlex.split('lxc launch {alias} {id} --profile default --profile libertine'.format(
+                                              alias=_lxd_image_alias(image), id=self.container_id)))
+        if create.wait() != 0:
+            utils.get_logger().error(utils._("Creating container '{container_id}' failed with code '{error_code}'")
+                                       .format(container_id=self.container_id, error_code=create.returncode))
+            return False
+
+        self._try_get_container()
+        _sync_application_dirs_to_host(self._container)
+        update_bind_mounts(self._container, self._config, env_home_path(), self._get_package_cache())
+
+        username = os.environ['USER']
+        uid = str(os.getuid())
+        if not self._rewrite_image_user(image, password):
+            utils.get_logger().error(utils._("Failed to set up the container user"))
+            self.destroy_libertine_container(force=True)
+            return False
+        self.run_in_container("mkdir -p /home/{}".format(username))
+        self.run_in_container("chown {0}:{0} /home/{0}".format(username))
+        self._container.files.put('/etc/hostname', '{}\n'.format(self.container_id).encode('utf-8'))
+
+        self._create_libertine_user_data_dir()
+
+        _setup_bind_mount_service(self._container, uid, username)
+        _setup_etc_hosts(self._container)
         _add_local_files_for_ual(self._container)
-        return ret
+
+        if multiarch and self.architecture == 'amd64':
+            utils.get_logger().info(utils._("Adding i386 multiarch support to container '{container_id}'").format(container_id=self.container_id))
+            self.run_in_container("dpkg --add-architecture i386")
+            self.update_packages()
+
+        lxd_stop(self._container)
+
+        return True
+
+    def install_packages(self, package_names, no_dialog=False, update_cache=True):
+        with _DpkgTransaction(self._container) as transaction:
+            results = super().install_packages(package_names, no_dialog, update_cache)
+
+        _add_local_files_for_ual(self._container, transaction.installed_files)
+        if transaction.removed_files != []:
+            _remove_local_files_for_ual(self._container, transaction.removed_files)
+        return results
 
     def remove_package(self, package_name):
-        ret = super().remove_package(package_name)
-        _remove_local_files_for_ual(self._container)
+        with _DpkgTransaction(self._container) as transaction:
+            ret = super().remove_package(package_name)
+
+        _remove_local_files_for_ual(self._container, transaction.removed_files)
         return ret
 
     def update_packages(self, update_locale=False):
@@ -470,12 +877,25 @@ class LibertineLXD(Libertine.BaseContainer):
             self.run_in_container("rm -f /etc/localtime")
             self.run_in_container("dpkg-reconfigure -f noninteractive tzdata")
 
-        update_bind_mounts(self._container, self._config, env_home_path())
+        update_bind_mounts(self._container, self._config, env_home_path(), self._get_package_cache())
+
+        with _DpkgTransaction(self._container) as transaction:
+            ret = super().update_packages(update_locale)
+
+        _add_local_files_for_ual(self._container, transaction.installed_files)
+        _remove_local_files_for_ual(self._container, transaction.removed_files)
+        return ret
+
+    def update_mounts(self, dry_run=False):
+        if not self._try_get_container():
+            return None
+
+        return update_bind_mounts(self._container, self._config, env_home_path(), self._get_package_cache(), dry_run)
+
+    def sync_local_files(self):
         _add_local_files_for_ual(self._container)
         _remove_local_files_for_ual(self._container)
 
-        return super().update_packages(update_locale)
-
     def destroy_libertine_container(self, force):
         if not self._try_get_container():
             utils.get_logger().error(utils._("No such container '{container_id}'").format(container_id=self.container_id))
@@ -495,31 +915,56 @@ class LibertineLXD(Libertine.BaseContainer):
         return self._delete_rootfs()
 
     def _timezone_in_sync(self):
-        proc = subprocess.Popen(self._lxc_args('cat /etc/timezone'), stdout=subprocess.PIPE)
-        out, err = proc.communicate()
-        return out.decode('UTF-8').strip('\n') == self._host_info.get_host_timezone()
+        if not self._try_get_container():
+            return False
+
+        exit_code, out, err = _execute(self._container, 'cat /etc/timezone')
+        return out.strip('\n') == self._host_info.get_host_timezone()
 
-    def _lxc_args(self, command, environ={}):
-        return _lxc_args(self.container_id, command, environ)
+    def _lxc_args(self, command, environ_path=None):
+        return _lxc_args(self.container_id, command, environ_path)
 
-    def run_in_container(self, command):
-        return subprocess.Popen(self._lxc_args(command, os.environ.copy())).wait()
+    def _run_in_container(self, command):
+        if not sys.stdin.isatty():
+            if not self._try_get_container():
+                return -1
 
-    def start_container(self, home=env_home_path()):
+            return _execute(self._container, command, dict(os.environ), stream=True)[0]
+
+        # The API has no terminal for apt and friends to prompt on
+        host_path, container_path = _write_environ(os.environ)
+        try:
+            return subprocess.Popen(self._lxc_args(command, container_path)).wait()
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(host_path)
+
+    def _start_agent_process(self, command):
+        return subprocess.Popen(self._lxc_args(command), stdin=subprocess.PIPE)
+
+    def _get_shared_dir(self):
+        # The container's own file system is out of the host user's reach
+        return _make_agents_dir(), _CONTAINER_AGENTS_DIR
+
+    def start_container(self, home=env_home_path(), wait_for_network=True):
         if not self._try_get_container():
             return False
 
         if not self._service.container_operation_start(self.container_id):
             return False
 
-        if self._container.status == 'Running':
-            return True
-
         requires_remount = self._container.status == 'Stopped'
 
         if requires_remount:
             update_libertine_profile(self._lxd_client)
-            update_bind_mounts(self._container, self._config, home)
+            update_bind_mounts(self._container, self._config, home, self._get_package_cache())
+        else:
+            # Containers started by an older libertine lack the directory the
+            # environment of commands is passed through
+            _share_agents_dir(self._container)
+
+        if self._container.status == 'Running':
+            return True
 
         self._config.update_container_install_status(self.container_id, "starting")
         if not lxd_start(self._container):
@@ -529,7 +974,7 @@ class LibertineLXD(Libertine.BaseContainer):
 
         self._config.update_container_install_status(self.container_id, "running")
 
-        if not _wait_for_network(self._container):
+        if wait_for_network and not _wait_for_network(self._container):
             utils.get_logger().warning(utils._("Network unavailable in container '{container_id}'").format(container_id=self.container_id))
 
         if requires_remount:
@@ -541,18 +986,26 @@ class LibertineLXD(Libertine.BaseContainer):
         if not self._try_get_container():
             return False
 
-        stopped = False
         self._config.refresh_database()
 
         if self._service.container_operation_finished(self.container_id, self._app_name, self._pid):
-            self._config.update_container_install_status(self.container_id, self._get_stop_type_string(self._freeze_on_stop))
+            self.shutdown_container()
 
-            if lxd_stop(self._container, freeze_on_stop=self._freeze_on_stop):
-                stopped = self._service.container_stopped(self.container_id)
+        return False
 
-            self._config.update_container_install_status(self.container_id, self._container.status.lower())
+    def shutdown_container(self):
+        if not self._try_get_container():
+            return False
 
-        return False
+        stopped = False
+        self._config.update_container_install_status(self.container_id, self._get_stop_type_string(self._freeze_on_stop))
+
+        if lxd_stop(self._container, freeze_on_stop=self._freeze_on_stop):
+            stopped = self._service.container_stopped(self.container_id)
+
+        self._config.update_container_install_status(self.container_id, self._container.status.lower())
+
+        return stopped
 
     def restart_container(self, wait=True):
         if not self._try_get_container():
@@ -575,12 +1028,14 @@ class LibertineLXD(Libertine.BaseContainer):
         if utils.is_snap_environment():
             environ['HOME'] = '/home/{}'.format(environ['USER'])
 
-        if not self.start_container(home=environ['HOME']):
+        if not self.start_container(home=environ['HOME'],
+                                    wait_for_network=self._config.get_wait_for_network(self.container_id)):
             return False
 
         self._app_name = app_exec_line[0]
 
-        args = self._lxc_args("sudo -E -u {} env PATH={}".format(environ['USER'], environ['PATH']), environ)
+        self._environ_path, container_path = _write_environ(environ)
+        args = self._lxc_args("sudo -E -u {} env PATH={}".format(environ['USER'], environ['PATH']), container_path)
 
         args.extend(app_exec_line)
 
@@ -592,6 +1047,10 @@ class LibertineLXD(Libertine.BaseContainer):
     def finish_application(self, app):
         app.wait()
 
+        if self._environ_path is not None:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._environ_path)
+
         self.stop_container()
 
     def copy_file_to_container(self, source, dest):
@@ -0,0 +1,121 @@
+# Copyright 2017 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import contextlib
+import fcntl
+import os
+
+from . import utils
+
+
+def get_package_cache_dir_path():
+    # The leading dot keeps the directory from clashing with a container id
+    return os.path.join(utils.get_libertine_containers_dir_path(), '.package-cache')
+
+
+class PackageCache(object):
+    """
+    A directory of downloaded Debian packages shared as /var/cache/apt/archives
+    by every container of the same distro and architecture which opted in.
+    APT runs against the cache are serialized with a lock file next to it, as
+    APT's own lock in the archives directory would make a concurrent run in
+    another container fail rather than wait.
+    """
+    def __init__(self, distro, architecture):
+        self.distro = distro
+        self.architecture = architecture
+        self.path = os.path.join(get_package_cache_dir_path(), distro, architecture)
+
+    def prepare(self):
+        """
+        Creates the cache.  Root in a container maps to a different host user
+        than the one owning the cache, so the directories are world writable.
+        """
+        for path in [self.path, os.path.join(self.path, 'partial')]:
+            os.makedirs(path, exist_ok=True)
+            os.chmod(path, 0o777)
+
+    @contextlib.contextmanager
+    def lock(self):
+        self.prepare()
+
+        with open(self.path + '.lock', 'w') as fd:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                yield self
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def packages(self):
+        """
+        Returns a list of (path, size, last use) for each package in the cache.
+        """
+        try:
+            names = [name for name in os.listdir(self.path) if name.endswith('.deb')]
+        except FileNotFoundError:
+            return []
+
+        packages = []
+        for name in names:
+            path = os.path.join(self.path, name)
+            with contextlib.suppress(FileNotFoundError):
+                stat = os.stat(path)
+                packages.append((path, stat.st_size, max(stat.st_atime, stat.st_mtime)))
+
+        return packages
+
+
+def get_package_caches():
+    root = get_package_cache_dir_path()
+
+    caches = []
+    for distro in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+        if not os.path.isdir(os.path.join(root, distro)):
+            continue
+
+        for architecture in sorted(os.listdir(os.path.join(root, distro))):
+            if os.path.isdir(os.path.join(root, distro, architecture)):
+                caches.append(PackageCache(distro, architecture))
+
+    return caches
+
+
+def prune_package_caches(max_size):
+    """
+    Deletes the least recently used packages from all shared package caches
+    until together they take up no more than max_size bytes.
+
+    :rtype: A tuple of the number of packages deleted and the bytes freed.
+    """
+    with contextlib.ExitStack() as stack:
+        packages = []
+        for cache in get_package_caches():
+            stack.enter_context(cache.lock())
+            packages += cache.packages()
+
+        total = sum(size for path, size, used in packages)
+        deleted = 0
+        freed = 0
+
+        for path, size, used in sorted(packages, key=lambda package: package[2]):
+            if total - freed <= max_size:
+                break
+
+            utils.get_logger().debug("Removing '{}' from the package cache".format(path))
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            deleted += 1
+            freed += size
+
+        return deleted, freed
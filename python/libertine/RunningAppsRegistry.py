@@ -0,0 +1,97 @@
+# Copyright 2017 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import contextlib
+import json
+import os
+import tempfile
+
+from . import utils
+from urllib.parse import quote
+
+
+def get_running_apps_dir(container_id=None):
+    path = os.path.join(utils.get_libertine_runtime_dir(), 'running-apps')
+
+    if container_id is not None:
+        path = os.path.join(path, container_id)
+
+    return path
+
+
+class RunningAppsRegistry(object):
+    """
+    Tracks the applications running in each container with one small file
+    per process under the libertine runtime directory.  The runtime directory
+    lives on tmpfs, so registering an app never rewrites ContainersConfig.json
+    and entries left behind by a crash are gone after a reboot.  Entries are
+    named after both the pid and the app, as apps may be registered without
+    a pid of their own.
+    """
+    def _get_entry_path(self, container_id, app_exec_name, pid):
+        return os.path.join(get_running_apps_dir(container_id), '{}-{}'.format(pid, quote(app_exec_name, safe='')))
+
+    def add(self, container_id, app_exec_name, pid):
+        directory = get_running_apps_dir(container_id)
+        os.makedirs(directory, exist_ok=True)
+
+        fd, temp_file = tempfile.mkstemp(prefix='.', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as temp:
+                json.dump({'appExecName': app_exec_name, 'pid': pid}, temp)
+
+            os.rename(temp_file, self._get_entry_path(container_id, app_exec_name, pid))
+        except:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temp_file)
+            raise
+
+    def remove(self, container_id, app_exec_name, pid):
+        """
+        Removes the entry for the given app and returns True if there was one.
+        """
+        try:
+            os.remove(self._get_entry_path(container_id, app_exec_name, pid))
+        except FileNotFoundError:
+            return False
+
+        return True
+
+    def find(self, container_id, app_exec_name, pid):
+        return self._read_entry(self._get_entry_path(container_id, app_exec_name, pid))
+
+    def get(self, container_id):
+        directory = get_running_apps_dir(container_id)
+        try:
+            names = [name for name in os.listdir(directory) if not name.startswith('.')]
+        except FileNotFoundError:
+            return []
+
+        apps = []
+        for name in names:
+            app = self._read_entry(os.path.join(directory, name))
+            if app is not None:
+                apps.append(app)
+
+        return sorted(apps, key=lambda app: (app['pid'], app['appExecName']))
+
+    def _read_entry(self, path):
+        try:
+            with open(path, 'r') as fd:
+                return json.load(fd)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            utils.get_logger().warning(utils._("Ignoring invalid running app entry '{path}'").format(path=path))
+            return None
@@ -15,7 +15,6 @@
 """Configure the libertine launcher."""
 
 import argparse
-import dbus
 import os
 import random
 import string
@@ -77,6 +76,8 @@ def _get_maliit_address_from_dbus():
     If there is no response from the D-Bus (let's just say there is no maliit
     server running) None is returned.
     """
+    import dbus
+
     try:
         address_bus_name    = 'org.maliit.server'
         address_object_path = '/org/maliit/server/address'
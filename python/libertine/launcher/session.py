@@ -23,7 +23,7 @@ import sys
 from .config import Config
 from .. import utils
 from contextlib import ExitStack, suppress
-from libertine.ContainersConfig import ContainersConfig
+from libertine.RunningAppsRegistry import RunningAppsRegistry
 from psutil import STATUS_ZOMBIE
 from socket import socket, AF_UNIX, SOCK_STREAM, SHUT_RDWR
 from .task import LaunchServiceTask, TaskType
@@ -255,20 +255,14 @@ class Session(ExitStack):
         return self._app != None
 
     def _add_running_app(self):
-        """Add a running app entry to ContainersConfig.json."""
+        """Register the app as running in its container."""
         if self._config.container_id:
-            ContainersConfig().add_running_app(self._config.container_id, self._config.exec_line[0], self._app.pid)
+            RunningAppsRegistry().add(self._config.container_id, self._config.exec_line[0], self._app.pid)
 
     def _remove_running_app(self):
-        """Remove a running app entry from ContainersConfig.json."""
+        """Remove the running app entry of the app."""
         if self._config.container_id:
-            containers_config = ContainersConfig()
-            running_app = containers_config.find_running_app_by_name_and_pid(self._config.container_id,
-                                                                             self._config.exec_line[0],
-                                                                             self._app.pid)
-
-            if running_app:
-                containers_config.delete_running_app(self._config.container_id, running_app)
+            RunningAppsRegistry().remove(self._config.container_id, self._config.exec_line[0], self._app.pid)
 
     def _create_bridge_listener(self, bridge_config):
         """Create a socket bridge listener for a socket bridge configuration.
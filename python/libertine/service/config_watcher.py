@@ -0,0 +1,77 @@
+# Copyright 2017 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+
+from gi.repository import Gio, GLib
+from libertine import utils
+
+
+# Writers replace ContainersConfig.json several times in quick succession
+# (e.g. the CLI updating package states), so wait for a quiet period before
+# reloading.
+RELOAD_DELAY_MS = 200
+
+
+class ConfigWatcher(object):
+    """
+    Watches the libertine database directory for changes to
+    ContainersConfig.json from the GLib main loop, reloads the given
+    ContainersConfig in the background and calls on_changed() whenever
+    its contents were changed by another process.
+    """
+    def __init__(self, config, on_changed=None):
+        self._config = config
+        self._on_changed = on_changed
+        self._filename = os.path.basename(utils.get_libertine_database_file_path())
+        self._reload_source = None
+
+        database_dir = utils.get_libertine_database_dir_path()
+        os.makedirs(database_dir, exist_ok=True)
+
+        self._monitor = Gio.File.new_for_path(database_dir).monitor_directory(Gio.FileMonitorFlags.WATCH_MOVES, None)
+        self._monitor.connect('changed', self._file_changed)
+        self._config.watch()
+        utils.get_logger().debug("watching '{}' for changes".format(database_dir))
+
+    def _file_changed(self, monitor, changed_file, other_file, event_type):
+        names = [f.get_basename() for f in (changed_file, other_file) if f is not None]
+        if self._filename not in names:
+            return
+
+        self._config.invalidate()
+        if self._reload_source is None:
+            self._reload_source = GLib.timeout_add(RELOAD_DELAY_MS, self._reload)
+
+    def _reload(self):
+        self._reload_source = None
+
+        try:
+            if self._config.refresh_database():
+                utils.get_logger().debug("ContainersConfig.json changed on disk")
+                if self._on_changed is not None:
+                    self._on_changed()
+        except Exception as e:
+            utils.get_logger().warning(utils._("Failed to reload ContainersConfig.json: {error}").format(error=str(e)))
+
+        return GLib.SOURCE_REMOVE
+
+    def stop(self):
+        if self._reload_source is not None:
+            GLib.source_remove(self._reload_source)
+            self._reload_source = None
+
+        self._monitor.cancel()
+        self._config.watch(False)
@@ -54,7 +54,7 @@ class Container(object):
     def tasks(self):
         return [task.id for task in self._tasks if task.running]
 
-    def install(self, package_name):
+    def install(self, package_name, refresh=False):
         utils.get_logger().debug("Install package '%s' from container '%s'" % (package_name, self.id))
 
         tasks = [t for t in self._tasks if t.matches(package_name, InstallTask) and t.running]
@@ -62,7 +62,8 @@ class Container(object):
             utils.get_logger().debug("Install already in progress for '%s':'%s'" % (package_name, self.id))
             return tasks[0].id
 
-        task = InstallTask(package_name, self.id, self._config, self._lock, self._monitor, self._client, self._cleanup_task)
+        task = InstallTask(package_name, self.id, self._config, self._lock, self._monitor, self._client, self._cleanup_task,
+                           refresh=refresh)
         self._tasks.append(task)
         task.start()
         return task.id
@@ -94,6 +95,20 @@ class Container(object):
         task.start()
         return task.id
 
+    def clone(self, source_id, container_name):
+        utils.get_logger().debug("Clone container '%s' with ID '%s'" % (source_id, self.id))
+
+        tasks = [t for t in self._tasks if t.matches(self.id, CloneTask) and t.running]
+        if len(tasks) > 0:
+            utils.get_logger().debug("Clone already in progress for '%s'" % self.id)
+            return tasks[0].id
+
+        task = CloneTask(self.id, source_id, container_name,
+                         self._config, self._lock, self._monitor, self._client, self._cleanup_task)
+        self._tasks.append(task)
+        task.start()
+        return task.id
+
     def destroy(self):
         utils.get_logger().debug("Destroy container with ID '%s'" % self.id)
 
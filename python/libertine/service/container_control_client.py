@@ -15,19 +15,23 @@
 
 import libertine.ContainersConfig
 import psutil
+import threading
 
 from collections import Counter
+from gi.repository import GLib
 from libertine import utils
 
 
 class ContainerControlClient(object):
     def __init__(self):
+        self._idle_timers = dict()
+        self._lock = threading.Lock()
         self._get_running_apps_per_container()
 
     def _get_running_apps_per_container(self):
         self._invalid_apps = dict()
         self._operations = Counter()
-        config = libertine.ContainersConfig.ContainersConfig()
+        self._config = config = libertine.ContainersConfig.ContainersConfig()
 
         for container in config.get_containers():
             running_apps = config.get_running_apps(container).copy()
@@ -49,27 +53,92 @@ class ContainerControlClient(object):
                     continue
 
     def container_operation_start(self, container):
-        if self._operations[container] == -1:
-            return False
+        with self._lock:
+            if self._operations[container] == -1:
+                return False
 
-        self._operations[container] += 1
+            self._cancel_idle_stop(container)
+            self._operations[container] += 1
 
         return True
 
     def container_operation_finished(self, container, app_name, pid):
-        if container in self._invalid_apps and {app_name, pid} in self._invalid_apps[container]:
-            self._invalid_apps[container].remove({app_name, pid})
-            if not self._invalid_apps[container]:
-                del self._invalid_apps[container]
-        else:
-            self._operations[container] -= 1
-
-        if self._operations[container] == 0:
-            self._operations[container] = -1
-            return True
+        with self._lock:
+            if container in self._invalid_apps and {app_name, pid} in self._invalid_apps[container]:
+                self._invalid_apps[container].remove({app_name, pid})
+                if not self._invalid_apps[container]:
+                    del self._invalid_apps[container]
+            else:
+                self._operations[container] -= 1
+
+            if self._operations[container] == 0:
+                idle_timeout = self._get_idle_timeout(container)
+                if idle_timeout > 0:
+                    # Keep the container for whoever comes next and stop it ourselves later
+                    utils.get_logger().debug("keeping container '{}' for {} seconds".format(container, idle_timeout))
+                    self._cancel_idle_stop(container)
+                    self._idle_timers[container] = GLib.timeout_add_seconds(idle_timeout, self._idle_timeout_expired, container)
+                    return False
+
+                self._operations[container] = -1
+                return True
 
         return False
 
     def container_stopped(self, container):
-        del self._operations[container]
+        with self._lock:
+            del self._operations[container]
         return True
+
+    def shutdown_idle_containers(self):
+        """
+        Stops the containers kept running for their idle timeout right away.
+        """
+        with self._lock:
+            containers = list(self._idle_timers.keys())
+            for container in containers:
+                self._cancel_idle_stop(container)
+                self._operations[container] = -1
+
+        for container in containers:
+            self._shutdown_container(container)
+
+    def _get_idle_timeout(self, container):
+        try:
+            self._config.refresh_database()
+            return int(self._config.get_idle_timeout(container))
+        except Exception as e:
+            utils.get_logger().warning(utils._("Failed to read the idle timeout of container '{container_id}': {error}")
+                                       .format(container_id=container, error=str(e)))
+            return 0
+
+    def _cancel_idle_stop(self, container):
+        if container in self._idle_timers:
+            GLib.source_remove(self._idle_timers.pop(container))
+
+    def _idle_timeout_expired(self, container):
+        with self._lock:
+            self._idle_timers.pop(container, None)
+            if self._operations[container] != 0:
+                return GLib.SOURCE_REMOVE
+
+            self._operations[container] = -1
+
+        # Stopping takes a while, so keep the main loop free for D-Bus calls
+        threading.Thread(target=self._shutdown_container, args=(container,)).start()
+        return GLib.SOURCE_REMOVE
+
+    def _shutdown_container(self, container):
+        utils.get_logger().debug("stopping idle container '{}'".format(container))
+
+        try:
+            from libertine.Libertine import LibertineContainer
+            LibertineContainer(container, libertine.ContainersConfig.ContainersConfig(), self).container.shutdown_container()
+        except Exception as e:
+            utils.get_logger().error(utils._("Failed to stop idle container '{container_id}': {error}")
+                                     .format(container_id=container, error=str(e)))
+        finally:
+            # Let the container be started again even if stopping it failed
+            with self._lock:
+                if self._operations[container] == -1:
+                    del self._operations[container]
@@ -26,6 +26,7 @@ class Download(dbus.service.Object):
         self._finished = False
         self._result = ''
         self._error = ''
+        self._status = ''
         dbus.service.Object.__init__(self, conn=connection, object_path=(constants.DOWNLOAD_OBJECT % id))
 
         # Disabled until something requires the Download interface
@@ -54,9 +55,16 @@ class Download(dbus.service.Object):
     def last_error(self):
         return self._error
 
+    @property
+    def last_status(self):
+        return self._status
+
     def data(self, message):
         self._result += message + '\n'
 
+    def status(self, message):
+        self._status = message
+
     # Signals to satisfy the download interface
 
     @dbus.service.signal(constants.DOWNLOAD_INTERFACE, signature='o')
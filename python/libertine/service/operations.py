@@ -26,6 +26,16 @@ class Operations(dbus.service.Object):
 
         self._dispatcher = task_dispatcher.TaskDispatcher(operations_monitor.OperationsMonitor(self.connection), client)
 
+    @property
+    def config(self):
+        return self._dispatcher.config
+
+    # Signals
+
+    @dbus.service.signal(constants.OPERATIONS_INTERFACE)
+    def containers_changed(self):
+        utils.get_logger().debug("emit containers_changed()")
+
     # Information
 
     @dbus.service.method(constants.OPERATIONS_INTERFACE,
@@ -71,6 +81,13 @@ class Operations(dbus.service.Object):
         utils.get_logger().debug("create('{}', '{}', '{}', '{}', '{}')".format(container_id, container_name, distro, container_type, enable_multiarch))
         return self._dispatcher.create(container_id, container_name, distro, container_type, enable_multiarch)
 
+    @dbus.service.method(constants.OPERATIONS_INTERFACE,
+                         in_signature='sss',
+                         out_signature='o')
+    def clone(self, source_id, container_id, container_name=''):
+        utils.get_logger().debug("clone('{}', '{}', '{}')".format(source_id, container_id, container_name))
+        return self._dispatcher.clone(source_id, container_id, container_name)
+
     @dbus.service.method(constants.OPERATIONS_INTERFACE,
                          in_signature='s',
                          out_signature='o')
@@ -92,6 +109,13 @@ class Operations(dbus.service.Object):
         utils.get_logger().debug("install('%s', '%s')" % (container_id, package_name))
         return self._dispatcher.install(container_id, package_name)
 
+    @dbus.service.method(constants.OPERATIONS_INTERFACE,
+                         in_signature='ssa{sv}',
+                         out_signature='o')
+    def install_with_options(self, container_id, package_name, options):
+        utils.get_logger().debug("install_with_options('%s', '%s', %s)" % (container_id, package_name, dict(options)))
+        return self._dispatcher.install(container_id, package_name, refresh=bool(options.get('refresh', False)))
+
     @dbus.service.method(constants.OPERATIONS_INTERFACE,
                          in_signature='ss',
                          out_signature='o')
@@ -68,6 +68,18 @@ class OperationsMonitor(dbus.service.Object):
         if op:
             op.data(message)
 
+    @dbus.service.signal(constants.OPERATIONS_MONITOR_INTERFACE, signature='os')
+    def status(self, path, message):
+        op = self._operation(path)
+        if op:
+            op.status(message)
+
+    @dbus.service.signal(constants.OPERATIONS_MONITOR_INTERFACE, signature='ott')
+    def progress(self, path, received, total):
+        op = self._operation(path)
+        if op:
+            op.progress(received, total)
+
     @dbus.service.method(constants.OPERATIONS_MONITOR_INTERFACE, in_signature='o', out_signature='b')
     def running(self, path):
         op = self._operation(path)
@@ -91,3 +103,11 @@ class OperationsMonitor(dbus.service.Object):
             return op.last_error
         else:
             return ''
+
+    @dbus.service.method(constants.OPERATIONS_MONITOR_INTERFACE, in_signature='o', out_signature='s')
+    def last_status(self, path):
+        op = self._operation(path)
+        if op:
+            return op.last_status
+        else:
+            return ''
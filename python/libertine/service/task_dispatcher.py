@@ -28,6 +28,10 @@ class TaskDispatcher(object):
         self._tasks = []
         self._containers = []
 
+    @property
+    def config(self):
+        return self._config
+
     def _cleanup_task(self, task):
         utils.get_logger().debug("cleaning up containerless task '%s'" % task.id)
         if task in self._tasks:
@@ -66,9 +70,9 @@ class TaskDispatcher(object):
         utils.get_logger().debug("dispatching app_info in container '%s' for package '%s'" % (container_id, app_id))
         return self._find_or_create_container(container_id).app_info(app_id)
 
-    def install(self, container_id, package_name):
+    def install(self, container_id, package_name, refresh=False):
         utils.get_logger().debug("dispatching install of package '%s' from container '%s'" % (package_name, container_id))
-        return self._find_or_create_container(container_id).install(package_name)
+        return self._find_or_create_container(container_id).install(package_name, refresh)
 
     def remove(self, container_id, package_name):
         utils.get_logger().debug("dispatching remove of package '%s' from container '%s'" % (package_name, container_id))
@@ -78,6 +82,10 @@ class TaskDispatcher(object):
         utils.get_logger().debug("dispatching create of container '%s'" % container_id)
         return self._find_or_create_container(container_id).create(container_name, distro, container_type, enable_multiarch)
 
+    def clone(self, source_id, container_id, container_name):
+        utils.get_logger().debug("dispatching clone of container '%s' to '%s'" % (source_id, container_id))
+        return self._find_or_create_container(container_id).clone(source_id, container_name)
+
     def destroy(self, container_id):
         utils.get_logger().debug("dispatching destroy container '%s'" % container_id)
         return self._find_or_create_container(container_id).destroy()
@@ -14,6 +14,7 @@
 
 from .base_task import BaseTask, ContainerBaseTask
 from .app_info_task import AppInfoTask
+from .clone_task import CloneTask
 from .container_info_task import ContainerInfoTask
 from .create_task import CreateTask
 from .destroy_task import DestroyTask
@@ -27,6 +28,7 @@ from .list_app_ids_task import ListAppIdsTask
 __all__ = [
           'AppInfoTask',
           'BaseTask',
+          'CloneTask',
           'ContainerBaseTask',
           'ContainerInfoTask',
           'CreateTask',
@@ -16,6 +16,8 @@
 import threading
 
 from abc import ABCMeta, abstractmethod
+from gi.repository import GLib
+from libertine.AptProgress import overall_percent
 
 
 class BaseTask(metaclass=ABCMeta):
@@ -115,3 +117,17 @@ class ContainerBaseTask(BaseTask):
     def __init__(self, lock, container_id, config, monitor, client, callback):
         super().__init__(lock=lock, container_id=container_id, config=config, monitor=monitor, callback=callback)
         self._client = client
+
+    def _apt_progress(self, status, percent, message):
+        """
+        Reports the progress of apt in the container: the percentage of the
+        whole run as progress, and the apt status line as the status, which
+        replaces the previous one.  This is called from the thread reading
+        apt's status, so the signals are emitted from the main loop.
+        """
+        GLib.idle_add(self._report_apt_progress, status, percent, message)
+
+    def _report_apt_progress(self, status, percent, message):
+        self._monitor.progress(self._operation_id, int(overall_percent(status, percent)), 100)
+        self._monitor.status(self._operation_id, "%s:%d:%s" % (status, percent, message))
+        return GLib.SOURCE_REMOVE
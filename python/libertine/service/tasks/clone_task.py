@@ -0,0 +1,60 @@
+# Copyright 2017 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from .base_task import ContainerBaseTask
+from libertine import LibertineContainer, utils
+
+
+class CloneTask(ContainerBaseTask):
+    def __init__(self, container_id, source_id, container_name, config, lock, monitor, client, callback):
+        super().__init__(lock=lock, container_id=container_id, config=config,
+                         monitor=monitor, client=client, callback=callback)
+        self._source = source_id
+        self._name = container_name
+
+    def _run(self):
+        utils.get_logger().debug("Cloning container '%s' from '%s'" % (self._container, self._source))
+
+        try:
+            container = LibertineContainer(self._container, self._config, self._client)
+
+            if not container.clone_libertine_container(self._source):
+                self._config.delete_container(self._container)
+                self._error("Cloning container '%s' failed" % self._container)
+            else:
+                self._config.update_container_install_status(self._container, "ready")
+                self._finished()
+        except RuntimeError as e:
+            self._config.delete_container(self._container)
+            self._error(str(e))
+
+    def _before(self):
+        utils.get_logger().debug("CloneTask::_before")
+        if self._config.container_exists(self._container):
+            self._error("Container '%s' already exists" % self._container)
+            return False
+
+        if self._config.get_container_install_status(self._source) != 'ready':
+            self._error("Container '%s' does not exist" % self._source)
+            return False
+
+        if not self._name:
+            self._name = "%s (%s)" % (self._config.get_container_name(self._source), self._container)
+
+        with self._config.transaction():
+            self._config.clone_container(self._source, self._container, self._name)
+            self._config.update_container_install_status(self._container, 'installing')
+
+        return True
@@ -32,7 +32,7 @@ class CreateTask(ContainerBaseTask):
         utils.get_logger().debug("Creating container '%s'" % self._container)
 
         try:
-            container = LibertineContainer(self._container, self._config, self._client)
+            container = LibertineContainer(self._container, self._config, self._client, self._apt_progress)
 
             if not container.create_libertine_container(password='', multiarch=self._multiarch):
                 self._config.delete_container(self._container)
@@ -68,10 +68,12 @@ class CreateTask(ContainerBaseTask):
         if not self._name:
             self._name = "Ubuntu \'" + info.get_distro_codename(self._distro) + "\'"
 
-        self._config.add_new_container(self._container, self._name, self._type, self._distro)
+        with self._config.transaction():
+            self._config.add_new_container(self._container, self._name, self._type, self._distro)
 
-        if self._multiarch:
-            self._config.update_container_multiarch_support(self._container, 'enabled')
+            if self._multiarch:
+                self._config.update_container_multiarch_support(self._container, 'enabled')
+
+            self._config.update_container_install_status(self._container, 'installing')
 
-        self._config.update_container_install_status(self._container, 'installing')
         return True
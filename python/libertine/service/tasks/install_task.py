@@ -18,10 +18,11 @@ from libertine import LibertineContainer, utils
 
 
 class InstallTask(ContainerBaseTask):
-    def __init__(self, package_name, container_id, config, lock, monitor, client, callback):
+    def __init__(self, package_name, container_id, config, lock, monitor, client, callback, refresh=False):
         super().__init__(lock=lock, container_id=container_id, config=config,
                          monitor=monitor, client=client, callback=callback)
         self._package = package_name
+        self._refresh = refresh
 
     def matches(self, package, klass):
         return self._package == package and self.__class__ == klass
@@ -32,12 +33,11 @@ class InstallTask(ContainerBaseTask):
 
     def _run(self):
         utils.get_logger().debug("Installing package '%s'" % self._package)
-        container = LibertineContainer(self._container, self._config, self._client)
-        if container.install_package(self._package):
-            self._config.update_package_install_status(self._container, self._package, "installed")
+        # The container records the outcome of the install in the config
+        container = LibertineContainer(self._container, self._config, self._client, self._apt_progress)
+        if container.install_package(self._package, refresh=self._refresh):
             self._finished()
         else:
-            self._config.delete_package(self._container, self._package)
             self._error("Package installation failed for '%s'" % self._package)
 
     def _before(self):
@@ -46,6 +46,7 @@ class InstallTask(ContainerBaseTask):
             self._error("Package '%s' already exists, skipping install" % self._package)
             return False
         else:
-            self._config.add_new_package(self._container, self._package)
-            self._config.update_package_install_status(self._container, self._package, "installing")
+            with self._config.transaction():
+                self._config.add_new_package(self._container, self._package)
+                self._config.update_package_install_status(self._container, self._package, "installing")
             return True
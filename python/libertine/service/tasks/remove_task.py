@@ -31,12 +31,11 @@ class RemoveTask(ContainerBaseTask):
 
     def _run(self):
         utils.get_logger().debug("Removing package '%s'" % self._package)
-        container = LibertineContainer(self._container, self._config, self._client)
+        # The container records the outcome of the removal in the config
+        container = LibertineContainer(self._container, self._config, self._client, self._apt_progress)
         if container.remove_package(self._package):
-            self._config.delete_package(self._container, self._package)
             self._finished()
         else:
-            self._config.update_package_install_status(self._container, self._package, 'installed')
             self._error("Package removal failed for '%s'" % self._package)
 
     def _before(self):
@@ -24,7 +24,7 @@ class UpdateTask(ContainerBaseTask):
 
     def _run(self):
         utils.get_logger().debug("Updating container '%s'" % self._container)
-        container = LibertineContainer(self._container, self._config, self._client)
+        container = LibertineContainer(self._container, self._config, self._client, self._apt_progress)
         self._config.update_container_install_status(self._container, "updating")
         if not container.update_libertine_container():
             self._error("Failed to update container '%s'" % self._container)
@@ -17,7 +17,6 @@
 
 import logging
 import os
-import psutil
 import shlex
 import subprocess
 import xdg.BaseDirectory as basedir
@@ -95,6 +94,10 @@ def get_libertine_database_file_path():
     return os.path.join(get_libertine_database_dir_path(), 'ContainersConfig.json')
 
 
+def get_libertine_sqlite_database_file_path():
+    return os.path.join(get_libertine_database_dir_path(), 'ContainersConfig.db')
+
+
 def get_libertine_container_home_dir(container_id):
     path = os.path.join(basedir.xdg_data_home, 'libertine-container', 'user-data', container_id)
 
@@ -136,13 +139,28 @@ def generate_binding_directories(dirs, prefix):
     return binding_dirs
 
 
+# The user directories xdg-user-dir resolved along with the modification
+# time of user-dirs.dirs at that point
+_xdg_user_directories = None
+
+
 def get_common_xdg_user_directories():
-    dirs = []
-    for dir in ['DOCUMENTS', 'MUSIC', 'PICTURES', 'VIDEOS', 'DOWNLOAD']:
-        xdg = subprocess.Popen(["xdg-user-dir", dir], stdout=subprocess.PIPE)
-        stdout, stderr = xdg.communicate()
-        dirs.append(stdout.decode('utf-8').strip())
-    return dirs
+    global _xdg_user_directories
+
+    try:
+        stamp = os.stat(os.path.join(basedir.xdg_config_home, 'user-dirs.dirs')).st_mtime_ns
+    except OSError:
+        stamp = None
+
+    if _xdg_user_directories is None or _xdg_user_directories[0] != stamp:
+        dirs = []
+        for dir in ['DOCUMENTS', 'MUSIC', 'PICTURES', 'VIDEOS', 'DOWNLOAD']:
+            xdg = subprocess.Popen(["xdg-user-dir", dir], stdout=subprocess.PIPE)
+            stdout, stderr = xdg.communicate()
+            dirs.append(stdout.decode('utf-8').strip())
+        _xdg_user_directories = (stamp, dirs)
+
+    return list(_xdg_user_directories[1])
 
 
 def get_libertine_lxc_pulse_socket_path():
@@ -161,6 +179,8 @@ def refresh_libertine_scope():
 
 
 def set_session_dbus_env_var():
+    import psutil
+
     dbus_session_set = 'SESSION' in os.environ
 
     try:
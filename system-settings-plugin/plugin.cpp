@@ -26,6 +26,7 @@
 #include <memory>
 #include <QQmlEngine>
 #include <QQmlContext>
+#include <QFileInfo>
 #include <QFileSystemWatcher>
 #include <SystemSettings/ItemBase>
 
@@ -62,12 +63,15 @@ LibertineItem(const QVariantMap &staticData, QObject *parent)
   , container_apps_(new ContainerAppsList(containers_, this))
   , container_archives_(new ContainerArchivesList(containers_, this))
   , container_operation_details_(new ContainerOperationDetails(this))
-  , watcher_({config_->containers_config_file_name()})
+  // Writers replace the file, so its directory is watched for the new one
+  , watcher_({QFileInfo(config_->containers_config_file_name()).absolutePath(),
+              config_->containers_config_file_name()})
 {
   qmlRegisterType<ContainerManagerWorker>("Libertine", 1, 0, "ContainerManagerWorker");
   qmlRegisterType<ContainerOperationDetails>("Libertine", 1, 0, "ContainerOperationDetails");
 
   connect(&watcher_, &QFileSystemWatcher::fileChanged, this, &LibertineItem::reload_config);
+  connect(&watcher_, &QFileSystemWatcher::directoryChanged, this, &LibertineItem::reload_config);
 }
 
 QQmlComponent *LibertineItem::
@@ -87,9 +91,21 @@ pageComponent(QQmlEngine *engine, QObject *parent)
 
 
 void LibertineItem::
-reload_config(QString const&)
+reload_config(QString const& path)
 {
-  containers_->reloadConfigs();
+  auto config_file = config_->containers_config_file_name();
+
+  // A replaced file is no longer watched
+  bool replaced = !watcher_.files().contains(config_file) && QFileInfo::exists(config_file);
+  if (replaced)
+  {
+    watcher_.addPath(config_file);
+  }
+
+  if (replaced || path == config_file)
+  {
+    containers_->reloadConfigs();
+  }
 }
 
 
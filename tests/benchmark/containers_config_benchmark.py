@@ -0,0 +1,282 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# Copyright 2017 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Times ContainersConfig operations against synthetic databases of growing
+size and reports ops/sec with p50/p99 latencies.  Results can be saved as a
+baseline and later runs compared against it.
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+
+def _percentile(latencies, percentile):
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+class Result(object):
+    def __init__(self, operation, containers, packages, latencies, elapsed=None):
+        self.operation = operation
+        self.containers = containers
+        self.packages = packages
+        self.ops_per_sec = len(latencies) / (elapsed or sum(latencies))
+        self.p50 = _percentile(latencies, 50)
+        self.p99 = _percentile(latencies, 99)
+
+    @property
+    def key(self):
+        return '{}/{}/{}'.format(self.operation, self.containers, self.packages)
+
+    def __str__(self):
+        return '{:<32} {:>10} {:>10} {:>12.1f} {:>10.3f} {:>10.3f}'.format(
+                   self.operation, self.containers, self.packages, self.ops_per_sec, self.p50 * 1000, self.p99 * 1000)
+
+
+def _header():
+    return '{:<32} {:>10} {:>10} {:>12} {:>10} {:>10}'.format(
+               'operation', 'containers', 'packages', 'ops/sec', 'p50 (ms)', 'p99 (ms)')
+
+
+def _timed(func, iterations, setup=None):
+    latencies = []
+    for i in range(iterations):
+        if setup:
+            setup(i)
+
+        start = time.perf_counter()
+        func(i)
+        latencies.append(time.perf_counter() - start)
+
+    return latencies
+
+
+def _container_id(index):
+    return 'container-{}'.format(index)
+
+
+def _package_name(index):
+    return 'package-{}'.format(index)
+
+
+def generate_database(containers, packages):
+    """
+    Writes a ContainersConfig.json holding the given number of containers,
+    with the given total number of packages spread evenly across them.
+    """
+    from libertine.ContainersConfig import write_container_config_file
+
+    container_list = []
+    for c in range(containers):
+        apps = [{'packageName': _package_name(p), 'appStatus': 'installed'}
+                for p in range(c, packages, containers)]
+        container_list.append({'id': _container_id(c), 'name': 'Container {}'.format(c), 'type': 'chroot',
+                               'distro': 'xenial', 'installStatus': 'ready', 'installedApps': apps,
+                               'extraArchives': [], 'bindMounts': []})
+
+    write_container_config_file({'defaultContainer': _container_id(0), 'containerList': container_list})
+
+
+def _random_package(containers, packages):
+    p = random.randrange(packages)
+    return _container_id(p % containers), _package_name(p)
+
+
+def bench_refresh_unchanged(config, containers, packages, iterations):
+    return _timed(lambda i: config.refresh_database(), iterations)
+
+
+def bench_refresh_reload(config, containers, packages, iterations):
+    from libertine.ContainersConfig import ContainersConfig
+
+    other = ContainersConfig()
+    statuses = ['ready', 'updating']
+
+    def change(i):
+        other.update_container_install_status(_container_id(0), statuses[i % 2])
+
+    return _timed(lambda i: config.refresh_database(), iterations, setup=change)
+
+
+def bench_package_exists(config, containers, packages, iterations):
+    lookups = [_random_package(containers, packages) for i in range(iterations)]
+    return _timed(lambda i: config.package_exists(*lookups[i]), iterations)
+
+
+def bench_update_package_install_status(config, containers, packages, iterations):
+    lookups = [_random_package(containers, packages) for i in range(iterations)]
+    statuses = ['installed', 'removing']
+    return _timed(lambda i: config.update_package_install_status(*lookups[i], statuses[i % 2]), iterations)
+
+
+def bench_add_running_app(config, containers, packages, iterations):
+    return _timed(lambda i: config.add_running_app(_container_id(i % containers), 'app-{}'.format(i), 100000 + i),
+                  iterations)
+
+
+def _concurrent_writer(writer, containers, packages, iterations, barrier, queue):
+    from libertine.ContainersConfig import ContainersConfig
+
+    random.seed(writer)
+    config = ContainersConfig()
+    lookups = [_random_package(containers, packages) for i in range(iterations)]
+    statuses = ['installed', 'removing']
+
+    barrier.wait()
+    try:
+        queue.put(_timed(lambda i: config.update_package_install_status(*lookups[i], statuses[i % 2]), iterations))
+    except Exception as e:
+        queue.put(e)
+        raise
+
+
+def bench_concurrent_writers(containers, packages, iterations, writers):
+    context = multiprocessing.get_context('fork')
+    barrier = context.Barrier(writers + 1)
+    queue = context.Queue()
+    processes = [context.Process(target=_concurrent_writer, args=(w, containers, packages, iterations, barrier, queue))
+                 for w in range(writers)]
+
+    for process in processes:
+        process.start()
+
+    barrier.wait()
+    start = time.perf_counter()
+    results = [queue.get() for process in processes]
+    elapsed = time.perf_counter() - start
+
+    for process in processes:
+        process.join()
+
+    for result in results:
+        if isinstance(result, Exception):
+            raise RuntimeError("Concurrent writer failed: {}".format(result))
+
+    return list(itertools.chain.from_iterable(results)), elapsed
+
+
+BENCHMARKS = [
+    ('refresh_database (unchanged)', bench_refresh_unchanged),
+    ('refresh_database (reload)', bench_refresh_reload),
+    ('package_exists', bench_package_exists),
+    ('update_package_install_status', bench_update_package_install_status),
+    ('add_running_app', bench_add_running_app),
+]
+
+
+def run(containers, packages, iterations, writers):
+    from libertine.ContainersConfig import ContainersConfig
+
+    generate_database(containers, packages)
+
+    results = []
+    for name, benchmark in BENCHMARKS:
+        config = ContainersConfig()
+        results.append(Result(name, containers, packages, benchmark(config, containers, packages, iterations)))
+        print(results[-1], flush=True)
+
+    if writers:
+        latencies, elapsed = bench_concurrent_writers(containers, packages, iterations, writers)
+        results.append(Result('concurrent writers (x{})'.format(writers), containers, packages, latencies, elapsed))
+        print(results[-1], flush=True)
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the results whose ops/sec fell more than tolerance (a fraction)
+    below the baseline.
+    """
+    regressions = []
+    for result in results:
+        expected = baseline.get(result.key)
+        if expected is not None and result.ops_per_sec < expected * (1 - tolerance):
+            regressions.append((result, expected))
+
+    return regressions
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ContainersConfig against synthetic databases.")
+    parser.add_argument('-c', '--containers', type=_int_list, default=[1, 10, 100, 1000],
+                        help="Comma separated numbers of containers to generate.")
+    parser.add_argument('-p', '--packages', type=_int_list, default=[10, 100, 1000, 10000],
+                        help="Comma separated total numbers of packages to generate.")
+    parser.add_argument('-n', '--iterations', type=int, default=50,
+                        help="Operations timed per benchmark and per concurrent writer.")
+    parser.add_argument('-w', '--writers', type=int, default=4,
+                        help="Number of concurrent writer processes, 0 to skip.")
+    parser.add_argument('--sqlite', action='store_true',
+                        help="Use the SQLite backend.")
+    parser.add_argument('--save-baseline', metavar='FILE',
+                        help="Store the results as a baseline in FILE.")
+    parser.add_argument('--baseline', metavar='FILE',
+                        help="Fail if any result is slower than the baseline in FILE.")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Fraction by which ops/sec may drop below the baseline.")
+    args = parser.parse_args()
+
+    working_dir = tempfile.mkdtemp()
+    os.environ['XDG_DATA_HOME'] = os.path.join(working_dir, 'data')
+    os.environ['XDG_RUNTIME_DIR'] = os.path.join(working_dir, 'runtime')
+    if args.sqlite:
+        os.environ['LIBERTINE_DATABASE'] = 'sqlite'
+
+    results = []
+    print(_header())
+    try:
+        for containers, packages in itertools.product(args.containers, args.packages):
+            for name in os.listdir(working_dir):
+                shutil.rmtree(os.path.join(working_dir, name))
+            os.mkdir(os.environ['XDG_RUNTIME_DIR'], 0o700)
+
+            results += run(containers, packages, args.iterations, args.writers)
+    finally:
+        shutil.rmtree(working_dir)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as fd:
+            json.dump({result.key: result.ops_per_sec for result in results}, fd, sort_keys=True, indent=4)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as fd:
+            regressions = compare(results, json.load(fd), args.tolerance)
+
+        for result, expected in regressions:
+            print("Regression in '{}': {:.1f} ops/sec, baseline {:.1f} ops/sec".format(result.key, result.ops_per_sec, expected),
+                  file=sys.stderr)
+
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# Copyright 2017 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import unittest.mock
+from unittest import TestCase
+from libertine.service import tasks, operations_monitor
+from libertine.ContainersConfig import ContainersConfig
+
+
+class TestCloneTask(TestCase):
+    def setUp(self):
+        self.config  = unittest.mock.create_autospec(ContainersConfig)
+        self.lock    = unittest.mock.MagicMock()
+        self.client  = unittest.mock.Mock()
+        self.monitor = unittest.mock.create_autospec(operations_monitor.OperationsMonitor)
+
+        self.monitor.new_operation.return_value = "/com/canonical/libertine/Service/Download/123456"
+        self.called_with = None
+
+    def callback(self, task):
+        self.called_with = task
+
+    def test_success_clones_container(self):
+        self.config.container_exists.return_value = False
+        self.config.get_container_install_status.return_value = 'ready'
+        task = tasks.CloneTask('vader', 'palpatine', 'Darth Vader',
+                               self.config, self.lock, self.monitor, self.client, self.callback)
+        task._instant_callback = True
+
+        with unittest.mock.patch('libertine.service.tasks.clone_task.LibertineContainer') as MockContainer:
+            MockContainer.return_value.clone_libertine_container.return_value = True
+            task.start().join()
+
+            MockContainer.return_value.clone_libertine_container.assert_called_once_with('palpatine')
+
+        self.monitor.finished.assert_called_once_with(self.monitor.new_operation.return_value)
+        self.config.clone_container.assert_called_once_with('palpatine', 'vader', 'Darth Vader')
+        self.config.update_container_install_status.assert_has_calls([
+            unittest.mock.call('vader', 'installing'),
+            unittest.mock.call('vader', 'ready')
+        ])
+        self.assertEqual(task, self.called_with)
+
+    def test_failed_clone_deletes_container(self):
+        self.config.container_exists.return_value = False
+        self.config.get_container_install_status.return_value = 'ready'
+        task = tasks.CloneTask('vader', 'palpatine', 'Darth Vader',
+                               self.config, self.lock, self.monitor, self.client, self.callback)
+        task._instant_callback = True
+
+        with unittest.mock.patch('libertine.service.tasks.clone_task.LibertineContainer') as MockContainer:
+            MockContainer.return_value.clone_libertine_container.return_value = False
+            task.start().join()
+
+        self.monitor.error.assert_called_once_with(self.monitor.new_operation.return_value, "Cloning container 'vader' failed")
+        self.config.delete_container.assert_called_once_with('vader')
+
+    def test_missing_source_sends_error(self):
+        self.config.container_exists.return_value = False
+        self.config.get_container_install_status.return_value = None
+        task = tasks.CloneTask('vader', 'palpatine', 'Darth Vader',
+                               self.config, self.lock, self.monitor, self.client, self.callback)
+        task._instant_callback = True
+
+        with unittest.mock.patch('libertine.service.tasks.clone_task.LibertineContainer') as MockContainer:
+            task.start().join()
+            MockContainer.assert_not_called()
+
+        self.monitor.error.assert_called_once_with(self.monitor.new_operation.return_value, "Container 'palpatine' does not exist")
+        self.config.clone_container.assert_not_called()
+
+    def test_existing_container_sends_error(self):
+        self.config.container_exists.return_value = True
+        task = tasks.CloneTask('vader', 'palpatine', 'Darth Vader',
+                               self.config, self.lock, self.monitor, self.client, self.callback)
+        task._instant_callback = True
+
+        task.start().join()
+
+        self.monitor.error.assert_called_once_with(self.monitor.new_operation.return_value, "Container 'vader' already exists")
+        self.config.clone_container.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -52,7 +52,7 @@ class TestInstallTask(TestCase):
 
         self.monitor.error.assert_called_once_with(self.monitor.new_operation.return_value, "Package installation failed for 'darkside-common'")
         self.config.update_package_install_status.assert_called_once_with('palpatine', 'darkside-common', 'installing')
-        self.config.delete_package.assert_called_once_with('palpatine', 'darkside-common')
+        self.config.delete_package.assert_not_called()
         self.assertEqual(task, self.called_with)
 
     def test_successfully_install(self):
@@ -66,8 +66,27 @@ class TestInstallTask(TestCase):
             task.start().join()
 
         self.monitor.finished.assert_called_once_with(self.monitor.new_operation.return_value)
-        self.config.update_package_install_status.assert_has_calls([
-            unittest.mock.call('palpatine', 'darkside-common', 'installing'),
-            unittest.mock.call('palpatine', 'darkside-common', 'installed')
-        ], any_order=True)
+        self.config.update_package_install_status.assert_called_once_with('palpatine', 'darkside-common', 'installing')
         self.assertEqual(task, self.called_with)
+
+    def test_reports_apt_progress(self):
+        self.config.package_exists.return_value = False
+        task = tasks.InstallTask('darkside-common', 'palpatine', self.config, self.lock, self.monitor, self.client, self.callback)
+        task._instant_callback = True
+
+        def install_package(package_name, refresh):
+            apt_progress = MockContainer.call_args[0][3]
+            apt_progress('pmstatus', 42.5, 'Unpacking darkside-common')
+            return True
+
+        with unittest.mock.patch('libertine.service.tasks.install_task.LibertineContainer') as MockContainer, \
+             unittest.mock.patch('libertine.service.tasks.base_task.GLib.idle_add') as idle_add:
+            MockContainer.return_value.install_package.side_effect = install_package
+            task.start().join()
+
+        idle_add.assert_called_once_with(task._report_apt_progress, 'pmstatus', 42.5, 'Unpacking darkside-common')
+        task._report_apt_progress(*idle_add.call_args[0][1:])
+
+        self.monitor.progress.assert_called_once_with(self.monitor.new_operation.return_value, 71, 100)
+        self.monitor.status.assert_called_once_with(self.monitor.new_operation.return_value, 'pmstatus:42:Unpacking darkside-common')
+        self.monitor.data.assert_not_called()
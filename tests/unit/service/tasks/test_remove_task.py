@@ -51,10 +51,7 @@ class TestRemoveTask(TestCase):
             task.start().join()
 
         self.monitor.error.assert_called_once_with(self.monitor.new_operation.return_value, "Package removal failed for 'darkside-common'")
-        self.config.update_package_install_status.assert_has_calls([
-            unittest.mock.call('palpatine', 'darkside-common', 'removing'),
-            unittest.mock.call('palpatine', 'darkside-common', 'installed')
-        ], any_order=True)
+        self.config.update_package_install_status.assert_called_once_with('palpatine', 'darkside-common', 'removing')
         self.assertEqual(task, self.called_with)
 
     def test_successfully_install(self):
@@ -69,5 +66,5 @@ class TestRemoveTask(TestCase):
 
         self.monitor.finished.assert_called_once_with(self.monitor.new_operation.return_value)
         self.config.update_package_install_status.assert_called_once_with('palpatine', 'darkside-common', 'removing')
-        self.config.delete_package.assert_called_once_with('palpatine', 'darkside-common')
+        self.config.delete_package.assert_not_called()
         self.assertEqual(task, self.called_with)
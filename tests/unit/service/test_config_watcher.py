@@ -0,0 +1,70 @@
+# Copyright 2017 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import shutil
+import tempfile
+import unittest.mock
+from unittest import TestCase
+from libertine.service import config_watcher
+
+
+class TestConfigWatcher(TestCase):
+    def setUp(self):
+        self._working_dir = tempfile.mkdtemp()
+        self._environ = unittest.mock.patch.dict('os.environ', {'XDG_DATA_HOME': self._working_dir})
+        self._environ.start()
+        self._glib_patcher = unittest.mock.patch('libertine.service.config_watcher.GLib')
+        self._glib = self._glib_patcher.start()
+        self._config = unittest.mock.Mock()
+        self._on_changed = unittest.mock.Mock()
+        self._watcher = config_watcher.ConfigWatcher(self._config, self._on_changed)
+
+    def tearDown(self):
+        self._watcher.stop()
+        self._glib_patcher.stop()
+        self._environ.stop()
+        shutil.rmtree(self._working_dir)
+
+    def _file(self, name):
+        f = unittest.mock.Mock()
+        f.get_basename.return_value = name
+        return f
+
+    def test_puts_config_in_watched_mode(self):
+        self._config.watch.assert_called_once_with()
+
+    def test_ignores_other_files(self):
+        self._watcher._file_changed(None, self._file('ContainersConfig.json.lock'), None, None)
+        self._config.invalidate.assert_not_called()
+        self._glib.timeout_add.assert_not_called()
+
+    def test_coalesces_changes_into_one_reload(self):
+        self._watcher._file_changed(None, self._file('tmpabc123'), self._file('ContainersConfig.json'), None)
+        self._watcher._file_changed(None, self._file('ContainersConfig.json'), None, None)
+
+        self.assertEqual(2, self._config.invalidate.call_count)
+        self._glib.timeout_add.assert_called_once_with(config_watcher.RELOAD_DELAY_MS, self._watcher._reload)
+
+    def test_reload_emits_change_only_when_reloaded(self):
+        self._config.refresh_database.return_value = False
+        self._watcher._reload()
+        self._on_changed.assert_not_called()
+
+        self._config.refresh_database.return_value = True
+        self._watcher._reload()
+        self._on_changed.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    unittest.main()
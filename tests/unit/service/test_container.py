@@ -63,7 +63,7 @@ class TestContainer(TestCase):
             c = container.Container('palpatine', self._config, self._monitor, self._client, lambda task: task)
             with unittest.mock.patch('libertine.service.container.InstallTask') as MockInstallTask:
                 c.install('force')
-                MockInstallTask.assert_called_once_with('force', 'palpatine', self._config, unittest.mock.ANY, self._monitor, self._client, unittest.mock.ANY)
+                MockInstallTask.assert_called_once_with('force', 'palpatine', self._config, unittest.mock.ANY, self._monitor, self._client, unittest.mock.ANY, refresh=False)
                 MockInstallTask.return_value.start.assert_called_once_with()
 
     def test_install_only_calls_once_when_unfinished(self):
@@ -73,7 +73,7 @@ class TestContainer(TestCase):
                 c.install('darkside')
                 c.install('darkside')
                 c.install('darkside')
-                MockInstallTask.assert_called_once_with('darkside', 'palpatine', self._config, unittest.mock.ANY, self._monitor, self._client, unittest.mock.ANY)
+                MockInstallTask.assert_called_once_with('darkside', 'palpatine', self._config, unittest.mock.ANY, self._monitor, self._client, unittest.mock.ANY, refresh=False)
                 MockInstallTask.return_value.start.assert_called_once_with()
 
     def test_remove_creates_remove_task(self):
@@ -114,6 +114,15 @@ class TestContainer(TestCase):
                                                        self._config, unittest.mock.ANY, self._monitor, self._client, unittest.mock.ANY)
                 MockCreateTask.return_value.start.assert_called_once_with()
 
+    def test_clone_creates_clone_task(self):
+        with unittest.mock.patch('libertine.service.container.apt.AptCache') as MockCache:
+            c = container.Container('vader', self._config, self._monitor, self._client, lambda task: task)
+            with unittest.mock.patch('libertine.service.container.CloneTask') as MockCloneTask:
+                c.clone('palpatine', 'Darth Vader')
+                MockCloneTask.assert_called_once_with('vader', 'palpatine', 'Darth Vader',
+                                                      self._config, unittest.mock.ANY, self._monitor, self._client, unittest.mock.ANY)
+                MockCloneTask.return_value.start.assert_called_once_with()
+
     def test_destroy_creates_destroy_task(self):
         with unittest.mock.patch('libertine.service.container.apt.AptCache') as MockCache:
             c = container.Container('palpatine', self._config, self._monitor, self._client, lambda task: task)
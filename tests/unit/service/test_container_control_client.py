@@ -0,0 +1,93 @@
+# Copyright 2017 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest.mock
+from unittest import TestCase
+from libertine.service import container_control_client
+
+
+class TestContainerControlClient(TestCase):
+    def setUp(self):
+        self._config = unittest.mock.Mock()
+        self._config.get_containers.return_value = []
+        self._config.get_idle_timeout.return_value = 0
+        self._config_patcher = unittest.mock.patch('libertine.ContainersConfig.ContainersConfig', return_value=self._config)
+        self._config_patcher.start()
+        self._glib_patcher = unittest.mock.patch('libertine.service.container_control_client.GLib')
+        self._glib = self._glib_patcher.start()
+        self._glib.timeout_add_seconds.return_value = 42
+        self._client = container_control_client.ContainerControlClient()
+
+    def tearDown(self):
+        self._glib_patcher.stop()
+        self._config_patcher.stop()
+
+    def test_last_user_stops_container_without_idle_timeout(self):
+        self.assertTrue(self._client.container_operation_start('palpatine'))
+        self.assertTrue(self._client.container_operation_finished('palpatine', '', 0))
+        self.assertFalse(self._client.container_operation_start('palpatine'))
+
+        self._glib.timeout_add_seconds.assert_not_called()
+
+    def test_idle_timeout_keeps_container_for_next_user(self):
+        self._config.get_idle_timeout.return_value = 30
+
+        self._client.container_operation_start('palpatine')
+        self.assertFalse(self._client.container_operation_finished('palpatine', '', 0))
+        self._glib.timeout_add_seconds.assert_called_once_with(30, self._client._idle_timeout_expired, 'palpatine')
+
+        self.assertTrue(self._client.container_operation_start('palpatine'))
+        self._glib.source_remove.assert_called_once_with(42)
+
+    def test_idle_container_is_shut_down_when_timeout_expires(self):
+        self._config.get_idle_timeout.return_value = 30
+        self._client.container_operation_start('palpatine')
+        self._client.container_operation_finished('palpatine', '', 0)
+
+        with unittest.mock.patch('threading.Thread') as MockThread:
+            self._client._idle_timeout_expired('palpatine')
+            MockThread.assert_called_once_with(target=self._client._shutdown_container, args=('palpatine',))
+
+        self.assertFalse(self._client.container_operation_start('palpatine'))
+
+        with unittest.mock.patch('libertine.Libertine.LibertineContainer') as MockContainer:
+            self._client._shutdown_container('palpatine')
+            MockContainer.return_value.container.shutdown_container.assert_called_once_with()
+
+        self.assertTrue(self._client.container_operation_start('palpatine'))
+
+    def test_expired_timeout_ignores_container_in_use(self):
+        self._config.get_idle_timeout.return_value = 30
+        self._client.container_operation_start('palpatine')
+        self._client.container_operation_finished('palpatine', '', 0)
+        self._client.container_operation_start('palpatine')
+
+        with unittest.mock.patch('threading.Thread') as MockThread:
+            self._client._idle_timeout_expired('palpatine')
+            MockThread.assert_not_called()
+
+    def test_shutdown_idle_containers_stops_them_at_once(self):
+        self._config.get_idle_timeout.return_value = 30
+        self._client.container_operation_start('palpatine')
+        self._client.container_operation_finished('palpatine', '', 0)
+
+        with unittest.mock.patch('libertine.Libertine.LibertineContainer') as MockContainer:
+            self._client.shutdown_idle_containers()
+            MockContainer.return_value.container.shutdown_container.assert_called_once_with()
+
+        self._glib.source_remove.assert_called_once_with(42)
+
+
+if __name__ == '__main__':
+    unittest.main()
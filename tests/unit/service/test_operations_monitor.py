@@ -140,6 +140,19 @@ class TestOperationsMonitor(TestCase):
                 monitor.data("some/junk", "some of that gud data")
                 MockDownload.return_value.data.assert_not_called()
 
+    def test_status_replaces_previous_status(self):
+        with unittest.mock.patch('dbus.service.Object'):
+            monitor = operations_monitor.OperationsMonitor(self._connection)
+            monitor._connection = self._connection
+
+            with unittest.mock.patch('libertine.service.operations_monitor.download.Download.__init__', return_value=None):
+                path = monitor.new_operation()
+                monitor.status(path, "dlstatus:50:Retrieving file 1 of 2")
+                monitor.status(path, "pmstatus:10:Unpacking vim")
+
+                self.assertEqual("pmstatus:10:Unpacking vim", monitor.last_status(path))
+                self.assertEqual("", monitor.last_status("123456"))
+
 
 
 if __name__ == '__main__':
@@ -47,7 +47,13 @@ class TestTaskDispatcher(TestCase):
             c = MockContainer.return_value
             c.install.return_value = 123
             self.assertEqual(123, self._dispatcher.install('palpatine', 'darkside'))
-            c.install.assert_called_once_with('darkside')
+            c.install.assert_called_once_with('darkside', False)
+
+    def test_install_passes_refresh_to_container(self):
+        with unittest.mock.patch('libertine.service.task_dispatcher.Container') as MockContainer:
+            c = MockContainer.return_value
+            self._dispatcher.install('palpatine', 'darkside', refresh=True)
+            c.install.assert_called_once_with('darkside', True)
 
     def test_remove_calls_remove_on_container(self):
         with unittest.mock.patch('libertine.service.task_dispatcher.Container') as MockContainer:
@@ -63,6 +69,14 @@ class TestTaskDispatcher(TestCase):
             self.assertEqual(123, self._dispatcher.create('palpatine', 'Emperor Palpatine', 'zesty', 'lxd', False))
             c.create.assert_called_once_with('Emperor Palpatine', 'zesty', 'lxd', False)
 
+    def test_clone_calls_clone_on_new_container(self):
+        with unittest.mock.patch('libertine.service.task_dispatcher.Container') as MockContainer:
+            c = MockContainer.return_value
+            c.clone.return_value = 123
+            self.assertEqual(123, self._dispatcher.clone('palpatine', 'vader', 'Darth Vader'))
+            MockContainer.assert_called_once_with('vader', unittest.mock.ANY, unittest.mock.ANY, unittest.mock.ANY, unittest.mock.ANY)
+            c.clone.assert_called_once_with('palpatine', 'Darth Vader')
+
     def test_destroy_calls_destroy_on_container(self):
         with unittest.mock.patch('libertine.service.task_dispatcher.Container') as MockContainer:
             c = MockContainer.return_value
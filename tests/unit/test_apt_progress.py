@@ -0,0 +1,142 @@
+"""Unit tests for reporting apt progress."""
+# Copyright 2017 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from libertine import Libertine
+from libertine.AptProgress import AptStatusPipe, overall_percent, parse_status_line
+from testtools import TestCase
+from testtools.matchers import Equals
+import os
+import shlex
+import shutil
+import stat
+import subprocess
+import tempfile
+from unittest.mock import MagicMock, patch
+
+
+class TestAptProgress(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._working_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._working_dir)
+        self._pipe_path = os.path.join(self._working_dir, 'status')
+        self._reports = []
+
+    def _report(self, status, percent, message):
+        self._reports.append((status, percent, message))
+
+    def _write(self, lines):
+        with open(self._pipe_path, 'w') as fd:
+            fd.write(''.join(line + '\n' for line in lines))
+
+    def test_parses_status_lines(self):
+        self.assertThat(parse_status_line('dlstatus:1:12.5:Retrieving file 1 of 8\n'),
+                        Equals(('dlstatus', 12.5, 'Retrieving file 1 of 8')))
+        self.assertThat(parse_status_line('pmstatus:vim:42.8571:Unpacking vim (amd64)'),
+                        Equals(('pmstatus', 42.8571, 'Unpacking vim (amd64)')))
+        self.assertThat(parse_status_line('pmerror:/tmp/vim.deb:12:it broke: badly'),
+                        Equals(('pmerror', 12.0, 'it broke: badly')))
+
+    def test_ignores_other_lines(self):
+        self.assertThat(parse_status_line('pmconffile:/etc/vimrc:50:\'/etc/vimrc\''), Equals(None))
+        self.assertThat(parse_status_line('Reading package lists...'), Equals(None))
+        self.assertThat(parse_status_line('pmstatus:vim:lots:Unpacking'), Equals(None))
+
+    def test_stages_share_overall_progress(self):
+        self.assertThat(overall_percent('dlstatus', 0), Equals(0))
+        self.assertThat(overall_percent('dlstatus', 100), Equals(50))
+        self.assertThat(overall_percent('pmstatus', 0), Equals(50))
+        self.assertThat(overall_percent('pmstatus', 50), Equals(75))
+        self.assertThat(overall_percent('pmerror', 100), Equals(100))
+
+    def test_pipe_is_private(self):
+        with AptStatusPipe(self._pipe_path, self._pipe_path, self._report):
+            self.assertThat(stat.S_IMODE(os.stat(self._pipe_path).st_mode), Equals(0o600))
+
+    def test_reports_status_written_to_pipe(self):
+        with AptStatusPipe(self._pipe_path, self._pipe_path, self._report, interval=0):
+            self._write(['dlstatus:1:50:Retrieving file 1 of 2', 'Fetched 2 kB', 'pmstatus:vim:20:Unpacking vim'])
+
+        self.assertThat(self._reports, Equals([('dlstatus', 50.0, 'Retrieving file 1 of 2'),
+                                               ('pmstatus', 20.0, 'Unpacking vim')]))
+        self.assertFalse(os.path.exists(self._pipe_path))
+
+    def test_rate_limits_reports_of_a_stage(self):
+        with AptStatusPipe(self._pipe_path, self._pipe_path, self._report, interval=60):
+            self._write(['dlstatus:1:10:Retrieving file 1 of 4',
+                         'dlstatus:2:20:Retrieving file 2 of 4',
+                         'dlstatus:3:30:Retrieving file 3 of 4',
+                         'pmstatus:vim:10:Unpacking vim',
+                         'pmerror:vim:10:Unpacking failed',
+                         'pmstatus:vim:60:Setting up vim'])
+
+        self.assertThat(self._reports, Equals([('dlstatus', 10.0, 'Retrieving file 1 of 4'),
+                                               ('dlstatus', 30.0, 'Retrieving file 3 of 4'),
+                                               ('pmstatus', 10.0, 'Unpacking vim'),
+                                               ('pmerror', 10.0, 'Unpacking failed'),
+                                               ('pmstatus', 60.0, 'Setting up vim')]))
+
+    def test_unused_pipe_closes(self):
+        with AptStatusPipe(self._pipe_path, self._pipe_path, self._report):
+            pass
+
+        self.assertThat(self._reports, Equals([]))
+
+
+class StatusContainer(Libertine.BaseContainer):
+    """
+    A container running its commands on the host, with /tmp in its root path.
+    """
+    def __init__(self, config):
+        super().__init__('status', 'status', config, None)
+        self.commands = []
+        os.makedirs(os.path.join(self.root_path, 'tmp'))
+
+    def _run_in_container(self, command_string):
+        self.commands.append(command_string)
+        args = [arg.replace('/tmp/', os.path.join(self.root_path, 'tmp') + '/') for arg in shlex.split(command_string)]
+        args[-1] = args[-1].replace('/usr/bin/apt-get', 'echo pmstatus:vim:50:Unpacking vim >&3; true')
+        return subprocess.call(args)
+
+
+class TestContainerAptProgress(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._working_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._working_dir)
+        environ = patch.dict('os.environ', {'XDG_CACHE_HOME': self._working_dir})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+        self._config = MagicMock()
+        self._config.get_container_locale.return_value = None
+        self._config.get_shared_package_cache.return_value = False
+        self._container = StatusContainer(self._config)
+
+    def test_apt_runs_plainly_without_progress_handler(self):
+        with patch.object(StatusContainer, '_run_in_container', return_value=0) as run:
+            self._container.remove_package('vim')
+
+        self.assertFalse(any('Status-Fd=3' in call[0][0] for call in run.call_args_list))
+
+    def test_apt_reports_progress_to_handler(self):
+        self._container.apt_progress = MagicMock()
+
+        self.assertTrue(self._container.remove_package('vim'))
+
+        self._container.apt_progress.assert_any_call('pmstatus', 50.0, 'Unpacking vim')
+        self.assertThat(os.listdir(os.path.join(self._container.root_path, 'tmp')), Equals([]))
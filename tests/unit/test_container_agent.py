@@ -0,0 +1,139 @@
+"""Unit tests for the in-container command agent."""
+# Copyright 2017 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from libertine import ContainerAgent, Libertine
+from testtools import TestCase
+from testtools.matchers import Equals
+import os
+import shlex
+import shutil
+import socket
+import stat
+import subprocess
+import sys
+import tempfile
+from unittest.mock import MagicMock, patch
+
+
+class LocalContainer(Libertine.BaseContainer):
+    """
+    A container whose agent runs on the host, with the container's /tmp in
+    its root path.
+    """
+    def __init__(self, config):
+        super().__init__('local', 'local', config, None)
+        self.spawned = []
+        os.makedirs(os.path.join(self.root_path, 'tmp'))
+
+    def _run_in_container(self, command_string):
+        self.spawned.append(command_string)
+        return subprocess.call(shlex.split(command_string))
+
+    def _start_agent_process(self, command_string):
+        args = [arg.replace('/tmp/', os.path.join(self.root_path, 'tmp') + '/') for arg in shlex.split(command_string)]
+        args[0] = sys.executable
+        return subprocess.Popen(args, stdin=subprocess.PIPE)
+
+
+class TestContainerAgent(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Unix socket paths are limited to about 100 characters
+        self._working_dir = tempfile.mkdtemp(dir='/tmp')
+        self.addCleanup(shutil.rmtree, self._working_dir)
+        environ = patch.dict('os.environ', {'XDG_CACHE_HOME': self._working_dir, 'LIBERTINE_CONTAINER_AGENT': '1'})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+        self._config = MagicMock()
+        self._config.get_container_locale.return_value = None
+        self._container = LocalContainer(self._config)
+        self.addCleanup(self._container.stop_agent)
+
+    def test_agent_runs_commands(self):
+        self.assertThat(self._container.run_in_container('true'), Equals(0))
+        self.assertThat(self._container.run_in_container("sh -c 'exit 3'"), Equals(3))
+        self.assertThat(self._container.spawned, Equals([]))
+
+    def test_agent_passes_environment(self):
+        with patch.dict('os.environ', {'DEBIAN_FRONTEND': 'teletype'}):
+            self.assertThat(self._container.run_in_container('sh -c \'test "$DEBIAN_FRONTEND" = teletype\''), Equals(0))
+
+    def test_agent_reports_missing_command(self):
+        self.assertThat(self._container.run_in_container('/nonexistent/command'), Equals(127))
+
+    def test_agent_is_restarted_after_stopping(self):
+        self._container.run_in_container('true')
+        self._container.stop_agent()
+
+        self.assertThat(self._container.run_in_container('true'), Equals(0))
+        self.assertThat(self._container.spawned, Equals([]))
+
+    def test_agent_cleans_up_after_itself(self):
+        self._container.run_in_container('true')
+        self._container.stop_agent()
+
+        self.assertThat(os.listdir(os.path.join(self._container.root_path, 'tmp')), Equals([]))
+
+    def test_agent_writes_all_output(self):
+        written = []
+
+        def write(fd, data):
+            written.append(bytes(data[:3]))
+            return len(written[-1])
+
+        with patch('libertine.ContainerAgent.os.write', side_effect=write):
+            self.assertThat(self._container.run_in_container("echo 'force lightning'"), Equals(0))
+
+        self.assertThat(b''.join(written), Equals(b'force lightning\n'))
+
+    def test_agent_files_are_private(self):
+        self._container.run_in_container('true')
+
+        tmp_dir = os.path.join(self._container.root_path, 'tmp')
+        agent_dir = os.path.join(tmp_dir, os.listdir(tmp_dir)[0])
+        self.assertThat(stat.S_IMODE(os.stat(agent_dir).st_mode), Equals(0o700))
+        self.assertThat(stat.S_IMODE(os.stat(os.path.join(agent_dir, 'agent.sock')).st_mode), Equals(0o600))
+
+    def test_interactive_commands_bypass_agent(self):
+        with patch('libertine.Libertine.sys.stdin') as stdin:
+            stdin.isatty.return_value = True
+            self._container.run_in_container('true')
+
+        self.assertThat(self._container.spawned, Equals(['true']))
+
+    def test_unexpected_acknowledgement_makes_agent_unavailable(self):
+        host, agent = socket.socketpair()
+        self.addCleanup(host.close)
+        self.addCleanup(agent.close)
+        ContainerAgent.send_frame(agent, b'x', b'\0\0\0\0')
+
+        container_agent = ContainerAgent.ContainerAgent(None, MagicMock())
+        container_agent._socket = host
+        self.assertRaises(ContainerAgent.AgentUnavailable, container_agent.run, 'true', {})
+
+    def test_falls_back_without_agent(self):
+        with patch.object(LocalContainer, '_start_agent_process', return_value=None):
+            self.assertThat(self._container.run_in_container('true'), Equals(0))
+            self.assertThat(self._container.run_in_container('true'), Equals(0))
+
+        self.assertThat(self._container.spawned, Equals(['true', 'true']))
+
+    def test_agent_is_optional(self):
+        with patch.dict('os.environ', {'LIBERTINE_CONTAINER_AGENT': '0'}):
+            self._container.run_in_container('true')
+
+        self.assertThat(self._container.spawned, Equals(['true']))
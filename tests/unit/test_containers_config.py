@@ -0,0 +1,488 @@
+"""Unit tests for the ContainersConfig database."""
+# Copyright 2017 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import shutil
+import tempfile
+
+from libertine import utils
+from libertine.ContainersConfig import ContainersConfig, ContainersConfigConflict, write_container_config_file
+from testtools import TestCase
+from testtools.matchers import Equals, Is, Not
+from unittest.mock import patch
+
+
+class TestContainersConfig(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._working_dir = tempfile.mkdtemp()
+        environ = patch.dict('os.environ', {'XDG_DATA_HOME': self._working_dir,
+                                            'XDG_RUNTIME_DIR': self._working_dir})
+        environ.start()
+        self.addCleanup(environ.stop)
+        self.addCleanup(shutil.rmtree, self._working_dir)
+
+    def _read_json(self):
+        with open(utils.get_libertine_database_file_path(), 'r') as fd:
+            return json.load(fd)
+
+    def test_package_lookups_use_index(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+        config.add_new_package('palpatine', 'darkside')
+        config.add_new_package('palpatine', 'lightsaber')
+
+        self.assertThat(config.package_exists('palpatine', 'darkside'), Equals(True))
+        self.assertThat(config.package_exists('palpatine', 'jedi'), Equals(False))
+        self.assertThat(config.get_package_install_status('palpatine', 'lightsaber'), Equals('new'))
+
+        config.update_package_install_status('palpatine', 'lightsaber', 'installed')
+        self.assertThat(config.get_package_install_status('palpatine', 'lightsaber'), Equals('installed'))
+
+        config.delete_package('palpatine', 'darkside')
+        self.assertThat(config.package_exists('palpatine', 'darkside'), Equals(False))
+        self.assertThat(config.package_exists('palpatine', 'lightsaber'), Equals(True))
+
+    def test_index_matches_json_on_disk(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+        config.add_container_archive('palpatine', 'ppa:sith/empire')
+        config.update_archive_install_status('palpatine', 'ppa:sith/empire', 'installed')
+
+        container = self._read_json()['containerList'][0]
+        self.assertThat(container['extraArchives'], Equals([{'archiveName': 'ppa:sith/empire',
+                                                             'archiveStatus': 'installed'}]))
+
+        reloaded = ContainersConfig()
+        self.assertThat(reloaded.archive_exists('palpatine', 'ppa:sith/empire'), Equals(True))
+        self.assertThat(reloaded.get_archive_install_status('palpatine', 'ppa:sith/empire'), Equals('installed'))
+
+    def test_running_apps_by_name_and_pid(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+        config.add_running_app('palpatine', 'force-choke', 1234)
+
+        app = config.find_running_app_by_name_and_pid('palpatine', 'force-choke', 1234)
+        self.assertThat(app, Equals({'appExecName': 'force-choke', 'pid': 1234}))
+        self.assertThat(config.find_running_app_by_name_and_pid('palpatine', 'force-choke', 4321), Is(None))
+
+        config.delete_running_app('palpatine', app)
+        self.assertThat(config.find_running_app_by_name_and_pid('palpatine', 'force-choke', 1234), Is(None))
+
+    def test_running_apps_without_pid_are_kept_apart(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+        config.add_running_app('palpatine', 'force-choke')
+        config.add_running_app('palpatine', '/usr/bin/force-lightning')
+
+        self.assertThat(config.get_running_apps('palpatine'),
+                        Equals([{'appExecName': '/usr/bin/force-lightning', 'pid': 0},
+                                {'appExecName': 'force-choke', 'pid': 0}]))
+
+        config.delete_running_app('palpatine', {'appExecName': 'force-choke', 'pid': 0})
+        self.assertThat(config.find_running_app_by_name_and_pid('palpatine', 'force-choke', 0), Is(None))
+        self.assertThat(config.find_running_app_by_name_and_pid('palpatine', '/usr/bin/force-lightning', 0),
+                        Equals({'appExecName': '/usr/bin/force-lightning', 'pid': 0}))
+
+    def test_running_apps_are_not_written_to_database(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+        generation = config.generation
+
+        config.add_running_app('palpatine', 'force-choke', 1234)
+
+        self.assertThat(config.generation, Equals(generation))
+        self.assertThat('runningApps' in self._read_json()['containerList'][0], Equals(False))
+        self.assertThat(ContainersConfig().get_running_apps('palpatine'),
+                        Equals([{'appExecName': 'force-choke', 'pid': 1234}]))
+
+    def test_running_apps_from_database_are_still_reported(self):
+        with open(utils.get_libertine_database_file_path(), 'w') as fd:
+            json.dump({'defaultContainer': 'palpatine',
+                       'containerList': [{'id': 'palpatine', 'installStatus': 'ready',
+                                          'runningApps': [{'appExecName': 'force-choke', 'pid': 1234}]}]}, fd)
+
+        config = ContainersConfig()
+        config.add_running_app('palpatine', 'force-lightning', 4321)
+        self.assertThat(config.get_running_apps('palpatine'),
+                        Equals([{'appExecName': 'force-lightning', 'pid': 4321},
+                                {'appExecName': 'force-choke', 'pid': 1234}]))
+
+        config.delete_running_app('palpatine', {'appExecName': 'force-choke', 'pid': 1234})
+        self.assertThat(self._read_json()['containerList'][0]['runningApps'], Equals([]))
+
+    def test_delete_container_updates_index(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+        config.add_new_container('vader', 'Vader', 'mock', 'xenial')
+
+        config.delete_container('palpatine')
+
+        self.assertThat(config.container_exists('palpatine'), Equals(False))
+        self.assertThat(config.container_exists('vader'), Equals(True))
+        self.assertThat(config.get_default_container_id(), Equals('vader'))
+
+    def test_clone_container_copies_configuration(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+        config.add_new_package('palpatine', 'darkside')
+        config.add_new_bind_mount('palpatine', '/deathstar')
+        config.add_running_app('palpatine', 'force-choke', 1234)
+
+        config.clone_container('palpatine', 'vader', 'Vader')
+        config.add_new_package('vader', 'lightsaber')
+
+        self.assertThat(config.get_container_name('vader'), Equals('Vader'))
+        self.assertThat(config.get_container_type('vader'), Equals('mock'))
+        self.assertThat(config.get_container_bind_mounts('vader'), Equals(['/deathstar']))
+        self.assertThat(config.package_exists('vader', 'darkside'), Equals(True))
+        self.assertThat(config.package_exists('palpatine', 'lightsaber'), Equals(False))
+        self.assertThat(config.get_running_apps('vader'), Equals([]))
+        self.assertThat(config.get_default_container_id(), Equals('palpatine'))
+
+    def test_launches_wait_for_network_unless_disabled(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'lxd', 'xenial')
+
+        self.assertThat(config.get_wait_for_network('palpatine'), Equals(True))
+
+        config.update_wait_for_network('palpatine', False)
+
+        self.assertThat(config.get_wait_for_network('palpatine'), Equals(False))
+
+    def test_transaction_writes_once(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+
+        with patch('libertine.ContainersConfig.write_container_config_file', return_value=(None, None)) as mock_write:
+            with config.transaction():
+                config.add_new_package('palpatine', 'darkside')
+                config.update_package_install_status('palpatine', 'darkside', 'installing')
+                config.update_container_install_status('palpatine', 'installing packages')
+                self.assertThat(mock_write.call_count, Equals(0))
+
+            self.assertThat(mock_write.call_count, Equals(1))
+
+    def test_transaction_rolls_back_on_exception(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+
+        def failed_transaction():
+            with config.transaction():
+                config.add_new_package('palpatine', 'darkside')
+                raise RuntimeError('order 66')
+
+        self.assertRaises(RuntimeError, failed_transaction)
+
+        self.assertThat(config.package_exists('palpatine', 'darkside'), Equals(False))
+        self.assertThat(self._read_json()['containerList'][0]['installedApps'], Equals([]))
+
+    def test_write_replaces_file_without_leftovers(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+        inode = os.stat(utils.get_libertine_database_file_path()).st_ino
+
+        config.update_container_install_status('palpatine', 'ready')
+
+        self.assertThat(os.stat(utils.get_libertine_database_file_path()).st_ino, Not(Equals(inode)))
+        self.assertThat(sorted(os.listdir(utils.get_libertine_database_dir_path())),
+                        Equals(['ContainersConfig.json', 'ContainersConfig.json.lock']))
+        self.assertThat(self._read_json()['containerList'][0]['installStatus'], Equals('ready'))
+
+    def test_refresh_skips_reload_when_unchanged(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+
+        with patch('libertine.ContainersConfig._read_database') as mock_read:
+            config.refresh_database()
+            config.refresh_database()
+
+        self.assertThat(mock_read.call_count, Equals(0))
+        self.assertThat(config.skipped_reloads, Equals(2))
+
+    def test_refresh_reloads_changes_from_other_writers(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+
+        other = ContainersConfig()
+        other.update_container_install_status('palpatine', 'ready')
+
+        config.refresh_database()
+        self.assertThat(config.get_container_install_status('palpatine'), Equals('ready'))
+        self.assertThat(config.generation, Equals(other.generation))
+
+    def test_stale_writer_reapplies_its_change(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+
+        other = ContainersConfig()
+        other.add_new_package('palpatine', 'darkside')
+        config.update_container_install_status('palpatine', 'ready')
+
+        reloaded = ContainersConfig()
+        self.assertThat(reloaded.package_exists('palpatine', 'darkside'), Equals(True))
+        self.assertThat(reloaded.get_container_install_status('palpatine'), Equals('ready'))
+        self.assertThat(config.write_conflicts, Equals(1))
+        self.assertThat(other.write_conflicts, Equals(0))
+
+    def test_stale_transaction_reapplies_all_changes(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+
+        with config.transaction():
+            config.add_new_package('palpatine', 'darkside')
+            config.update_package_install_status('palpatine', 'darkside', 'installed')
+            ContainersConfig().add_new_container('vader', 'Vader', 'mock', 'xenial')
+
+        reloaded = ContainersConfig()
+        self.assertThat(reloaded.get_containers(), Equals(['palpatine', 'vader']))
+        self.assertThat(reloaded.get_package_install_status('palpatine', 'darkside'), Equals('installed'))
+        self.assertThat(config.generation, Equals(reloaded.generation))
+
+    def test_stale_writer_reapplies_unwritten_changes(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+        config.add_new_container('vader', 'Vader', 'mock', 'xenial')
+
+        other = ContainersConfig()
+        other.add_new_container('maul', 'Maul', 'mock', 'xenial')
+        config.set_default_container_id('vader')
+        config.add_new_container('maul', 'Maul', 'mock', 'xenial')
+        config.update_container_install_status('vader', 'ready')
+
+        reloaded = ContainersConfig()
+        self.assertThat(reloaded.get_default_container_id(), Equals('vader'))
+        self.assertThat(reloaded.get_containers(), Equals(['palpatine', 'vader', 'maul']))
+        self.assertThat(config.write_conflicts, Equals(1))
+
+    def test_stale_writer_adds_bind_mount_once(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+
+        other = ContainersConfig()
+        other.add_new_bind_mount('palpatine', '/home/palpatine/Sith')
+        config.add_new_bind_mount('palpatine', '/home/palpatine/Sith')
+
+        reloaded = ContainersConfig()
+        self.assertThat(reloaded.get_container_bind_mounts('palpatine'), Equals(['/home/palpatine/Sith']))
+        self.assertThat(config.write_conflicts, Equals(1))
+
+    def test_stale_writer_deletes_removed_container(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+        config.add_new_container('vader', 'Vader', 'mock', 'xenial')
+
+        ContainersConfig().delete_container('vader')
+        config.delete_container('vader')
+
+        reloaded = ContainersConfig()
+        self.assertThat(reloaded.get_containers(), Equals(['palpatine']))
+        self.assertThat(config.write_conflicts, Equals(1))
+
+    def test_write_rejects_unexpected_generation(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+
+        self.assertRaises(ContainersConfigConflict, write_container_config_file,
+                          {'containerList': []}, expected_generation=config.generation - 1)
+        self.assertThat(ContainersConfig().get_containers(), Equals(['palpatine']))
+
+    def _write_merge_source(self, document):
+        path = os.path.join(self._working_dir, 'merge.json')
+        with open(path, 'w') as fd:
+            json.dump(document, fd, indent=4)
+
+        return path
+
+    def _create_merge_target(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+        config.add_new_package('palpatine', 'darkside')
+        config.add_new_bind_mount('palpatine', '/death/star')
+        config.add_new_container('vader', 'Vader', 'mock', 'xenial')
+
+        return config
+
+    def _merge_source(self):
+        return self._write_merge_source({'defaultContainer': 'yoda',
+                                         'containerList': [{'id': 'palpatine', 'name': 'Sidious', 'installStatus': 'ready',
+                                                            'installedApps': [{'packageName': 'lightsaber', 'appStatus': 'installed'}],
+                                                            'bindMounts': ['/death/star', '/exegol']},
+                                                           {'id': 'yoda', 'name': 'Yoda', 'installStatus': 'ready'}]})
+
+    def test_merge_prefers_source_entries(self):
+        config = self._create_merge_target()
+        config.merge_container_config_files(self._merge_source())
+
+        reloaded = ContainersConfig()
+        self.assertThat(reloaded.get_containers(), Equals(['palpatine', 'vader', 'yoda']))
+        self.assertThat(reloaded.get_container_name('palpatine'), Equals('Sidious'))
+        self.assertThat(reloaded.package_exists('palpatine', 'darkside'), Equals(False))
+        self.assertThat(reloaded.get_default_container_id(), Equals('palpatine'))
+
+    def test_merge_prefers_local_entries(self):
+        config = self._create_merge_target()
+        config.merge_container_config_files(self._merge_source(), 'local')
+
+        reloaded = ContainersConfig()
+        self.assertThat(reloaded.get_containers(), Equals(['palpatine', 'vader', 'yoda']))
+        self.assertThat(reloaded.get_container_name('palpatine'), Equals('Palpatine'))
+        self.assertThat(reloaded.package_exists('palpatine', 'lightsaber'), Equals(False))
+
+    def test_merge_combines_packages_and_bind_mounts(self):
+        config = self._create_merge_target()
+        config.merge_container_config_files(self._merge_source(), 'merge')
+
+        reloaded = ContainersConfig()
+        self.assertThat(reloaded.get_container_name('palpatine'), Equals('Sidious'))
+        self.assertThat(reloaded.package_exists('palpatine', 'darkside'), Equals(True))
+        self.assertThat(reloaded.get_package_install_status('palpatine', 'lightsaber'), Equals('installed'))
+        self.assertThat(reloaded.get_container_bind_mounts('palpatine'), Equals(['/death/star', '/exegol']))
+
+    def test_merge_into_empty_database_adopts_source(self):
+        config = ContainersConfig()
+        config.merge_container_config_files(self._merge_source())
+
+        self.assertThat(config.get_containers(), Equals(['palpatine', 'yoda']))
+        self.assertThat(config.get_default_container_id(), Equals('yoda'))
+        self.assertThat(ContainersConfig().get_default_container_id(), Equals('yoda'))
+
+    def test_merge_streams_large_sources(self):
+        containers = [{'id': 'clone-{}'.format(i), 'installStatus': 'ready', 'pid': 10 ** 12 + i,
+                       'installedApps': [{'packageName': 'blaster', 'appStatus': 'installed'}]} for i in range(2000)]
+        path = self._write_merge_source({'containerList': containers})
+
+        config = ContainersConfig()
+        with patch('libertine.ContainersConfig._MERGE_CHUNK_SIZE', 7):
+            config.merge_container_config_files(path)
+
+        self.assertThat(config.container_list['containerList'], Equals(containers))
+
+    def test_watched_refresh_only_reloads_after_invalidate(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+        config.watch()
+        config.refresh_database()
+
+        other = ContainersConfig()
+        other.update_container_install_status('palpatine', 'ready')
+
+        with patch('libertine.ContainersConfig.container_config_stamp') as mock_stamp:
+            self.assertThat(config.refresh_database(), Equals(False))
+            self.assertThat(mock_stamp.call_count, Equals(0))
+        self.assertThat(config.get_container_install_status('palpatine'), Equals('new'))
+
+        config.invalidate()
+        self.assertThat(config.refresh_database(), Equals(True))
+        self.assertThat(config.get_container_install_status('palpatine'), Equals('ready'))
+        self.assertThat(config.refresh_database(), Equals(False))
+
+
+class TestContainersConfigSqlite(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._working_dir = tempfile.mkdtemp()
+        environ = patch.dict('os.environ', {'XDG_DATA_HOME': self._working_dir, 'LIBERTINE_DATABASE': 'sqlite'})
+        environ.start()
+        self.addCleanup(environ.stop)
+        self.addCleanup(shutil.rmtree, self._working_dir)
+
+    def _read_json(self):
+        with open(utils.get_libertine_database_file_path(), 'r') as fd:
+            return json.load(fd)
+
+    def test_imports_existing_json(self):
+        with patch.dict('os.environ', {'LIBERTINE_DATABASE': 'json'}):
+            config = ContainersConfig()
+            config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+            config.add_new_package('palpatine', 'darkside')
+            config.add_new_bind_mount('palpatine', '/death/star')
+            config.update_freeze_on_stop('palpatine', True)
+
+        config = ContainersConfig()
+        self.assertThat(os.path.exists(utils.get_libertine_sqlite_database_file_path()), Equals(True))
+        self.assertThat(config.get_default_container_id(), Equals('palpatine'))
+        self.assertThat(config.package_exists('palpatine', 'darkside'), Equals(True))
+        self.assertThat(config.get_container_bind_mounts('palpatine'), Equals(['/death/star']))
+        self.assertThat(config.get_freeze_on_stop('palpatine'), Is(True))
+
+    def test_json_mirror_matches_database(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+        config.add_new_bind_mount('palpatine', '/death/star')
+        config.update_container_install_status('palpatine', 'ready')
+
+        mirror = self._read_json()
+        self.assertThat(mirror['containerList'], Equals(ContainersConfig().container_list['containerList']))
+        self.assertThat(mirror['containerList'][0]['installStatus'], Equals('ready'))
+        self.assertThat(mirror['containerList'][0]['bindMounts'], Equals(['/death/star']))
+        self.assertThat(mirror['_generation'], Equals(config.generation))
+
+    def test_writers_only_replace_changed_containers(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+        config.add_new_container('vader', 'Vader', 'mock', 'xenial')
+
+        other = ContainersConfig()
+        other.update_container_install_status('vader', 'ready')
+        config.update_container_install_status('palpatine', 'ready')
+
+        reloaded = ContainersConfig()
+        self.assertThat(reloaded.get_container_install_status('palpatine'), Equals('ready'))
+        self.assertThat(reloaded.get_container_install_status('vader'), Equals('ready'))
+
+        # Changes to different containers do not conflict
+        self.assertThat(config.write_conflicts, Equals(0))
+        self.assertThat(self._read_json()['_generation'], Equals(config.generation))
+        self.assertThat(config.refresh_database(), Equals(True))
+        self.assertThat(config.get_container_install_status('vader'), Equals('ready'))
+
+    def test_writers_of_the_same_container_conflict(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+
+        other = ContainersConfig()
+        other.add_new_package('palpatine', 'darkside')
+        config.update_container_install_status('palpatine', 'ready')
+
+        reloaded = ContainersConfig()
+        self.assertThat(reloaded.package_exists('palpatine', 'darkside'), Equals(True))
+        self.assertThat(reloaded.get_container_install_status('palpatine'), Equals('ready'))
+        self.assertThat(config.write_conflicts, Equals(1))
+
+    def test_writer_keeps_default_set_by_other_writer(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+        config.add_new_container('vader', 'Vader', 'mock', 'xenial')
+
+        ContainersConfig().set_default_container_id('vader', True)
+        config.update_container_install_status('palpatine', 'ready')
+
+        self.assertThat(ContainersConfig().get_default_container_id(), Equals('vader'))
+        self.assertThat(config.write_conflicts, Equals(0))
+
+    def test_writer_keeps_container_deleted_by_other_writer_deleted(self):
+        config = ContainersConfig()
+        config.add_new_container('palpatine', 'Palpatine', 'mock', 'xenial')
+        config.add_new_container('vader', 'Vader', 'mock', 'xenial')
+
+        ContainersConfig().delete_container('vader')
+        config.update_container_install_status('palpatine', 'ready')
+
+        self.assertThat(ContainersConfig().get_containers(), Equals(['palpatine']))
+        self.assertThat(config.write_conflicts, Equals(0))
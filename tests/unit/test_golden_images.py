@@ -0,0 +1,149 @@
+"""Unit tests for the golden image cache."""
+# Copyright 2017 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from libertine import Libertine, utils
+from libertine.ChrootContainer import LibertineChroot
+from libertine.GoldenImages import GoldenImage, delete_image, get_images
+from testtools import TestCase
+from testtools.matchers import Equals
+import os
+import shutil
+import tempfile
+from unittest.mock import MagicMock, patch
+
+
+class ImageNamed(object):
+    """
+    Matches a GoldenImage by name in mock call assertions.
+    """
+    def __init__(self, name):
+        self._name = name
+
+    def __eq__(self, other):
+        return isinstance(other, GoldenImage) and other.name == self._name
+
+    def __repr__(self):
+        return '<GoldenImage {}>'.format(self._name)
+
+
+class TestGoldenImages(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._working_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._working_dir)
+        environ = patch.dict('os.environ', {'XDG_CACHE_HOME': self._working_dir, 'XDG_DATA_HOME': self._working_dir})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+        host_info = patch('libertine.Libertine.HostInfo')
+        host_info.start().return_value.get_host_architecture.return_value = 'amd64'
+        self.addCleanup(host_info.stop)
+
+        self._config = MagicMock()
+        self._config.get_container_locale.return_value = 'en_US.UTF-8'
+        self._config.get_container_distro.return_value = 'xenial'
+
+    def test_images_are_keyed_by_type_distro_architecture_and_locale(self):
+        GoldenImage('chroot', 'xenial', 'amd64', 'en_US.UTF-8').save()
+        GoldenImage('lxd', 'xenial', 'amd64', 'en_US.UTF-8').save()
+        GoldenImage('chroot', 'zesty', 'amd64', 'de_DE.UTF-8').save()
+
+        self.assertThat([image.name for image in get_images()],
+                        Equals(['chroot-xenial-amd64-en_US.UTF-8', 'chroot-zesty-amd64-de_DE.UTF-8',
+                                'lxd-xenial-amd64-en_US.UTF-8']))
+        self.assertThat([image.name for image in get_images(container_type='chroot', distro='zesty')],
+                        Equals(['chroot-zesty-amd64-de_DE.UTF-8']))
+
+    def test_deleted_image_is_gone(self):
+        image = GoldenImage('chroot', 'xenial', 'amd64', 'en_US.UTF-8')
+        image.save()
+
+        delete_image(image)
+
+        self.assertFalse(image.exists())
+        self.assertThat(get_images(), Equals([]))
+
+    def _chroot(self, container_id):
+        with patch.dict('os.environ'):
+            return LibertineChroot(container_id, self._config, None)
+
+    def test_chroot_is_copied_from_image(self):
+        source = self._chroot('source')
+        os.makedirs(os.path.join(source.root_path, 'usr', 'lib'))
+        with open(os.path.join(source.root_path, 'usr', 'lib', 'libfoo.so.1'), 'w') as fd:
+            fd.write('foo')
+        os.symlink(os.path.join(source.root_path, 'usr', 'lib', 'libfoo.so.1'),
+                   os.path.join(source.root_path, 'usr', 'lib', 'libfoo.so'))
+
+        image = GoldenImage('chroot', 'xenial', 'amd64', 'en_US.UTF-8')
+        self.assertTrue(source.capture_image(image))
+        self.assertTrue(image.exists())
+
+        copy = self._chroot('copy')
+        self.assertTrue(copy.create_from_image(image))
+
+        library = os.path.join(copy.root_path, 'usr', 'lib', 'libfoo.so')
+        self.assertThat(os.readlink(library), Equals(os.path.join(copy.root_path, 'usr', 'lib', 'libfoo.so.1')))
+        with open(library, 'r') as fd:
+            self.assertThat(fd.read(), Equals('foo'))
+        self.assertTrue(os.path.isdir(utils.get_libertine_container_home_dir('copy')))
+
+    def _container(self):
+        self._config.get_container_type.return_value = 'mock'
+        container = Libertine.LibertineContainer('mock', self._config, MagicMock())
+
+        container.container.create_libertine_container = MagicMock(return_value=True)
+        container.container.create_from_image = MagicMock(return_value=True)
+        container.container.capture_image = MagicMock(return_value=True)
+        return container
+
+    def test_first_container_is_kept_as_image(self):
+        container = self._container()
+
+        self.assertTrue(container.create_libertine_container('password'))
+
+        container.container.create_from_image.assert_not_called()
+        container.container.capture_image.assert_called_once_with(ImageNamed('mock-xenial-amd64-en_US.UTF-8'))
+
+    def test_container_is_created_from_existing_image(self):
+        GoldenImage('mock', 'xenial', 'amd64', 'en_US.UTF-8').save()
+        container = self._container()
+
+        self.assertTrue(container.create_libertine_container('password', multiarch=True))
+
+        container.container.create_from_image.assert_called_once_with(
+            ImageNamed('mock-xenial-amd64-en_US.UTF-8'), 'password', True)
+        container.container.create_libertine_container.assert_not_called()
+
+    def test_failed_image_falls_back_to_creating_from_scratch(self):
+        GoldenImage('mock', 'xenial', 'amd64', 'en_US.UTF-8').save()
+        container = self._container()
+        container.container.create_from_image.return_value = False
+
+        self.assertTrue(container.create_libertine_container('password'))
+
+        container.container.create_libertine_container.assert_called_once_with('password', False)
+        container.container.capture_image.assert_not_called()
+
+    def test_images_can_be_bypassed(self):
+        GoldenImage('mock', 'xenial', 'amd64', 'en_US.UTF-8').save()
+        container = self._container()
+
+        self.assertTrue(container.create_libertine_container('password', use_image=False))
+
+        container.container.create_from_image.assert_not_called()
+        container.container.capture_image.assert_not_called()
+
@@ -0,0 +1,43 @@
+"""Startup cost of the containerless libertine-launch path."""
+# Copyright 2017 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from testtools import TestCase
+from testtools.matchers import Equals
+import subprocess
+import sys
+
+
+# What libertine-launch imports before it knows whether it runs in a container
+_LAUNCH_IMPORTS = 'from libertine import NoContainer, launcher, utils'
+
+# Modules only the paths which actually deal with containers may load
+_DEFERRED_MODULES = ['apt', 'crypt', 'dbus', 'distro_info', 'libertine.ChrootContainer',
+                     'libertine.ContainerControlClient', 'libertine.ContainersConfig',
+                     'libertine.LxcContainer', 'libertine.LxdContainer', 'lsb_release', 'lxc',
+                     'pylxd', 'sqlite3']
+
+
+class TestLaunchStartup(TestCase):
+
+    def _python(self, *args):
+        return subprocess.run([sys.executable] + list(args), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True, check=True)
+
+    def test_no_container_launch_defers_container_modules(self):
+        result = self._python('-c', '{}; import sys; print("\\n".join(sys.modules))'.format(_LAUNCH_IMPORTS))
+
+        loaded = set(result.stdout.split())
+        self.assertThat(sorted(loaded.intersection(_DEFERRED_MODULES)), Equals([]))
+
@@ -13,13 +13,13 @@
 # You should have received a copy of the GNU General Public License along
 # with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from libertine import Libertine
+from libertine import Libertine, LxcContainer
 from testtools import TestCase
 from testtools.matchers import Equals
 import os
 import shutil
 import tempfile
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 
 class TestLibertineContainer(TestCase):
@@ -66,3 +66,209 @@ class TestLibertineContainer(TestCase):
                                           container_id,
                                           "rootfs")
         self.assertThat(container.root_path, Equals(expected_root_path))
+
+    def _mock_container(self, results):
+        self._config.get_container_type.return_value = 'mock'
+        container = Libertine.LibertineContainer('palpatine', self._config, MagicMock())
+        container.container.install_packages = MagicMock(return_value=results)
+        return container
+
+    def test_installed_packages_are_tracked_in_one_transaction(self):
+        container = self._mock_container({'darkside': True, 'jedi': False})
+
+        container.install_packages(['darkside', 'jedi'])
+
+        self.assertThat(self._config.transaction.call_count, Equals(2))
+        self._config.update_package_install_status.assert_called_with('palpatine', 'darkside', 'installed')
+        self._config.delete_package.assert_called_once_with('palpatine', 'jedi')
+        self._config.update_container_install_status.assert_any_call('palpatine', 'installing packages')
+
+    def test_failed_removal_keeps_package_installed(self):
+        container = self._mock_container({})
+        container.container.remove_package = MagicMock(return_value=False)
+
+        # libertined marks the package as removing before the removal starts
+        for status in ['installed', 'removing']:
+            self._config.reset_mock()
+            self._config.get_package_install_status.return_value = status
+
+            self.assertFalse(container.remove_package('darkside'))
+
+            self._config.update_package_install_status.assert_called_with('palpatine', 'darkside', 'installed')
+            self._config.delete_package.assert_not_called()
+
+    def test_failed_removal_drops_package_not_installed(self):
+        container = self._mock_container({})
+        container.container.remove_package = MagicMock(return_value=False)
+        self._config.get_package_install_status.return_value = 'installing'
+
+        self.assertFalse(container.remove_package('darkside'))
+
+        self._config.delete_package.assert_called_once_with('palpatine', 'darkside')
+
+
+class RecordingContainer(Libertine.BaseContainer):
+    def __init__(self, config, failing_packages=()):
+        super().__init__('recorder', 'recording', config, None)
+        self.commands = []
+        self._failing_packages = failing_packages
+
+    def _run_in_container(self, command_string):
+        self.commands.append(command_string)
+        if ' install ' in command_string and any("'{}'".format(p) in command_string for p in self._failing_packages):
+            return 100
+        return 0
+
+    def apt_installs(self):
+        return [c.split(' install ', 1)[1] for c in self.commands if ' install ' in c and 'check-language-support' not in c]
+
+
+class TestBaseContainer(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._working_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._working_dir)
+        environ = patch.dict('os.environ', {'XDG_CACHE_HOME': self._working_dir})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+        self._config = MagicMock()
+        self._config.get_container_locale.return_value = 'de_DE.UTF-8'
+        self._config.get_container_language_support.return_value = None
+        self._config.get_shared_package_cache.return_value = False
+
+    def _write_rootfs_file(self, container, path, content):
+        path = os.path.join(container.root_path, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as fd:
+            fd.write(content)
+
+    def _create_language_selector_data(self, container, installed):
+        self._write_rootfs_file(container, 'usr/share/language-selector/data/pkg_depends',
+                                '# category:language:trigger:langpack\n'
+                                'tr::firefox:firefox-locale-\n'
+                                'tr::libreoffice-common:libreoffice-l10n-\n')
+        self._write_rootfs_file(container, 'var/lib/dpkg/status',
+                                ''.join('Package: {}\nStatus: install ok installed\n\n'.format(p) for p in installed))
+
+    def _language_checks(self, container):
+        return [c for c in container.commands if 'check-language-support' in c]
+
+    def test_language_support_is_checked_once_per_state(self):
+        container = RecordingContainer(self._config)
+        self._create_language_selector_data(container, ['bash', 'firefox'])
+
+        container.install_packages(['darkside'], update_cache=False)
+        self.assertThat(len(self._language_checks(container)), Equals(1))
+        state = self._config.update_container_language_support.call_args[0][1]
+
+        self._config.get_container_language_support.return_value = state
+        container.install_packages(['lightsaber'], update_cache=False)
+        self.assertThat(len(self._language_checks(container)), Equals(1))
+
+    def test_language_support_is_rechecked_for_relevant_packages(self):
+        container = RecordingContainer(self._config)
+        self._create_language_selector_data(container, ['bash', 'firefox'])
+
+        container.install_packages(['darkside'], update_cache=False)
+        self._config.get_container_language_support.return_value = self._config.update_container_language_support.call_args[0][1]
+
+        self._create_language_selector_data(container, ['bash', 'firefox', 'libreoffice-common'])
+        container.install_packages(['libreoffice'], update_cache=False)
+        self.assertThat(len(self._language_checks(container)), Equals(2))
+
+    def test_language_support_without_language_selector_data(self):
+        container = RecordingContainer(self._config)
+
+        container.install_packages(['darkside'], update_cache=False)
+        container.install_packages(['lightsaber'], update_cache=False)
+
+        self.assertThat(len(self._language_checks(container)), Equals(4))
+        self.assertThat(self._config.update_container_language_support.call_count, Equals(0))
+
+    def test_install_packages_uses_single_transaction(self):
+        container = RecordingContainer(self._config)
+
+        results = container.install_packages(['darkside', 'lightsaber'], update_cache=False)
+
+        self.assertThat(results, Equals({'darkside': True, 'lightsaber': True}))
+        self.assertThat(container.apt_installs(), Equals(["'darkside' 'lightsaber'"]))
+
+    def test_install_packages_reports_failures_per_package(self):
+        container = RecordingContainer(self._config, failing_packages=['jedi'])
+
+        results = container.install_packages(['darkside', 'jedi', 'lightsaber'], update_cache=False)
+
+        self.assertThat(results, Equals({'darkside': True, 'jedi': False, 'lightsaber': True}))
+        self.assertThat(container.apt_installs(), Equals(["'darkside' 'jedi' 'lightsaber'", "'darkside'", "'jedi'", "'lightsaber'"]))
+
+    def test_install_packages_updates_cache_once(self):
+        container = RecordingContainer(self._config)
+
+        container.install_packages(['darkside', 'lightsaber'])
+
+        self.assertThat(len([c for c in container.commands if c.endswith('update')]), Equals(1))
+
+
+class TestAptCacheFreshness(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._working_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._working_dir)
+        environ = patch.dict('os.environ', {'XDG_CACHE_HOME': self._working_dir})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+        self._values = {}
+        self._config = MagicMock()
+        self._config.get_container_locale.return_value = None
+        self._config.get_shared_package_cache.return_value = False
+        self._config.get_container_apt_cache_updated.side_effect = lambda c: self._values.get('updated')
+        self._config.get_container_apt_sources.side_effect = lambda c: self._values.get('sources')
+        self._config.update_container_apt_cache_updated.side_effect = lambda c, v: self._values.update(updated=v)
+        self._config.update_container_apt_sources.side_effect = lambda c, v: self._values.update(sources=v)
+
+        self._container = RecordingContainer(self._config)
+        self._sources_list = os.path.join(self._container.root_path, 'etc', 'apt', 'sources.list')
+        os.makedirs(os.path.dirname(self._sources_list))
+        with open(self._sources_list, 'w') as fd:
+            fd.write('deb http://archive.ubuntu.com/ubuntu xenial main\n')
+
+    def _updates(self):
+        return len([c for c in self._container.commands if c.endswith('update')])
+
+    def test_recent_update_is_skipped(self):
+        self._container.update_apt_cache()
+        self._container.update_apt_cache()
+
+        self.assertThat(self._updates(), Equals(1))
+
+    def test_force_updates_anyway(self):
+        self._container.update_apt_cache()
+        self._container.update_apt_cache(force=True)
+
+        self.assertThat(self._updates(), Equals(2))
+
+    def test_changed_sources_invalidate_update(self):
+        self._container.update_apt_cache()
+        with open(self._sources_list, 'a') as fd:
+            fd.write('deb http://ppa.launchpad.net/sith/empire/ubuntu xenial main\n')
+        self._container.update_apt_cache()
+
+        self.assertThat(self._updates(), Equals(2))
+
+    def test_expired_update_is_repeated(self):
+        with patch.dict('os.environ', {'LIBERTINE_APT_CACHE_TTL': '0'}):
+            self._container.update_apt_cache()
+            self._container.update_apt_cache()
+
+        self.assertThat(self._updates(), Equals(2))
+
+
+class TestAttachedProcess(TestCase):
+
+    def test_wait_status_becomes_exit_code(self):
+        self.assertThat(LxcContainer._exit_code(os.system('exit 3')), Equals(3))
+        self.assertThat(LxcContainer._exit_code(os.system('kill -9 $$')), Equals(-9))
@@ -0,0 +1,123 @@
+"""Unit tests for the shared package cache."""
+# Copyright 2017 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from libertine import Libertine
+from libertine.PackageCache import PackageCache, get_package_caches, prune_package_caches
+from testtools import TestCase
+from testtools.matchers import Equals
+import os
+import shutil
+import tempfile
+from unittest.mock import MagicMock, patch
+
+
+class TestPackageCache(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._working_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._working_dir)
+        environ = patch.dict('os.environ', {'XDG_CACHE_HOME': self._working_dir})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+    def _add_package(self, cache, name, size, used):
+        path = os.path.join(cache.path, name)
+        with open(path, 'wb') as fd:
+            fd.write(b'\0' * size)
+        os.utime(path, (used, used))
+        return path
+
+    def test_caches_are_keyed_by_distro_and_architecture(self):
+        PackageCache('xenial', 'amd64').prepare()
+        PackageCache('xenial', 'i386').prepare()
+        PackageCache('zesty', 'amd64').prepare()
+
+        self.assertThat([(c.distro, c.architecture) for c in get_package_caches()],
+                        Equals([('xenial', 'amd64'), ('xenial', 'i386'), ('zesty', 'amd64')]))
+
+    def test_prune_removes_least_recently_used_packages(self):
+        xenial = PackageCache('xenial', 'amd64')
+        zesty = PackageCache('zesty', 'amd64')
+        xenial.prepare()
+        zesty.prepare()
+        oldest = self._add_package(xenial, 'vim_1_amd64.deb', 100, 1000)
+        older = self._add_package(zesty, 'vim_2_amd64.deb', 100, 2000)
+        newest = self._add_package(xenial, 'emacs_1_amd64.deb', 100, 3000)
+
+        self.assertThat(prune_package_caches(150), Equals((2, 200)))
+        self.assertThat([os.path.exists(p) for p in [oldest, older, newest]], Equals([False, False, True]))
+
+    def test_prune_keeps_caches_within_size(self):
+        cache = PackageCache('xenial', 'amd64')
+        cache.prepare()
+        package = self._add_package(cache, 'vim_1_amd64.deb', 100, 1000)
+
+        self.assertThat(prune_package_caches(100), Equals((0, 0)))
+        self.assertTrue(os.path.exists(package))
+
+    def test_prune_ignores_partial_downloads_and_lock(self):
+        cache = PackageCache('xenial', 'amd64')
+        with cache.lock():
+            partial = os.path.join(cache.path, 'partial', 'vim_1_amd64.deb')
+            open(partial, 'w').close()
+
+        self.assertThat(prune_package_caches(0), Equals((0, 0)))
+        self.assertTrue(os.path.exists(partial))
+
+
+class AptContainer(Libertine.BaseContainer):
+    def __init__(self, config):
+        super().__init__('apt', 'recording', config, None)
+        self.installed_release = 'xenial'
+        self.architecture = 'amd64'
+        self.used_caches = []
+
+    def _run_in_container(self, command_string):
+        return 0
+
+    def _use_package_cache(self, cache):
+        self.used_caches.append(cache and cache.path)
+
+
+class TestSharedPackageCache(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._working_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._working_dir)
+        environ = patch.dict('os.environ', {'XDG_CACHE_HOME': self._working_dir})
+        environ.start()
+        self.addCleanup(environ.stop)
+
+        self._config = MagicMock()
+        self._config.get_container_locale.return_value = None
+
+    def test_container_uses_its_own_archives_by_default(self):
+        self._config.get_shared_package_cache.return_value = False
+        container = AptContainer(self._config)
+
+        container.remove_package('vim')
+
+        self.assertThat(container.used_caches, Equals([None, None]))
+
+    def test_apt_runs_against_shared_cache_when_enabled(self):
+        self._config.get_shared_package_cache.return_value = True
+        container = AptContainer(self._config)
+
+        container.remove_package('vim')
+
+        self.assertThat(container.used_caches, Equals([PackageCache('xenial', 'amd64').path] * 2))
+        self.assertTrue(os.path.isdir(os.path.join(PackageCache('xenial', 'amd64').path, 'partial')))
@@ -0,0 +1,56 @@
+"""Unit tests for the libertine utilities."""
+# Copyright 2017 Canonical Ltd.
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License version 3, as published
+# by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranties of
+# MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+# PURPOSE.  See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from libertine import utils
+from testtools import TestCase
+from testtools.matchers import Equals
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+
+class TestXdgUserDirectories(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self._working_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self._working_dir)
+
+        for target, value in [('libertine.utils.basedir.xdg_config_home', self._working_dir),
+                              ('libertine.utils._xdg_user_directories', None)]:
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        popen = patch('libertine.utils.subprocess.Popen')
+        self._popen = popen.start()
+        self._popen.return_value.communicate.return_value = (b'/home/vader/Sith\n', None)
+        self.addCleanup(popen.stop)
+
+    def test_directories_are_resolved_once(self):
+        self.assertThat(utils.get_common_xdg_user_directories(), Equals(['/home/vader/Sith'] * 5))
+        self.assertThat(utils.get_common_xdg_user_directories(), Equals(['/home/vader/Sith'] * 5))
+
+        self.assertThat(self._popen.call_count, Equals(5))
+
+    def test_changed_user_dirs_are_resolved_again(self):
+        utils.get_common_xdg_user_directories()
+
+        with open(os.path.join(self._working_dir, 'user-dirs.dirs'), 'w') as fd:
+            fd.write('XDG_DOCUMENTS_DIR="$HOME/Sith"\n')
+        utils.get_common_xdg_user_directories()
+
+        self.assertThat(self._popen.call_count, Equals(10))